@@ -1,13 +1,38 @@
-from abc import ABC, abstractmethod
-from typing import Any, Optional, Iterable, List, Mapping
+from __future__ import annotations
 
-from aiokea.filters import Filter
+from abc import ABC, abstractmethod
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Optional,
+    Iterable,
+    List,
+    Mapping,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from aiokea.aggregates import Metric, aggregate_entities
+from aiokea.errors import (
+    AtomicNotSupportedError,
+    DuplicateResourceError,
+    ValidationError,
+)
+
+if TYPE_CHECKING:
+    from aiokea.filters import FilterExpression
 
 
 class Entity(ABC):
     pass
 
 
+# Read-only named tuple of a row's columns, returned by `where(compact=True)`
+CompactRow = Tuple[Any, ...]
+
+
 class IService(ABC):
     """
     Abstract Base Class for implementations of the Service Pattern
@@ -44,19 +69,99 @@ class IService(ABC):
         pass
 
     @abstractmethod
-    async def where(self, filters: Optional[Iterable[Filter]] = None) -> List[Entity]:
+    async def where(
+        self,
+        filters: Optional[Iterable[FilterExpression]] = None,
+        order_by: Optional[Sequence[str]] = None,
+        compact: bool = False,
+        lazy: bool = False,
+    ) -> Sequence[Union[Entity, CompactRow]]:
+        """
+        List the entities matching every filter
+
+        `order_by` lists the fields to sort by, most significant first; a field
+        prefixed with `-` sorts in descending order, e.g. `["-created_at", "id"]`.
+        Without it, the order is unspecified.
+
+        With `compact`, implementations may return read-only rows that take far
+        less memory than entities, for listings and exports that only read them.
+        Compact rows are named tuples exposing each column as an attribute named
+        after the column: the repo adapter's mapping to entity fields does not
+        apply to them. Compact rows must not be passed back to `create` or
+        `update`.
+
+        With `lazy`, implementations may defer building each entity until it is
+        first accessed, for callers that only count or look at a few of them.
+        """
         pass
 
     @abstractmethod
     async def first(
-        self, filters: Optional[Iterable[Filter]] = None
+        self,
+        filters: Optional[Iterable[FilterExpression]] = None,
+        order_by: Optional[Sequence[str]] = None,
     ) -> Optional[Entity]:
+        """
+        Get the first entity matching every filter, in `order_by` order
+
+        `order_by` works as it does for `where`. Without it, any matching
+        entity may be returned.
+        """
         pass
 
+    async def aggregate(
+        self,
+        filters: Optional[Iterable[FilterExpression]] = None,
+        group_by: Sequence[str] = (),
+        metrics: Sequence[Metric] = (),
+    ) -> List[Dict[str, Any]]:
+        """
+        Summarize the entities matching every filter, SQL GROUP BY style
+
+        Returns one dict per distinct combination of `group_by` field values,
+        holding those values and each metric under its name, e.g.
+        `{"is_enabled": True, "count": 3}`. Without `group_by` there is a single
+        group covering every matching entity.
+
+        The default implementation aggregates the result of `where` in memory;
+        implementations backed by a database should override it to do the work
+        there and only return the summary.
+        """
+        entities = await self.where(filters, lazy=True)
+        return aggregate_entities(entities, group_by, metrics)
+
     @abstractmethod
     async def create(self, entity: Entity) -> Entity:
         pass
 
+    async def create_many(
+        self, entities: Iterable[Entity], atomic: bool = False
+    ) -> List[Union[Entity, DuplicateResourceError]]:
+        """
+        Create several entities in one call
+
+        Returns one result per entity, in order: the created Entity,
+        or the DuplicateResourceError that prevented its creation.
+        With `atomic`, either every entity is created or none are,
+        and the first DuplicateResourceError is raised instead.
+
+        The default implementation calls `create` once per entity and cannot
+        honor `atomic`, raising AtomicNotSupportedError instead; implementations
+        backed by a transactional store should override it to write the whole
+        batch in a single transaction.
+        """
+        if atomic:
+            raise AtomicNotSupportedError(
+                f"{type(self).__name__} does not support atomic create_many"
+            )
+        results: List[Union[Entity, DuplicateResourceError]] = []
+        for entity in entities:
+            try:
+                results.append(await self.create(entity))
+            except DuplicateResourceError as e:
+                results.append(e)
+        return results
+
     @abstractmethod
     async def update(self, entity: Entity) -> Entity:
         pass
@@ -107,12 +212,20 @@ class IRepo(IService):
         pass
 
     @abstractmethod
-    async def where(self, filters: Optional[Iterable[Filter]] = None) -> List[Entity]:
+    async def where(
+        self,
+        filters: Optional[Iterable[FilterExpression]] = None,
+        order_by: Optional[Sequence[str]] = None,
+        compact: bool = False,
+        lazy: bool = False,
+    ) -> Sequence[Union[Entity, CompactRow]]:
         pass
 
     @abstractmethod
     async def first(
-        self, filters: Optional[Iterable[Filter]] = None
+        self,
+        filters: Optional[Iterable[FilterExpression]] = None,
+        order_by: Optional[Sequence[str]] = None,
     ) -> Optional[Entity]:
         pass
 
@@ -157,6 +270,24 @@ class IHTTPAdapter(ABC):
         """
         pass
 
+    def to_entities(
+        self, items: Sequence[Mapping]
+    ) -> List[Union[Entity, ValidationError]]:
+        """
+        Validate many items at once, as `to_entity` would each
+
+        Invalid items do not stop the others; their ValidationError takes
+        their place in the result. The default calls `to_entity` per item;
+        override it when validating in bulk is cheaper.
+        """
+        entities: List[Union[Entity, ValidationError]] = []
+        for data in items:
+            try:
+                entities.append(self.to_entity(data))
+            except ValidationError as e:
+                entities.append(e)
+        return entities
+
     @abstractmethod
     def from_entity(self, entity: Entity) -> Mapping:
         """
@@ -166,3 +297,12 @@ class IHTTPAdapter(ABC):
         :raises ValidationError
         """
         pass
+
+    def from_values(self, values: Mapping[str, Any]) -> Mapping:
+        """
+        Serialize some field values of an entity, as `from_entity` would
+
+        Used for partial results such as aggregates. The default returns
+        the values unchanged; override it when fields need converting.
+        """
+        return dict(values)
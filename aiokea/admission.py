@@ -0,0 +1,154 @@
+import asyncio
+import collections
+import contextlib
+import time
+from typing import AsyncIterator, Deque, Optional
+
+from aiokea.errors import AdmissionRejectedError
+
+
+class AdmissionController:
+    """
+    Bounds the number of operations in flight and waiting to start
+
+    Up to `max_in_flight` operations run at once, and up to `max_queued` more
+    wait their turn in arrival order for at most `queue_timeout` seconds.
+    Anything beyond that is rejected immediately with AdmissionRejectedError,
+    so excess load is shed in microseconds instead of piling up in front of
+    a connection pool. For a repo-backed service, the pool's maxsize is a good
+    starting point for `max_in_flight`.
+
+    Not thread-safe; each controller belongs to a single event loop.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        max_queued: int = 0,
+        queue_timeout: Optional[float] = None,
+        retry_after: int = 1,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._in_flight = 0
+        self._waiters: Deque[asyncio.Future] = collections.deque()
+
+    @property
+    def limit(self) -> int:
+        """Current in-flight limit"""
+        return self.max_in_flight
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @contextlib.asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """
+        Hold an in-flight slot for the duration of the block
+
+        :raises AdmissionRejectedError: if no slot is available in time
+        """
+        await self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    async def acquire(self) -> None:
+        if self._in_flight < self.limit and not self._waiters:
+            self._in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queued:
+            raise AdmissionRejectedError(self.retry_after)
+
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait({waiter}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Slot was handed over just as we were cancelled; give it back
+                self.release()
+            raise
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        if waiter.cancelled():
+            raise AdmissionRejectedError(self.retry_after)
+
+    def release(self, latency: Optional[float] = None) -> None:
+        """Give back an in-flight slot, handing it to the longest waiter"""
+        self._in_flight -= 1
+        self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        while self._waiters and self._in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._in_flight += 1
+                waiter.set_result(None)
+
+
+class AdaptiveAdmissionController(AdmissionController):
+    """
+    AdmissionController whose in-flight limit follows observed latency (AIMD)
+
+    Each operation finishing within `latency_target` seconds while the limit is
+    saturated grows the limit by one, up to `max_in_flight`.
+    An operation slower than `latency_target` shrinks the limit by
+    `backoff_ratio`, down to `min_in_flight`, at most once per `latency_target`
+    so a single burst of slow completions does not collapse the limit.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        latency_target: float,
+        min_in_flight: int = 1,
+        backoff_ratio: float = 0.9,
+        max_queued: int = 0,
+        queue_timeout: Optional[float] = None,
+        retry_after: int = 1,
+    ):
+        super().__init__(
+            max_in_flight=max_in_flight,
+            max_queued=max_queued,
+            queue_timeout=queue_timeout,
+            retry_after=retry_after,
+        )
+        self.latency_target = latency_target
+        self.min_in_flight = min_in_flight
+        self.backoff_ratio = backoff_ratio
+        self._limit = float(max_in_flight)
+        self._last_backoff = 0.0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def release(self, latency: Optional[float] = None) -> None:
+        if latency is not None:
+            self._adjust_limit(latency)
+        super().release(latency)
+
+    def _adjust_limit(self, latency: float) -> None:
+        if latency > self.latency_target:
+            now = time.monotonic()
+            if now - self._last_backoff >= self.latency_target:
+                self._last_backoff = now
+                self._limit = max(
+                    float(self.min_in_flight), self._limit * self.backoff_ratio
+                )
+        elif self._in_flight >= self.limit:
+            # Only probe upwards when the current limit is actually the bottleneck
+            self._limit = min(float(self.max_in_flight), self._limit + 1)
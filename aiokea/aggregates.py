@@ -0,0 +1,115 @@
+import re
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+COUNT = "count"  # number of rows, or of non-null values of a field
+MIN = "min"  # smallest non-null value of a field
+MAX = "max"  # largest non-null value of a field
+
+
+class AggregateFunctions:
+    COUNT = COUNT  # number of rows, or of non-null values of a field
+    MIN = MIN  # smallest non-null value of a field
+    MAX = MAX  # largest non-null value of a field
+
+    values = {COUNT, MIN, MAX}
+
+
+# `count`, or a function applied to a field: `max(created_at)`
+_METRIC_REGEX = re.compile(r"^\s*(\w+)\s*(?:\(\s*(\w+)\s*\))?\s*$")
+
+
+class Metric:
+    """
+    An aggregate function computed over each group of an `aggregate` call
+
+    `Metric(COUNT)` counts rows; every other function needs a field.
+    Results carry the metric under its `name`: `count`, `max_created_at`, ...
+    """
+
+    def __init__(self, function: str, field: Optional[str] = None):
+        if function not in AggregateFunctions.values:
+            raise ValueError(
+                f"Invalid aggregate function {function}. "
+                f"Must be one of {AggregateFunctions.values}"
+            )
+        if field is None and function != COUNT:
+            raise ValueError(f"Aggregate function {function} needs a field")
+        self.function = function
+        self.field = field
+
+    @property
+    def name(self) -> str:
+        if self.field is None:
+            return self.function
+        return f"{self.function}_{self.field}"
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Metric):
+            return NotImplemented
+        return (self.function, self.field) == (other.function, other.field)
+
+    def __hash__(self) -> int:
+        return hash((self.function, self.field))
+
+    def __repr__(self) -> str:
+        if self.field is None:
+            return f"Metric({self.function!r})"
+        return f"Metric({self.function!r}, {self.field!r})"
+
+
+def parse_metric(text: str) -> Metric:
+    """
+    Parse `count`, `count(field)`, `min(field)` or `max(field)` into a Metric
+
+    :raises ValueError: if `text` is not a valid metric
+    """
+    match = _METRIC_REGEX.match(text)
+    if match is None:
+        raise ValueError(f"Invalid metric {text!r}")
+    return Metric(match.group(1), match.group(2))
+
+
+def aggregate_entities(
+    entities: Iterable[Any], group_by: Sequence[str], metrics: Sequence[Metric]
+) -> List[Dict[str, Any]]:
+    """
+    Aggregate entities in memory, with the semantics of SQL's GROUP BY
+
+    One dict per group, holding the `group_by` fields and every metric by name.
+    Without `group_by` there is exactly one group, even when there are no
+    entities. Groups are ordered by their `group_by` values, nulls last.
+    """
+    if not group_by and not metrics:
+        raise ValueError("Nothing to aggregate: no group_by fields and no metrics")
+    groups: Dict[Tuple[Hashable, ...], Dict[str, Any]] = {}
+    if not group_by:
+        groups[()] = _empty_group({}, metrics)
+    for entity in entities:
+        key = tuple(getattr(entity, field) for field in group_by)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = _empty_group(dict(zip(group_by, key)), metrics)
+        for metric in metrics:
+            value = None if metric.field is None else getattr(entity, metric.field)
+            if metric.function == COUNT:
+                if metric.field is None or value is not None:
+                    group[metric.name] += 1
+            elif value is not None:
+                current = group[metric.name]
+                if current is None:
+                    group[metric.name] = value
+                elif metric.function == MIN:
+                    group[metric.name] = min(current, value)
+                else:
+                    group[metric.name] = max(current, value)
+    return [group for _, group in sorted(groups.items(), key=_null_last)]
+
+
+def _empty_group(group: Dict[str, Any], metrics: Sequence[Metric]) -> Dict[str, Any]:
+    for metric in metrics:
+        group[metric.name] = 0 if metric.function == COUNT else None
+    return group
+
+
+def _null_last(item: Tuple[Tuple[Any, ...], Any]) -> Tuple[Tuple[bool, Any], ...]:
+    return tuple((value is None, value) for value in item[0])
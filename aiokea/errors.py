@@ -14,3 +14,22 @@ class ValidationError(Exception):
 
     def __init__(self, errors: List[Any]):
         self.errors = errors
+
+
+class AtomicNotSupportedError(NotImplementedError):
+    msg = "atomic_not_supported"
+
+
+class UnsupportedFilterError(ValueError):
+    msg = "unsupported_filter"
+
+
+class StatementTimeoutError(Exception):
+    msg = "statement_timeout"
+
+
+class AdmissionRejectedError(Exception):
+    msg = "overloaded"
+
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
@@ -1,5 +1,4 @@
-from typing import Any
-
+from typing import Any, Iterator, List, Tuple, Union
 
 EQ = "eq"  # equal to
 NE = "ne"  # not equal to
@@ -8,6 +7,9 @@ GTE = "gte"  # greater than or equal to
 LT = "lt"  # less than
 LTE = "lte"  # less than or equal to
 IN = "in"  # inclusion operator
+PREFIX = "prefix"  # starts with, case-sensitive
+CONTAINS = "contains"  # substring, case-insensitive
+SEARCH = "search"  # full-text match of all words
 
 
 class FilterOperators:
@@ -18,8 +20,11 @@ class FilterOperators:
     LT = LT  # less than
     LTE = LTE  # less than or equal to
     IN = IN  # inclusion operator
+    PREFIX = PREFIX  # starts with, case-sensitive
+    CONTAINS = CONTAINS  # substring, case-insensitive
+    SEARCH = SEARCH  # full-text match of all words
 
-    values = {EQ, NE, GT, GTE, LT, LTE, IN}
+    values = {EQ, NE, GT, GTE, LT, LTE, IN, PREFIX, CONTAINS, SEARCH}
 
 
 class Filter:
@@ -34,6 +39,204 @@ class Filter:
         self.operator = operator
         self.value = value
 
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, Filter) and (
+            self.field,
+            self.operator,
+            self.value,
+        ) == (other.field, other.operator, other.value)
+
+    def __hash__(self) -> int:
+        return hash((self.field, self.operator, _hashable(self.value)))
+
+    def __repr__(self) -> str:
+        return f"Filter({self.field!r}, {self.operator!r}, {self.value!r})"
+
+
+class _Group:
+    def __init__(self, *operands: "FilterExpression"):
+        self.operands: Tuple[FilterExpression, ...] = operands
+
+    def __eq__(self, other: Any) -> bool:
+        return type(other) is type(self) and self.operands == other.operands
+
+    def __hash__(self) -> int:
+        return hash((type(self), self.operands))
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}{self.operands!r}"
+
+
+class And(_Group):
+    """Matches when every operand matches; an empty And matches everything"""
+
+
+class Or(_Group):
+    """Matches when any operand matches; an empty Or matches nothing"""
+
+
+class Not:
+    def __init__(self, operand: "FilterExpression"):
+        self.operand = operand
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, Not) and self.operand == other.operand
+
+    def __hash__(self) -> int:
+        return hash((Not, self.operand))
+
+    def __repr__(self) -> str:
+        return f"Not({self.operand!r})"
+
+
+FilterExpression = Union[Filter, And, Or, Not]
+
+
+def _hashable(value: Any) -> Any:
+    # Lists, as IN values are, hash as the tuple of their items
+    if isinstance(value, list):
+        return tuple(map(_hashable, value))
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+
+def normalize(expression: FilterExpression) -> FilterExpression:
+    """
+    Simplify a filter expression without changing what it matches
+
+    Nested groups of the same kind are flattened into their parent, repeated
+    operands are dropped, single-operand groups are unwrapped and double
+    negations cancel out.
+    """
+    if isinstance(expression, Not):
+        operand = normalize(expression.operand)
+        if isinstance(operand, Not):
+            return operand.operand
+        return Not(operand)
+    if isinstance(expression, _Group):
+        operands: List[FilterExpression] = []
+        for operand in map(normalize, expression.operands):
+            flattened = (
+                operand.operands if type(operand) is type(expression) else (operand,)
+            )
+            for flat_operand in flattened:
+                # Linear search, as filter values such as lists need not be hashable
+                if flat_operand not in operands:
+                    operands.append(flat_operand)
+        if len(operands) == 1:
+            return operands[0]
+        return type(expression)(*operands)
+    return expression
+
+
+def iter_filters(expression: FilterExpression) -> Iterator[Filter]:
+    """Yield every Filter in an expression, depth first"""
+    if isinstance(expression, Not):
+        yield from iter_filters(expression.operand)
+    elif isinstance(expression, _Group):
+        for operand in expression.operands:
+            yield from iter_filters(operand)
+    else:
+        yield expression
+
+
+def parse_filter_expression(text: str) -> FilterExpression:
+    """
+    Parse the compact query string syntax for filter expressions
+
+        or(status.eq.active,and(owner.eq.me,not(created_at.lt.2019-06-01)))
+
+    A predicate is `field.operator.value`. The value runs to the next unquoted
+    comma or closing parenthesis; wrap it in double quotes to include those,
+    where a backslash escapes the character after it. For `in`, the value is a
+    parenthesized list: `id.in.(1,2,3)`. Values are left as strings.
+
+    :raises ValueError: if `text` is not a valid expression
+    """
+    parser = _ExpressionParser(text)
+    expression = parser.parse_expression()
+    if parser.position != len(text):
+        raise ValueError(f"Unexpected {text[parser.position]!r} at {parser.position}")
+    return expression
+
+
+class _ExpressionParser:
+    GROUPS = {"and": And, "or": Or}
+
+    def __init__(self, text: str):
+        self.text = text
+        self.position = 0
+
+    def parse_expression(self) -> FilterExpression:
+        name = self._read_until(".(")
+        if self._peek() == "(":
+            self._expect("(")
+            operands = [self.parse_expression()]
+            while self._peek() == ",":
+                self._expect(",")
+                operands.append(self.parse_expression())
+            self._expect(")")
+            if name == "not":
+                if len(operands) != 1:
+                    raise ValueError("not() takes exactly one operand")
+                return Not(operands[0])
+            if name not in self.GROUPS:
+                raise ValueError(f"Unknown filter group {name!r}")
+            return self.GROUPS[name](*operands)
+
+        if not name:
+            raise ValueError(f"Expected a field name at {self.position}")
+        self._expect(".")
+        operator = self._read_until(".")
+        self._expect(".")
+        if operator == IN:
+            self._expect("(")
+            values = [self._parse_value()]
+            while self._peek() == ",":
+                self._expect(",")
+                values.append(self._parse_value())
+            self._expect(")")
+            return Filter(name, operator, values)
+        return Filter(name, operator, self._parse_value())
+
+    def _parse_value(self) -> str:
+        if self._peek() != '"':
+            return self._read_until(",)")
+        self._expect('"')
+        chars = []
+        while True:
+            char = self._peek()
+            if char is None:
+                raise ValueError("Unterminated quoted value")
+            self.position += 1
+            if char == '"':
+                return "".join(chars)
+            if char == "\\":
+                char = self._peek()
+                if char is None:
+                    raise ValueError("Unterminated quoted value")
+                self.position += 1
+            chars.append(char)
+
+    def _read_until(self, stop_chars: str) -> str:
+        start = self.position
+        while self.position < len(self.text) and self.text[self.position] not in (
+            stop_chars + ",)"
+        ):
+            self.position += 1
+        return self.text[start : self.position]
+
+    def _peek(self) -> Any:
+        if self.position < len(self.text):
+            return self.text[self.position]
+        return None
+
+    def _expect(self, char: str) -> None:
+        if self._peek() != char:
+            raise ValueError(f"Expected {char!r} at {self.position}")
+        self.position += 1
+
 
 class PageNumberPaginationParams:
     PAGE = "page"
@@ -47,3 +250,14 @@ class LimitOffsetPaginationParams:
     OFFSET = "offset"
 
     values = {LIMIT, OFFSET}
+
+
+# Prefix of a sort key ordering by its field in descending order: `-created_at`
+DESCENDING = "-"
+
+
+def parse_sort_key(key: str) -> Tuple[str, bool]:
+    """Split a sort key such as `-created_at` into its field and whether it descends"""
+    if key.startswith(DESCENDING):
+        return key[len(DESCENDING) :], True
+    return key, False
@@ -0,0 +1,273 @@
+import asyncio
+import collections
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    TypeVar,
+    Union,
+)
+
+from aiokea.abc import CompactRow, Entity, IService
+from aiokea.aggregates import Metric
+from aiokea.errors import DuplicateResourceError, ResourceNotFoundError
+from aiokea.filters import FilterExpression
+
+T = TypeVar("T")
+
+DEFAULT_PERCENTILE = 0.95
+# Hedge delay used until enough latencies have been observed
+DEFAULT_INITIAL_DELAY = 0.05
+DEFAULT_MIN_SAMPLES = 20
+DEFAULT_WINDOW = 1000
+# Hedges allowed per read, on average
+DEFAULT_BUDGET = 0.05
+# Hedges that may fire back to back once the budget has built up
+DEFAULT_MAX_BURST = 10
+
+
+class HedgingStats:
+    """How often hedges fired and won, since the service was created"""
+
+    def __init__(self) -> None:
+        self.reads = 0
+        # Second attempts started
+        self.fired = 0
+        # Second attempts that finished first
+        self.won = 0
+        # Reads slow enough to hedge, but over budget
+        self.skipped = 0
+
+    @property
+    def fire_rate(self) -> float:
+        return self.fired / self.reads if self.reads else 0.0
+
+    @property
+    def win_rate(self) -> float:
+        return self.won / self.fired if self.fired else 0.0
+
+
+class LatencyTracker:
+    """Latency percentile over a sliding window of recent observations"""
+
+    def __init__(self, percentile: float, window: int = DEFAULT_WINDOW):
+        self.percentile = percentile
+        self._latencies: Deque[float] = collections.deque(maxlen=window)
+        self._value: Optional[float] = None
+        # Sorting the window on every observation would cost more than the
+        # percentile drifts in between, so it is refreshed every 5% of it
+        self._refresh_every = max(1, window // 20)
+        self._since_refresh = 0
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def observe(self, latency: float) -> None:
+        self._latencies.append(latency)
+        self._since_refresh += 1
+        # Refreshed on every observation while the window is filling up
+        refresh_every = min(self._refresh_every, len(self._latencies) // 20 + 1)
+        if self._since_refresh >= refresh_every:
+            self._since_refresh = 0
+            latencies = sorted(self._latencies)
+            index = min(len(latencies) - 1, int(len(latencies) * self.percentile))
+            self._value = latencies[index]
+
+    @property
+    def value(self) -> Optional[float]:
+        return self._value
+
+
+class HedgedService(IService):
+    """
+    IService wrapper sending a second attempt at reads that are slower than usual
+
+    When a read has not completed within the `percentile` latency of recent
+    reads of the same kind, an identical read is sent to `hedge_service`
+    (the wrapped service itself by default, which puts it on another pooled
+    connection) and whichever finishes first is returned. The other attempt
+    is cancelled, which for AIOPGRepo cancels its statement on the server.
+
+    `budget` caps the extra load: on average at most that many hedges fire per
+    read, in bursts of up to `max_burst`. `stats` counts how often hedges
+    fire and win, and is exported by `HTTPMetrics.track_hedging`.
+
+    `get` and `first` are hedged. `where` has no limit, so duplicating it can
+    double the cost of a large listing; it is only hedged with `hedge_where`.
+    Writes are never hedged.
+
+    A failed attempt does not win: the other one is awaited, and the first
+    error is raised only if both fail. ResourceNotFoundError is an answer,
+    not a failure.
+    """
+
+    def __init__(
+        self,
+        service: IService,
+        hedge_service: Optional[IService] = None,
+        percentile: float = DEFAULT_PERCENTILE,
+        initial_delay: float = DEFAULT_INITIAL_DELAY,
+        min_samples: int = DEFAULT_MIN_SAMPLES,
+        window: int = DEFAULT_WINDOW,
+        budget: float = DEFAULT_BUDGET,
+        max_burst: int = DEFAULT_MAX_BURST,
+        hedge_where: bool = False,
+    ):
+        self.service = service
+        self.hedge_service = hedge_service if hedge_service is not None else service
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self.window = window
+        self.budget = budget
+        self.max_burst = max_burst
+        self.hedge_where = hedge_where
+        self.stats = HedgingStats()
+        self._latencies: Dict[str, LatencyTracker] = {}
+        self._tokens = float(max_burst)
+
+    def hedge_delay(self, method: str) -> float:
+        """Seconds a `method` read may take before it is hedged"""
+        tracker = self._latencies.get(method)
+        if tracker is None or len(tracker) < self.min_samples:
+            return self.initial_delay
+        return tracker.value
+
+    async def get(self, id: Any) -> Optional[Entity]:
+        return await self._hedged("get", lambda service: service.get(id))
+
+    async def where(
+        self,
+        filters: Optional[Iterable[FilterExpression]] = None,
+        order_by: Optional[Sequence[str]] = None,
+        compact: bool = False,
+        lazy: bool = False,
+    ) -> Sequence[Union[Entity, CompactRow]]:
+        if not self.hedge_where:
+            return await self.service.where(filters, order_by, compact, lazy)
+        # Both attempts may run, so one-shot iterables are read up front
+        filters = list(filters) if filters is not None else None
+        return await self._hedged(
+            "where", lambda service: service.where(filters, order_by, compact, lazy)
+        )
+
+    async def first(
+        self,
+        filters: Optional[Iterable[FilterExpression]] = None,
+        order_by: Optional[Sequence[str]] = None,
+    ) -> Optional[Entity]:
+        filters = list(filters) if filters is not None else None
+        return await self._hedged(
+            "first", lambda service: service.first(filters, order_by)
+        )
+
+    async def aggregate(
+        self,
+        filters: Optional[Iterable[FilterExpression]] = None,
+        group_by: Sequence[str] = (),
+        metrics: Sequence[Metric] = (),
+    ) -> List[Dict[str, Any]]:
+        return await self.service.aggregate(filters, group_by, metrics)
+
+    async def create(self, entity: Entity) -> Entity:
+        return await self.service.create(entity)
+
+    async def create_many(
+        self, entities: Iterable[Entity], atomic: bool = False
+    ) -> List[Union[Entity, DuplicateResourceError]]:
+        return await self.service.create_many(entities, atomic=atomic)
+
+    async def update(self, entity: Entity) -> Entity:
+        return await self.service.update(entity)
+
+    async def delete(self, id: Any) -> Entity:
+        return await self.service.delete(id)
+
+    async def _hedged(self, method: str, call: Callable[[IService], Awaitable[T]]) -> T:
+        self.stats.reads += 1
+        self._tokens = min(float(self.max_burst), self._tokens + self.budget)
+        delay = self.hedge_delay(method)
+
+        started = time.monotonic()
+        first = asyncio.ensure_future(call(self.service))
+        first.add_done_callback(
+            lambda attempt: self._observe_first(method, attempt, started, delay)
+        )
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+        except asyncio.CancelledError:
+            first.cancel()
+            raise
+        if done or self._tokens < 1:
+            if not done:
+                self.stats.skipped += 1
+            return await first
+
+        self._tokens -= 1
+        self.stats.fired += 1
+        hedge = asyncio.ensure_future(call(self.hedge_service))
+        attempts = [first, hedge]
+        try:
+            winner = await _first_success(attempts)
+        finally:
+            for attempt in attempts:
+                if not attempt.done():
+                    attempt.cancel()
+                    attempt.add_done_callback(_discard_result)
+        if winner is hedge:
+            self.stats.won += 1
+        return winner.result()
+
+    def _observe_first(
+        self, method: str, first: asyncio.Future, started: float, delay: float
+    ) -> None:
+        """Observe the latency of a read's first attempt, once it is done"""
+        latency = time.monotonic() - started
+        # A first attempt cancelled by its caller before the hedge delay says
+        # nothing of its latency. One cancelled after it is only known to be
+        # slower than the delay, which is all the percentile it was measured
+        # against needs to know.
+        if first.cancelled() and latency < delay:
+            return
+        self._observe(method, latency)
+
+    def _observe(self, method: str, latency: float) -> None:
+        tracker = self._latencies.get(method)
+        if tracker is None:
+            tracker = self._latencies[method] = LatencyTracker(
+                self.percentile, self.window
+            )
+        tracker.observe(latency)
+
+
+async def _first_success(attempts: List["asyncio.Future[T]"]) -> "asyncio.Future[T]":
+    """
+    Wait for the first attempt to succeed, and return it
+
+    :raises: the first attempt's error, if every attempt fails
+    """
+    pending = set(attempts)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for attempt in attempts:
+            if attempt in done and _is_answer(attempt):
+                return attempt
+    raise attempts[0].exception()
+
+
+def _is_answer(attempt: asyncio.Future) -> bool:
+    error = attempt.exception()
+    return error is None or isinstance(error, ResourceNotFoundError)
+
+
+def _discard_result(attempt: asyncio.Future) -> None:
+    # Keeps asyncio from logging the errors of abandoned attempts
+    if not attempt.cancelled():
+        attempt.exception()
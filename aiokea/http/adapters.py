@@ -1,9 +1,10 @@
-from typing import Dict, List, Mapping, Type
+from typing import Any, Dict, List, Mapping, Sequence, Type, Union
 
 import marshmallow
 from marshmallow import Schema
 from aiokea.abc import Entity, IHTTPAdapter
 from aiokea.errors import ValidationError
+from aiokea.http.validation import INVALID, compile_loader
 
 
 MarshmallowSchema = Schema
@@ -20,22 +21,58 @@ MarshmallowSchema = Schema
 
 
 class BaseMarshmallowHTTPAdapter(IHTTPAdapter):
-    def __init__(self, schema: MarshmallowSchema, entity_class: Type):
+    """
+    Validates with a loader compiled from the schema, see aiokea.http.validation
+
+    Data the compiled loader rejects, and schemas it cannot compile, go
+    through `schema.load`, so errors are always marshmallow's.
+    Pass `compiled=False` to always use `schema.load`.
+    """
+
+    def __init__(
+        self, schema: MarshmallowSchema, entity_class: Type, compiled: bool = True
+    ):
         self._schema: MarshmallowSchema = schema
         self.entity_class: Type = entity_class
+        self._load = compile_loader(schema) if compiled else None
+        self._load_many = compile_loader(schema, many=True) if compiled else None
 
     @property
     def fields(self) -> List[str]:
         return list(self._schema.fields.keys())
 
     def to_entity(self, data: Mapping) -> Entity:
+        entity_data = self._load(data) if self._load is not None else INVALID
+        if entity_data is INVALID:
+            entity_data = self._schema_load(data)
+        return self.entity_class(**entity_data)
+
+    def to_entities(
+        self, items: Sequence[Mapping]
+    ) -> List[Union[Entity, ValidationError]]:
+        if self._load_many is None:
+            return super().to_entities(items)
+        entities: List[Union[Entity, ValidationError]] = []
+        for data, entity_data in zip(items, self._load_many(items)):
+            if entity_data is INVALID:
+                try:
+                    entity_data = self._schema_load(data)
+                except ValidationError as e:
+                    entities.append(e)
+                    continue
+            entities.append(self.entity_class(**entity_data))
+        return entities
+
+    def _schema_load(self, data: Any) -> Dict:
         try:
-            entity_data: Dict = self._schema.load(data)
+            return self._schema.load(data)
         except marshmallow.exceptions.ValidationError as e:
             error_list = [{k: v} for k, v in e.messages.items()]
             raise ValidationError(errors=error_list)
-        return self.entity_class(**entity_data)
 
     def from_entity(self, entity: Entity) -> Mapping:
         """Override if you need to decouple entity fields from api schema"""
         return self._schema.dump(entity)
+
+    def from_values(self, values: Mapping) -> Mapping:
+        return self._schema.dump(values)
@@ -0,0 +1,285 @@
+"""
+aiohttp handlers moving many resources at once through Postgres COPY
+
+Unlike AIOHTTPServiceHandler, these work on an AIOPGRepo directly, as COPY
+has no IService equivalent, and bypass the entity layer on the way.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Mapping, Optional
+
+from aiohttp import web
+
+import aiokea.errors
+from aiokea.http.handlers import _query_to_filters, _query_to_order_by
+from aiokea.repos.aiopg_copy import CSV, FORMATS, NDJSON
+
+if TYPE_CHECKING:
+    from aiokea.abc import Entity, IHTTPAdapter
+    from aiokea.filters import FilterExpression
+    from aiokea.repos.aiopg import AIOPGRepo
+
+# Query param choosing between `csv` and `ndjson`
+FORMAT_PARAM = "format"
+
+CONTENT_TYPES = {CSV: "text/csv", NDJSON: "application/x-ndjson"}
+
+# Entities validated and held in memory before being handed to the COPY
+DEFAULT_IMPORT_BATCH_SIZE = 1000
+# Longest line, or CSV record, an import accepts
+DEFAULT_MAX_LINE_BYTES = 1024 * 1024
+# Rejected records reported in an import's response; the rest are counted only
+DEFAULT_MAX_REPORTED_ERRORS = 100
+
+
+class AIOHTTPBulkHandler:
+    """
+    aiohttp handlers exporting and importing an AIOPGRepo's table in bulk
+
+    Exports take the same filter and sort query params as
+    AIOHTTPServiceHandler's GET, and only include the adapter's fields.
+    Imports validate every record through the adapter, as a POST would.
+    """
+
+    def __init__(
+        self,
+        repo: AIOPGRepo,
+        adapter: IHTTPAdapter,
+        import_batch_size: int = DEFAULT_IMPORT_BATCH_SIZE,
+        max_line_bytes: int = DEFAULT_MAX_LINE_BYTES,
+        max_reported_errors: int = DEFAULT_MAX_REPORTED_ERRORS,
+    ):
+        self.repo = repo
+        self.adapter = adapter
+        self.import_batch_size = import_batch_size
+        self.max_line_bytes = max_line_bytes
+        self.max_reported_errors = max_reported_errors
+
+    async def export_handler(self, request: web.Request) -> web.StreamResponse:
+        """
+        GET handler streaming every matching resource as CSV or NDJSON
+
+        Memory use does not grow with the size of the export. Errors once
+        streaming has started can only be reported by cutting the response
+        short, so clients should check for a complete last line.
+        """
+        format = request.query.get(FORMAT_PARAM, CSV)
+        try:
+            if format not in FORMATS:
+                raise ValueError(f"Invalid format {format!r}. Must be one of {FORMATS}")
+            filters: List[FilterExpression] = _query_to_filters(
+                request.query, self.adapter
+            )
+            order_by: List[str] = _query_to_order_by(request.query, self.adapter)
+        except ValueError as e:
+            raise web.HTTPBadRequest(
+                text=json.dumps({"errors": [str(e)]}), content_type="application/json"
+            )
+
+        columns = self.repo.table.c
+        chunks = self.repo.export(
+            filters=filters,
+            order_by=order_by,
+            fields=[field for field in self.adapter.fields if field in columns],
+            format=format,
+        )
+        try:
+            # Wait for the first chunk, so failing to start is still a 5xx
+            first_chunk = await chunks.__anext__()
+        except StopAsyncIteration:
+            first_chunk = b""
+
+        response = web.StreamResponse()
+        response.content_type = CONTENT_TYPES[format]
+        await response.prepare(request)
+        try:
+            await response.write(first_chunk)
+            async for chunk in chunks:
+                await response.write(chunk)
+        finally:
+            await chunks.aclose()
+        await response.write_eof()
+        return response
+
+    async def import_handler(self, request: web.Request) -> web.Response:
+        """
+        POST handler creating a resource per CSV or NDJSON record of the body
+
+        The body is read, validated and copied into Postgres a batch at a
+        time, so memory use does not grow with its size. CSV needs a header
+        row naming the fields; empty values are left out. The format is
+        taken from `?format=`, or else the Content-Type.
+
+        Invalid records are rejected and valid ones imported regardless;
+        records conflicting with existing resources are skipped. The
+        response counts each, with the errors of the first rejected records
+        by their 0-based position in the body.
+        """
+        format = request.query.get(FORMAT_PARAM) or _format_from_content_type(
+            request.content_type
+        )
+        if format not in FORMATS:
+            raise web.HTTPBadRequest(
+                text=json.dumps(
+                    {"errors": [f"Invalid format {format!r}. Must be one of {FORMATS}"]}
+                ),
+                content_type="application/json",
+            )
+
+        lines = _lines(request.content, self.max_line_bytes)
+        records = (
+            _csv_records(lines, self.max_line_bytes)
+            if format == CSV
+            else _ndjson_records(lines)
+        )
+        report: Dict[str, Any] = {"received": 0, "rejected": 0, "errors": []}
+        try:
+            summary = await self.repo.import_entities(
+                self._validated_batches(records, report)
+            )
+        except _LineTooLong:
+            raise web.HTTPRequestEntityTooLarge(
+                max_size=self.max_line_bytes,
+                actual_size=self.max_line_bytes + 1,
+                text=json.dumps(
+                    {
+                        "errors": [
+                            f"Lines are limited to {self.max_line_bytes} bytes. "
+                            "Nothing was imported."
+                        ]
+                    }
+                ),
+                content_type="application/json",
+            )
+        except UnicodeDecodeError:
+            raise web.HTTPBadRequest(
+                text=json.dumps(
+                    {"errors": ["The body must be UTF-8. Nothing was imported."]}
+                ),
+                content_type="application/json",
+            )
+        return web.json_response(
+            {
+                "data": {
+                    "received": report["received"],
+                    "rejected": report["rejected"],
+                    "imported": summary.inserted,
+                    "conflicts": summary.conflicts,
+                },
+                "errors": report["errors"],
+            }
+        )
+
+    async def _validated_batches(
+        self, records: AsyncIterator[Any], report: Dict[str, Any]
+    ) -> AsyncIterator[List[Entity]]:
+        pending: List[Any] = []
+        async for record in records:
+            pending.append(record)
+            if len(pending) >= self.import_batch_size:
+                yield self._validate(pending, report)
+                pending = []
+        if pending:
+            yield self._validate(pending, report)
+
+    def _validate(self, records: List[Any], report: Dict[str, Any]) -> List[Entity]:
+        # Records that could not be parsed are None
+        parsed = [record for record in records if record is not None]
+        results = iter(self.adapter.to_entities(parsed))
+        batch: List[Entity] = []
+        for record in records:
+            index = report["received"]
+            report["received"] += 1
+            result = (
+                next(results)
+                if record is not None
+                else aiokea.errors.ValidationError(
+                    errors=["The record could not be parsed."]
+                )
+            )
+            if not isinstance(result, aiokea.errors.ValidationError):
+                batch.append(result)
+                continue
+            report["rejected"] += 1
+            if len(report["errors"]) < self.max_reported_errors:
+                report["errors"].append({"index": index, "errors": result.errors})
+        return batch
+
+
+class _LineTooLong(Exception):
+    pass
+
+
+def _format_from_content_type(content_type: str) -> str:
+    for format, format_content_type in CONTENT_TYPES.items():
+        if content_type == format_content_type:
+            return format
+    return CSV
+
+
+async def _lines(content: web.StreamReader, max_line_bytes: int) -> AsyncIterator[str]:
+    """Split a streamed body into lines, without their line endings"""
+    buffer = bytearray()
+    async for chunk in content.iter_any():
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end == -1:
+                break
+            yield buffer[start:end].rstrip(b"\r").decode()
+            start = end + 1
+        del buffer[:start]
+        if len(buffer) > max_line_bytes:
+            raise _LineTooLong()
+    if buffer:
+        yield buffer.decode()
+
+
+async def _csv_records(
+    lines: AsyncIterator[str], max_record_bytes: int
+) -> AsyncIterator[Optional[Dict[str, str]]]:
+    """
+    Parse CSV lines into records keyed by the header row
+
+    A record spans lines while a quoted value is open, which is whenever an
+    odd number of quote characters has been seen, escaped quotes included.
+    """
+    header: List[str] = []
+    record: List[str] = []
+    quotes = size = 0
+    async for line in lines:
+        record.append(line)
+        quotes += line.count('"')
+        size += len(line)
+        if quotes % 2:
+            if size > max_record_bytes:
+                raise _LineTooLong()
+            continue
+        text = "\n".join(record)
+        record, quotes, size = [], 0, 0
+        if not text.strip():
+            continue
+        values = next(csv.reader(io.StringIO(text)))
+        if not header:
+            header = values
+            continue
+        yield {field: value for field, value in zip(header, values) if value != ""}
+    if record:
+        # A quoted value left open at the end of the body
+        yield None
+
+
+async def _ndjson_records(lines: AsyncIterator[str]) -> AsyncIterator[Any]:
+    async for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # Rejected, like records that are not objects
+            yield None
@@ -0,0 +1,176 @@
+"""
+Negotiated gzip/deflate compression of aiohttp responses
+
+    Compression().setup(app)
+
+Responses are compressed when the client accepts it, the body is at least
+`threshold` bytes and its content type is text-like. Bodies of
+`executor_threshold` bytes or more are compressed in an executor, which
+keeps the event loop responsive; zlib releases the GIL while it works,
+so those compressions also run in parallel.
+
+Compressed variants of recent bodies are kept in a cache bounded to
+`cache_bytes`. A body served again unchanged, such as an unchanged listing
+or a replayed idempotent response, is not compressed a second time.
+See benchmarks/compression.py for the CPU cost of each level.
+"""
+
+import asyncio
+import collections
+import hashlib
+import zlib
+from concurrent.futures import Executor
+from typing import Awaitable, Callable, Dict, List, Optional, OrderedDict, Tuple
+
+from aiohttp import hdrs, web
+
+GZIP = "gzip"
+DEFLATE = "deflate"
+IDENTITY = "identity"
+
+# In order of preference when a client accepts several equally
+ENCODINGS = (GZIP, DEFLATE)
+
+# Below this, compression saves fewer bytes than it costs in CPU and latency
+DEFAULT_THRESHOLD = 1024
+DEFAULT_EXECUTOR_THRESHOLD = 64 * 1024
+# On JSON listings, level 1 comes within about 15% of level 6's size for
+# less than half the CPU; see benchmarks/compression.py
+DEFAULT_LEVEL = 1
+DEFAULT_CACHE_BYTES = 32 * 1024 * 1024
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+}
+
+
+class Compression:
+    """Compresses response bodies for clients that send Accept-Encoding"""
+
+    def __init__(
+        self,
+        threshold: int = DEFAULT_THRESHOLD,
+        level: int = DEFAULT_LEVEL,
+        executor_threshold: int = DEFAULT_EXECUTOR_THRESHOLD,
+        executor: Optional[Executor] = None,
+        cache_bytes: int = DEFAULT_CACHE_BYTES,
+    ):
+        self.threshold = threshold
+        self.level = level
+        self.executor_threshold = executor_threshold
+        self.executor = executor
+        self.cache_bytes = cache_bytes
+        # (encoding, digest of the uncompressed body) to the compressed body
+        self._cache: OrderedDict[Tuple[str, bytes], bytes] = collections.OrderedDict()
+        self._cached_bytes = 0
+
+    def setup(self, app: web.Application) -> None:
+        app.middlewares.append(self.middleware)
+
+    @web.middleware
+    async def middleware(
+        self,
+        request: web.Request,
+        handler: Callable[[web.Request], Awaitable[web.StreamResponse]],
+    ) -> web.StreamResponse:
+        response = await handler(request)
+        await self.compress(request, response)
+        return response
+
+    async def compress(
+        self, request: web.Request, response: web.StreamResponse
+    ) -> None:
+        """Compress `response` in place, if it is worth it and the client accepts it"""
+        if not self._is_compressible(response):
+            return
+        # Caches must keep a variant per encoding, identity included
+        response.headers.add(hdrs.VARY, hdrs.ACCEPT_ENCODING)
+        encoding = negotiate_encoding(request.headers.get(hdrs.ACCEPT_ENCODING, ""))
+        if encoding == IDENTITY:
+            return
+        body = bytes(response.body)
+        response.body = await self._compressed(body, encoding)
+        response.headers[hdrs.CONTENT_ENCODING] = encoding
+
+    def _is_compressible(self, response: web.StreamResponse) -> bool:
+        return (
+            isinstance(response, web.Response)
+            and not response.prepared
+            and isinstance(response.body, (bytes, bytearray))
+            and len(response.body) >= self.threshold
+            and hdrs.CONTENT_ENCODING not in response.headers
+            and _is_compressible_type(response.content_type)
+        )
+
+    async def _compressed(self, body: bytes, encoding: str) -> bytes:
+        if not self.cache_bytes or len(body) > self.cache_bytes:
+            return await self._compress(body, encoding)
+        key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+        compressed = self._cache.get(key)
+        if compressed is not None:
+            self._cache.move_to_end(key)
+            return compressed
+        compressed = await self._compress(body, encoding)
+        self._cache[key] = compressed
+        self._cached_bytes += len(compressed)
+        while self._cached_bytes > self.cache_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_bytes -= len(evicted)
+        return compressed
+
+    async def _compress(self, body: bytes, encoding: str) -> bytes:
+        if len(body) < self.executor_threshold:
+            return compress(body, encoding, self.level)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor, compress, body, encoding, self.level
+        )
+
+
+def compress(body: bytes, encoding: str, level: int = DEFAULT_LEVEL) -> bytes:
+    """Compress `body` for a Content-Encoding of `gzip` or `deflate`"""
+    # HTTP's deflate is the zlib format; gzip needs zlib's gzip header flag
+    wbits = 16 + zlib.MAX_WBITS if encoding == GZIP else zlib.MAX_WBITS
+    compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+    return compressor.compress(body) + compressor.flush()
+
+
+def negotiate_encoding(accept_encoding: str) -> str:
+    """
+    Pick the encoding to respond with from an Accept-Encoding header value
+
+    Follows the header's quality values, so `gzip;q=0` refuses gzip and `*`
+    accepts any encoding not listed. Returns `identity` when nothing better
+    is acceptable.
+    """
+    qualities: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.partition(";")
+        name = name.strip()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        qualities[name] = quality
+    candidates: List[Tuple[float, int, str]] = []
+    for preference, encoding in enumerate(ENCODINGS):
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > 0:
+            candidates.append((-quality, preference, encoding))
+    return min(candidates)[2] if candidates else IDENTITY
+
+
+def _is_compressible_type(content_type: str) -> bool:
+    return (
+        content_type.startswith("text/")
+        or content_type in COMPRESSIBLE_TYPES
+        or content_type.endswith("+json")
+    )
@@ -1,38 +1,171 @@
+from __future__ import annotations
+
 import json
 import re
-from typing import List, Set
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
 
 from aiohttp import web
-from multidict import MultiMapping
 
 import aiokea
-from aiokea.abc import IService, Entity, IHTTPAdapter
-from aiokea.errors import DuplicateResourceError
-from aiokea.filters import Filter, EQ, PageNumberPaginationParams, FilterOperators
+from aiokea.aggregates import COUNT, Metric, parse_metric
+from aiokea.errors import (
+    AdmissionRejectedError,
+    AtomicNotSupportedError,
+    DuplicateResourceError,
+    StatementTimeoutError,
+    UnsupportedFilterError,
+)
+from aiokea.filters import (
+    Filter,
+    FilterExpression,
+    EQ,
+    IN,
+    PageNumberPaginationParams,
+    FilterOperators,
+    iter_filters,
+    parse_filter_expression,
+    parse_sort_key,
+)
+
+if TYPE_CHECKING:
+    from multidict import MultiMapping
+
+    from aiokea.abc import IService, Entity, IHTTPAdapter
+    from aiokea.admission import AdmissionController
+    from aiokea.http.idempotency import Idempotency
 
 
 FILTER_KEY_REGEX = re.compile(r"\[(.*?)\]")
 
+# Query param carrying a composite filter expression, e.g.
+# `filter=or(status.eq.active,owner.eq.me)`; see `parse_filter_expression`
+FILTER_PARAM = "filter"
+
+# Query param listing the fields to sort by, `-` first for descending order:
+# `sort=-created_at,username`
+SORT_PARAM = "sort"
+
+# Query params switching GET into aggregate mode, e.g.
+# `aggregate=count,max(created_at)&group_by=is_enabled`; see `parse_metric`
+AGGREGATE_PARAM = "aggregate"
+GROUP_BY_PARAM = "group_by"
+
+# Query param on batch POST requesting that every item is created or none are
+ATOMIC_PARAM = "atomic"
+DEFAULT_MAX_BATCH_SIZE = 1000
+
+T = TypeVar("T")
+
 
 class AIOHTTPServiceHandler:
+    """
+    aiohttp handlers exposing an IService over HTTP
+
+    Service calls run in the request's own task, so when aiohttp cancels that task
+    on client disconnect, the cancellation reaches the service call in flight;
+    AIOPGRepo responds by cancelling the statement on the Postgres server.
+    aiohttp 3.9+ only cancels handlers on disconnect with `handler_cancellation=True`.
+
+    With an `admission` controller, every service call must be admitted by it first;
+    requests it rejects get a 503 with a Retry-After header.
+
+    With `idempotency`, POST requests carrying an Idempotency-Key header are
+    handled once per key, and retries get the stored response.
+    """
+
     def __init__(
         self,
         service: IService,
         adapter: IHTTPAdapter,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        admission: Optional[AdmissionController] = None,
+        idempotency: Optional[Idempotency] = None,
     ):
         super().__init__()
         self.service = service
         self.adapter = adapter
+        self.max_batch_size = max_batch_size
+        self.admission = admission
+        self.idempotency = idempotency
 
     async def get_handler(self, request: web.Request) -> web.Response:
-        """GET handler to list resources satisfying query filters"""
-        filters: List[Filter] = _query_to_filters(request.query, self.adapter)
-        entities: List[Entity] = await self.service.where(filters=filters)
+        """
+        GET handler to list resources satisfying query filters
+
+        A `sort` query param orders the resources; with `aggregate` or
+        `group_by` query params, responds with a summary of the matching
+        resources instead, see `_aggregate`.
+        """
+        try:
+            filters: List[FilterExpression] = _query_to_filters(
+                request.query, self.adapter
+            )
+            order_by: List[str] = _query_to_order_by(request.query, self.adapter)
+            aggregation = _query_to_aggregation(request.query, self.adapter)
+        except ValueError as e:
+            raise web.HTTPBadRequest(
+                text=json.dumps({"errors": [str(e)]}), content_type="application/json"
+            )
+        if aggregation is not None:
+            return await self._aggregate(filters, *aggregation)
+        entities: List[Entity] = await self._call_service(
+            self.service.where, filters=filters, order_by=order_by or None
+        )
         response_data = [self.adapter.from_entity(s) for s in entities]
         return web.json_response({"data": response_data})
 
+    async def _aggregate(
+        self,
+        filters: List[FilterExpression],
+        group_by: List[str],
+        metrics: List[Metric],
+    ) -> web.Response:
+        """
+        Respond with one item per group of matching resources
+
+        Each item holds the `group_by` field values and every metric by name:
+        `GET /users?group_by=is_enabled&aggregate=count` gives
+        `{"data": [{"is_enabled": false, "count": 1}, ...]}`.
+        """
+        groups = await self._call_service(
+            self.service.aggregate, filters=filters, group_by=group_by, metrics=metrics
+        )
+        response_data = []
+        for group in groups:
+            item = dict(self.adapter.from_values({f: group[f] for f in group_by}))
+            for metric in metrics:
+                value = group[metric.name]
+                if metric.function != COUNT:
+                    # Minimum and maximum are values of the field itself
+                    value = self.adapter.from_values({metric.field: value})[
+                        metric.field
+                    ]
+                item[metric.name] = value
+            response_data.append(item)
+        return web.json_response({"data": response_data})
+
     async def post_handler(self, request: web.Request) -> web.Response:
-        """POST handler to create a resource"""
+        """
+        POST handler to create a resource
+
+        A JSON array body creates a batch of resources; see `_post_batch`.
+        """
+        if self.idempotency is not None:
+            return await self.idempotency.handle(request, self._post)
+        return await self._post(request)
+
+    async def _post(self, request: web.Request) -> web.Response:
         try:
             request_data = await request.json()
         except Exception:
@@ -40,6 +173,10 @@ class AIOHTTPServiceHandler:
                 text=json.dumps({"errors": ["The supplied JSON is invalid."]})
             )
 
+        if isinstance(request_data, list):
+            atomic = request.query.get(ATOMIC_PARAM, "false").lower() == "true"
+            return await self._post_batch(request_data, atomic)
+
         try:
             request_entity = self.adapter.to_entity(request_data)
         except aiokea.errors.ValidationError as e:
@@ -47,7 +184,9 @@ class AIOHTTPServiceHandler:
                 text=json.dumps({"errors": e.errors}), content_type="application/json"
             )
         try:
-            service_entity = await self.service.create(request_entity)
+            service_entity = await self._call_service(
+                self.service.create, request_entity
+            )
         except DuplicateResourceError as e:
             raise web.HTTPConflict(
                 text=json.dumps({"errors": [e.msg]}),
@@ -56,12 +195,137 @@ class AIOHTTPServiceHandler:
         response_data = self.adapter.from_entity(service_entity)
         return web.json_response({"data": response_data})
 
+    async def _post_batch(self, request_data: List[Any], atomic: bool) -> web.Response:
+        """
+        Create every resource in the request body with a single service call
+
+        By default each item succeeds or fails on its own and the 207 response
+        carries a status per item, in request order.
+        With `?atomic=true` any invalid or duplicate item fails the whole batch
+        with the same status a single POST would get, and nothing is created.
+        """
+        if len(request_data) > self.max_batch_size:
+            raise web.HTTPRequestEntityTooLarge(
+                max_size=self.max_batch_size,
+                actual_size=len(request_data),
+                text=json.dumps(
+                    {
+                        "errors": [
+                            f"Batch size is limited to {self.max_batch_size} items."
+                        ]
+                    }
+                ),
+                content_type="application/json",
+            )
+
+        # Validate the whole batch before touching the service
+        item_results: List[Dict] = []
+        request_entities: List[Entity] = []
+        for item_entity in self.adapter.to_entities(request_data):
+            if isinstance(item_entity, aiokea.errors.ValidationError):
+                item_results.append(
+                    {
+                        "status": web.HTTPUnprocessableEntity.status_code,
+                        "errors": item_entity.errors,
+                    }
+                )
+            else:
+                request_entities.append(item_entity)
+                item_results.append({})
+        if atomic and len(request_entities) < len(request_data):
+            raise web.HTTPUnprocessableEntity(
+                text=json.dumps(
+                    {
+                        "errors": [
+                            {"index": index, "errors": item_result["errors"]}
+                            for index, item_result in enumerate(item_results)
+                            if item_result
+                        ]
+                    }
+                ),
+                content_type="application/json",
+            )
+
+        try:
+            service_results = await self._call_service(
+                self.service.create_many, request_entities, atomic=atomic
+            )
+        except DuplicateResourceError as e:
+            raise web.HTTPConflict(
+                text=json.dumps({"errors": [e.msg]}),
+                content_type="application/json",
+            )
+        except AtomicNotSupportedError as e:
+            raise web.HTTPBadRequest(
+                text=json.dumps({"errors": [e.msg]}),
+                content_type="application/json",
+            )
+        if atomic:
+            response_data = [self.adapter.from_entity(s) for s in service_results]
+            return web.json_response({"data": response_data})
+
+        service_results_iter = iter(service_results)
+        for item_result in item_results:
+            if item_result:
+                # Failed validation, never sent to the service
+                continue
+            service_result = next(service_results_iter)
+            if isinstance(service_result, DuplicateResourceError):
+                item_result["status"] = web.HTTPConflict.status_code
+                item_result["errors"] = [service_result.msg]
+            else:
+                item_result["status"] = web.HTTPOk.status_code
+                item_result["data"] = self.adapter.from_entity(service_result)
+        return web.json_response({"data": item_results}, status=207)
+
+    async def _call_service(
+        self, method: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any
+    ) -> T:
+        """
+        Call a service method under admission control
+
+        Maps the failures any service call can hit to 503 responses, and
+        filters the service cannot apply to 400 responses; errors specific to
+        the method are left for the caller to handle.
+        """
+        try:
+            if self.admission is None:
+                return await method(*args, **kwargs)
+            async with self.admission.admit():
+                return await method(*args, **kwargs)
+        except AdmissionRejectedError as e:
+            raise web.HTTPServiceUnavailable(
+                headers={"Retry-After": str(e.retry_after)},
+                text=json.dumps({"errors": [e.msg]}),
+                content_type="application/json",
+            )
+        except StatementTimeoutError as e:
+            raise web.HTTPServiceUnavailable(
+                text=json.dumps({"errors": [e.msg]}), content_type="application/json"
+            )
+        except UnsupportedFilterError as e:
+            raise web.HTTPBadRequest(
+                text=json.dumps({"errors": [str(e)]}), content_type="application/json"
+            )
+
 
 def _query_to_filters(
     raw_query_map: MultiMapping, adapter: IHTTPAdapter
-) -> List[Filter]:
+) -> List[FilterExpression]:
+    """
+    Build the filters for a GET query, all of which must match
+
+    :raises ValueError: if a filter expression is malformed or names
+        a field the adapter does not expose
+    """
     valid_filter_fields: Set[str] = _valid_query_params(adapter)
-    query_filters: List[Filter] = []
+    query_filters: List[FilterExpression] = []
+    for expression_text in raw_query_map.getall(FILTER_PARAM, []):
+        expression = parse_filter_expression(expression_text)
+        for filter in iter_filters(expression):
+            if filter.field not in adapter.fields:
+                raise ValueError(f"Cannot filter on unknown field {filter.field!r}")
+        query_filters.append(expression)
     for full_query_param in raw_query_map.keys():
         # Regex split allows for standard query: `name=test`
         # as well as filter-style query: `created_at[lte]=2019-06-01`
@@ -79,12 +343,67 @@ def _query_to_filters(
                 # Filter-style query like `created_at[lte]=2019-06-01`
                 query_operator: str = query_param_parts[1]
                 query_filters.extend(
-                    Filter(query_field, query_operator, query_value)
+                    Filter(
+                        query_field,
+                        query_operator,
+                        # Inclusion takes a comma separated list: `id[in]=1,2`
+                        query_value.split(",") if query_operator == IN else query_value,
+                    )
                     for query_value in raw_query_map.getall(full_query_param)
                 )
     return query_filters
 
 
+def _query_to_order_by(raw_query_map: MultiMapping, adapter: IHTTPAdapter) -> List[str]:
+    """
+    Read the sort keys of a GET query, most significant first
+
+    :raises ValueError: if a key names a field the adapter does not expose
+    """
+    order_by = _split_params(raw_query_map, SORT_PARAM)
+    for key in order_by:
+        field, _ = parse_sort_key(key)
+        if field not in adapter.fields:
+            raise ValueError(f"Cannot sort on unknown field {field!r}")
+    return order_by
+
+
+def _query_to_aggregation(
+    raw_query_map: MultiMapping, adapter: IHTTPAdapter
+) -> Optional[Tuple[List[str], List[Metric]]]:
+    """
+    Read the group_by fields and metrics of an aggregate GET query
+
+    Both params take comma separated lists and may be repeated.
+    Returns None for a plain listing query.
+
+    :raises ValueError: if a metric is malformed or a field is not exposed
+        by the adapter
+    """
+    if AGGREGATE_PARAM not in raw_query_map and GROUP_BY_PARAM not in raw_query_map:
+        return None
+    group_by = _split_params(raw_query_map, GROUP_BY_PARAM)
+    metrics = [
+        parse_metric(text) for text in _split_params(raw_query_map, AGGREGATE_PARAM)
+    ]
+    fields = group_by + [metric.field for metric in metrics if metric.field]
+    for field in fields:
+        if field not in adapter.fields:
+            raise ValueError(f"Cannot aggregate on unknown field {field!r}")
+    if not metrics and not group_by:
+        raise ValueError("Nothing to aggregate: no group_by fields and no metrics")
+    return group_by, metrics
+
+
+def _split_params(raw_query_map: MultiMapping, key: str) -> List[str]:
+    return [
+        part.strip()
+        for value in raw_query_map.getall(key, [])
+        for part in value.split(",")
+        if part.strip()
+    ]
+
+
 def _valid_query_params(adapter: IHTTPAdapter) -> Set[str]:
     valid_query_params = set()
     for field in adapter.fields:
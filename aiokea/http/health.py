@@ -0,0 +1,23 @@
+from typing import Awaitable, Callable
+
+from aiohttp import web
+
+
+def readiness_handler(
+    *checks: Callable[[], bool]
+) -> Callable[[web.Request], Awaitable[web.Response]]:
+    """
+    Build a health check handler that reports ready only once every check passes
+
+    Responds 503 while any check returns False, so a load balancer keeps traffic
+    away from a process whose pools are still warming up, e.g.
+
+        app.router.add_get("/health", readiness_handler(lambda: engine.ready))
+    """
+
+    async def handler(request: web.Request) -> web.Response:
+        if all(check() for check in checks):
+            return web.json_response({"status": "OK"})
+        return web.json_response({"status": "unavailable"}, status=503)
+
+    return handler
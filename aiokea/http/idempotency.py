@@ -0,0 +1,305 @@
+"""
+Idempotency-Key support for aiohttp POST handlers
+
+A client that sends `Idempotency-Key: <unique value>` with a POST may retry it
+safely: the first response is stored under the key, and every retry carrying
+the same key gets that response back without reaching the service.
+
+    handler = AIOHTTPServiceHandler(service, adapter, idempotency=Idempotency())
+
+Keys are scoped to the request's method and path. A key reused for a different
+request, with another body or query, is rejected with a 422.
+"""
+
+import asyncio
+import collections
+import hashlib
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import (
+    TYPE_CHECKING,
+    Awaitable,
+    Callable,
+    Dict,
+    NamedTuple,
+    Optional,
+    OrderedDict,
+    Tuple,
+)
+
+from aiohttp import web
+
+if TYPE_CHECKING:
+    import aiopg.sa
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+# Set on responses that are a stored response played back
+IDEMPOTENT_REPLAYED_HEADER = "Idempotent-Replayed"
+
+MAX_KEY_LENGTH = 255
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_TTL = 24 * 60 * 60.0
+DEFAULT_TABLE_NAME = "aiokea_idempotency_keys"
+
+
+class StoredResponse(NamedTuple):
+    status: int
+    body: bytes
+    content_type: str
+    # Hash of the request the response answered, to detect reused keys
+    fingerprint: str
+    charset: Optional[str] = None
+
+
+class IdempotencyStore(ABC):
+    """Where responses are kept for `ttl` seconds after they are saved"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[StoredResponse]:
+        pass
+
+    @abstractmethod
+    async def save(self, key: str, response: StoredResponse) -> None:
+        """Save `response` under `key`, unless a live response is already there"""
+        pass
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    """
+    Keeps the `max_entries` most recently used responses in process memory
+
+    Every worker process has a store of its own, so a retry landing on
+    another worker is not recognized; use AIOPGIdempotencyStore for that.
+    """
+
+    def __init__(
+        self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, Tuple[float, StoredResponse]] = (
+            collections.OrderedDict()
+        )
+
+    async def get(self, key: str) -> Optional[StoredResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        saved_at, response = entry
+        if time.monotonic() - saved_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    async def save(self, key: str, response: StoredResponse) -> None:
+        if await self.get(key) is not None:
+            return
+        self._entries[key] = (time.monotonic(), response)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class AIOPGIdempotencyStore(IdempotencyStore):
+    """
+    Keeps responses in a Postgres table, shared by every process and node
+
+    The table is created by `create_table`, or by a migration running
+    `CREATE_TABLE_SQL`. Expired rows are ignored and overwritten, but only
+    deleted by `purge_expired`, which is best run periodically.
+    """
+
+    CREATE_TABLE_SQL = """
+        CREATE TABLE IF NOT EXISTS {table} (
+            key text PRIMARY KEY,
+            status integer NOT NULL,
+            body bytea NOT NULL,
+            content_type text NOT NULL,
+            fingerprint text NOT NULL,
+            charset text,
+            saved_at timestamptz NOT NULL DEFAULT now()
+        )
+    """
+
+    def __init__(
+        self,
+        engine: "aiopg.sa.Engine",
+        table_name: str = DEFAULT_TABLE_NAME,
+        ttl: float = DEFAULT_TTL,
+    ):
+        self.engine = engine
+        self.table_name = table_name
+        self.ttl = ttl
+
+    async def create_table(self) -> None:
+        async with self.engine.acquire() as conn:
+            await conn.execute(self.CREATE_TABLE_SQL.format(table=self._table))
+
+    async def get(self, key: str) -> Optional[StoredResponse]:
+        async with self.engine.acquire() as conn:
+            results = await conn.execute(
+                "SELECT status, body, content_type, fingerprint, charset "
+                f"FROM {self._table} "
+                "WHERE key = %(key)s "
+                "AND saved_at > now() - make_interval(secs => %(ttl)s)",
+                {"key": key, "ttl": self.ttl},
+            )
+            row = await results.fetchone()
+        if row is None:
+            return None
+        status, body, content_type, fingerprint, charset = row.as_tuple()
+        return StoredResponse(status, bytes(body), content_type, fingerprint, charset)
+
+    async def save(self, key: str, response: StoredResponse) -> None:
+        async with self.engine.acquire() as conn:
+            await conn.execute(
+                f"INSERT INTO {self._table} AS stored "
+                "(key, status, body, content_type, fingerprint, charset) "
+                "VALUES (%(key)s, %(status)s, %(body)s, %(content_type)s, "
+                "%(fingerprint)s, %(charset)s) "
+                "ON CONFLICT (key) DO UPDATE SET status = excluded.status, "
+                "body = excluded.body, content_type = excluded.content_type, "
+                "fingerprint = excluded.fingerprint, charset = excluded.charset, "
+                "saved_at = now() "
+                "WHERE stored.saved_at <= now() - make_interval(secs => %(ttl)s)",
+                {"key": key, "ttl": self.ttl, **response._asdict()},
+            )
+
+    async def purge_expired(self) -> int:
+        """Delete expired responses, returning how many there were"""
+        async with self.engine.acquire() as conn:
+            results = await conn.execute(
+                f"DELETE FROM {self._table} "
+                "WHERE saved_at <= now() - make_interval(secs => %(ttl)s)",
+                {"ttl": self.ttl},
+            )
+            return results.rowcount
+
+    @property
+    def _table(self) -> str:
+        return '"{}"'.format(self.table_name.replace('"', '""'))
+
+
+class Idempotency:
+    """
+    Answers retried requests with the response to the first one
+
+    Responses with a 5xx status, and requests that raise anything but an
+    HTTPException, are not stored, so the client's next retry runs again.
+    A request arriving while another with the same key is still being handled
+    in this process waits for it and gets its response. Across processes, the
+    duplicate runs concurrently and whichever response is saved first is the
+    one later retries get.
+    """
+
+    def __init__(self, store: Optional[IdempotencyStore] = None):
+        self.store = store if store is not None else MemoryIdempotencyStore()
+        self._in_flight: Dict[str, "asyncio.Future[Optional[StoredResponse]]"] = {}
+
+    async def handle(
+        self,
+        request: web.Request,
+        handler: Callable[[web.Request], Awaitable[web.StreamResponse]],
+    ) -> web.StreamResponse:
+        """Run `handler` for `request` unless its Idempotency-Key was seen before"""
+        key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+        if key is None:
+            return await handler(request)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise web.HTTPBadRequest(
+                text=json.dumps(
+                    {
+                        "errors": [
+                            f"{IDEMPOTENCY_KEY_HEADER} must be 1 to "
+                            f"{MAX_KEY_LENGTH} characters long."
+                        ]
+                    }
+                ),
+                content_type="application/json",
+            )
+
+        # aiohttp keeps the body read here for the handler to read again
+        fingerprint = hashlib.sha256(
+            request.path_qs.encode() + b"\n" + await request.read()
+        ).hexdigest()
+        scoped_key = f"{request.method} {request.path} {key}"
+
+        while True:
+            stored = await self._get(scoped_key)
+            if stored is not None:
+                return _replay(stored, fingerprint)
+            in_flight = self._in_flight.get(scoped_key)
+            if in_flight is None:
+                break
+            stored = await asyncio.shield(in_flight)
+            if stored is not None:
+                return _replay(stored, fingerprint)
+            # The original failed without a response worth keeping; try again
+
+        in_flight = asyncio.get_event_loop().create_future()
+        self._in_flight[scoped_key] = in_flight
+        stored = None
+        try:
+            try:
+                response = await handler(request)
+            except web.HTTPException as e:
+                stored = await self._save(scoped_key, e, fingerprint)
+                raise
+            stored = await self._save(scoped_key, response, fingerprint)
+            return response
+        finally:
+            del self._in_flight[scoped_key]
+            in_flight.set_result(stored)
+
+    async def _get(self, key: str) -> Optional[StoredResponse]:
+        try:
+            return await self.store.get(key)
+        except Exception as e:
+            # Handled as a first request; retries may then run again
+            logger.warning("Could not get response for idempotency key: %s", e)
+            return None
+
+    async def _save(
+        self, key: str, response: web.StreamResponse, fingerprint: str
+    ) -> Optional[StoredResponse]:
+        if response.status >= 500 or not isinstance(response, web.Response):
+            return None
+        body = response.body
+        if not isinstance(body, bytes):
+            # Streamed or payload bodies cannot be played back
+            return None
+        stored = StoredResponse(
+            response.status, body, response.content_type, fingerprint, response.charset
+        )
+        try:
+            await self.store.save(key, stored)
+        except Exception as e:
+            # The request itself succeeded; only its retries will run again
+            logger.warning("Could not save response for idempotency key: %s", e)
+        return stored
+
+
+def _replay(stored: StoredResponse, fingerprint: str) -> web.Response:
+    if stored.fingerprint != fingerprint:
+        raise web.HTTPUnprocessableEntity(
+            text=json.dumps(
+                {
+                    "errors": [
+                        f"{IDEMPOTENCY_KEY_HEADER} was already used for "
+                        "a different request."
+                    ]
+                }
+            ),
+            content_type="application/json",
+        )
+    return web.Response(
+        status=stored.status,
+        body=stored.body,
+        content_type=stored.content_type,
+        charset=stored.charset,
+        headers={IDEMPOTENT_REPLAYED_HEADER: "true"},
+    )
@@ -0,0 +1,24 @@
+"""
+Request-scoped identity maps for aiohttp apps
+
+    app.middlewares.append(identity_map_middleware)
+
+Each request is handled within its own `aiokea.identity_map.identity_scope`,
+so IdentityMappedService lookups repeated while handling it hit the
+database once, and nothing loaded for one request is seen by another.
+"""
+
+from typing import Awaitable, Callable
+
+from aiohttp import web
+
+from aiokea.identity_map import identity_scope
+
+
+@web.middleware
+async def identity_map_middleware(
+    request: web.Request,
+    handler: Callable[[web.Request], Awaitable[web.StreamResponse]],
+) -> web.StreamResponse:
+    with identity_scope():
+        return await handler(request)
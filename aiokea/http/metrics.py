@@ -0,0 +1,306 @@
+"""
+Request metrics for aiohttp apps, served in the Prometheus text format
+
+    metrics = HTTPMetrics()
+    metrics.setup(app)  # middleware plus GET /metrics
+    metrics.track_hedging("users", hedged_user_service)  # optional
+
+Counters are plain integers touched only from the event loop, so recording
+a request takes no locks. They are also per process: with `run_workers`,
+a scrape is answered by whichever worker accepts it, with only that worker's
+share of the traffic.
+"""
+
+import bisect
+import time
+from abc import ABC, abstractmethod
+from typing import (
+    TYPE_CHECKING,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from aiohttp import web
+
+if TYPE_CHECKING:
+    from aiokea.hedging import HedgedService
+
+# Prometheus client defaults, plus finer resolution below 5ms
+DEFAULT_LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+DEFAULT_SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+# Route label for requests that matched no route, so arbitrary paths
+# cannot blow up the number of series
+UNMATCHED_ROUTE = "unmatched"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = Tuple[str, ...]
+
+
+class _Metric(ABC):
+    type_name = ""
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str]):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.type_name}"
+        yield from self._render_samples()
+
+    @abstractmethod
+    def _render_samples(self) -> Iterator[str]:
+        pass
+
+    def _sample(self, name: str, labels: Labels, value: float, **extra: str) -> str:
+        pairs = list(zip(self.label_names, labels)) + list(extra.items())
+        label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in pairs)
+        return f"{name}{{{label_text}}} {_format_value(value)}"
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str]):
+        super().__init__(name, help, label_names)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _render_samples(self) -> Iterator[str]:
+        for labels, value in sorted(self._values.items()):
+            yield self._sample(self.name, labels, value)
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, labels: Labels, amount: float = 1) -> None:
+        self.inc(labels, -amount)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: Sequence[str],
+        buckets: Sequence[float],
+    ):
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: a count per bucket plus one for +Inf, then the sum
+        self._counts: Dict[Labels, List[int]] = {}
+        self._sums: Dict[Labels, float] = {}
+
+    def observe(self, labels: Labels, value: float) -> None:
+        counts = self._counts.get(labels)
+        if counts is None:
+            counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+            self._sums[labels] = 0.0
+        # Buckets are upper bounds, inclusive
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[labels] += value
+
+    def _render_samples(self) -> Iterator[str]:
+        for labels, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield self._sample(
+                    f"{self.name}_bucket", labels, cumulative, le=_format_value(bound)
+                )
+            cumulative += counts[-1]
+            yield self._sample(f"{self.name}_bucket", labels, cumulative, le="+Inf")
+            yield self._sample(f"{self.name}_sum", labels, self._sums[labels])
+            yield self._sample(f"{self.name}_count", labels, cumulative)
+
+
+class HTTPMetrics:
+    """
+    Per-route request counts, latencies, sizes and in-flight gauges
+
+    Routes are labelled by their pattern, e.g. `/api/v1/users/{id}`, not by
+    the requested path. Request sizes come from Content-Length and response
+    sizes from the response's content length, so chunked bodies count as 0.
+    """
+
+    def __init__(
+        self,
+        namespace: str = "aiokea_http",
+        latency_buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+        size_buckets: Sequence[float] = DEFAULT_SIZE_BUCKETS,
+    ):
+        route_labels = ("method", "route")
+        self.requests = Counter(
+            f"{namespace}_requests_total",
+            "HTTP requests completed.",
+            route_labels + ("status",),
+        )
+        self.in_flight = Gauge(
+            f"{namespace}_requests_in_flight",
+            "HTTP requests being handled.",
+            route_labels,
+        )
+        self.latency = Histogram(
+            f"{namespace}_request_duration_seconds",
+            "Time to handle HTTP requests.",
+            route_labels,
+            latency_buckets,
+        )
+        self.request_size = Histogram(
+            f"{namespace}_request_size_bytes",
+            "HTTP request body sizes.",
+            route_labels,
+            size_buckets,
+        )
+        self.response_size = Histogram(
+            f"{namespace}_response_size_bytes",
+            "HTTP response body sizes.",
+            route_labels,
+            size_buckets,
+        )
+        self._collectors: List[Callable[[], Iterable[_Metric]]] = []
+        self._hedging: Optional[_HedgingCollector] = None
+
+    def setup(self, app: web.Application, path: str = "/metrics") -> None:
+        app.middlewares.append(self.middleware)
+        app.router.add_get(path, self.handler)
+
+    def register(self, collect: Callable[[], Iterable[_Metric]]) -> None:
+        """Also render the metrics returned by `collect` on every scrape"""
+        self._collectors.append(collect)
+
+    def track_hedging(self, name: str, service: "HedgedService") -> None:
+        """Export the stats of a HedgedService, labelled `service="<name>"`"""
+        if self._hedging is None:
+            self._hedging = _HedgingCollector()
+            self.register(self._hedging.collect)
+        self._hedging.services[name] = service
+
+    @web.middleware
+    async def middleware(
+        self,
+        request: web.Request,
+        handler: Callable[[web.Request], Awaitable[web.StreamResponse]],
+    ) -> web.StreamResponse:
+        labels = (request.method, _route(request))
+        self.in_flight.inc(labels)
+        started = time.monotonic()
+        status = web.HTTPInternalServerError.status_code
+        response_size = 0
+        try:
+            response = await handler(request)
+            status = response.status
+            response_size = response.content_length or 0
+            return response
+        except web.HTTPException as e:
+            status = e.status
+            response_size = e.content_length or 0
+            raise
+        finally:
+            self.in_flight.dec(labels)
+            self.latency.observe(labels, time.monotonic() - started)
+            self.requests.inc(labels + (str(status),))
+            self.request_size.observe(labels, request.content_length or 0)
+            self.response_size.observe(labels, response_size)
+
+    async def handler(self, request: web.Request) -> web.Response:
+        """GET handler serving every metric in the Prometheus text format"""
+        return web.Response(
+            body=self.render().encode(), headers={"Content-Type": CONTENT_TYPE}
+        )
+
+    def render(self) -> str:
+        metrics = [
+            self.requests,
+            self.in_flight,
+            self.latency,
+            self.request_size,
+            self.response_size,
+        ]
+        for collect in self._collectors:
+            metrics.extend(collect())
+        return "".join(f"{line}\n" for metric in metrics for line in metric.render())
+
+
+class _HedgingCollector:
+    """Reads, hedges fired, won and skipped per tracked HedgedService"""
+
+    def __init__(self, namespace: str = "aiokea_hedging"):
+        self.namespace = namespace
+        self.services: Dict[str, "HedgedService"] = {}
+
+    def collect(self) -> List[Counter]:
+        # Services count on their own, so fresh counters copy their totals
+        counters = [
+            Counter(
+                f"{self.namespace}_reads_total",
+                "Reads made through hedged services.",
+                ("service",),
+            ),
+            Counter(
+                f"{self.namespace}_fired_total",
+                "Second attempts started by hedged services.",
+                ("service",),
+            ),
+            Counter(
+                f"{self.namespace}_won_total",
+                "Second attempts that finished first.",
+                ("service",),
+            ),
+            Counter(
+                f"{self.namespace}_skipped_total",
+                "Reads slow enough to hedge, but over budget.",
+                ("service",),
+            ),
+        ]
+        for name, service in self.services.items():
+            stats = service.stats
+            values = [stats.reads, stats.fired, stats.won, stats.skipped]
+            for counter, value in zip(counters, values):
+                counter.inc((name,), value)
+        return counters
+
+
+def _route(request: web.Request) -> str:
+    route = request.match_info.route
+    resource = route.resource if route is not None else None
+    if resource is None:
+        return UNMATCHED_ROUTE
+    return resource.canonical
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    return repr(value) if isinstance(value, float) else str(value)
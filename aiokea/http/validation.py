@@ -0,0 +1,159 @@
+"""
+Compiled loaders for marshmallow schemas
+
+marshmallow's `Schema.load` goes through hooks, error stores and a getter per
+field on every call. `compile_loader` turns a schema's field definitions into
+straight-line Python once, which accepts valid data with a type check per
+field for the common field types and calls the field's own `deserialize` for
+the rest.
+
+Compiled loaders only ever accept data; anything they cannot vouch for comes
+back as INVALID, to be loaded again by marshmallow, so errors keep exactly the
+shape and messages marshmallow gives them.
+"""
+
+from typing import Any, Callable, Dict, List, Optional
+
+import marshmallow
+from marshmallow import fields
+
+# Returned in place of the loaded data the loader could not vouch for
+INVALID = object()
+
+# Hooks that would have to run on load; schemas using them are left to marshmallow
+LOAD_HOOKS = {"pre_load", "post_load", "validates", "validates_schema"}
+
+# Field types whose valid values include those of a Python type, loaded
+# unchanged, as long as the field keeps the type's default options
+_FAST_CHECKS = {
+    fields.String: "type(value) is str",
+    fields.Boolean: "value is True or value is False",
+    fields.Integer: "type(value) is int",
+}
+
+
+def compile_loader(
+    schema: marshmallow.Schema, many: bool = False
+) -> Optional[Callable[[Any], Any]]:
+    """
+    Compile a function loading data the way `schema.load` would
+
+    With `many`, the function takes a list and returns a list with the loaded
+    data or INVALID for each item, in one pass. Returns None for schemas the
+    compiled loader cannot reproduce, such as those with load hooks.
+    """
+    if not _is_compilable(schema):
+        return None
+    namespace: Dict[str, Any] = {
+        "INVALID": INVALID,
+        "MISSING": marshmallow.missing,
+        "FieldError": marshmallow.ValidationError,
+    }
+    fail = "append(INVALID); continue" if many else "return INVALID"
+    body = _type_check(schema, namespace, fail)
+    for index, (name, field) in enumerate(schema.load_fields.items()):
+        body += _field_load(index, name, field, namespace, fail)
+    if schema.unknown == marshmallow.INCLUDE:
+        body += [
+            "for key in data.keys() - KNOWN:",
+            "    loaded[key] = data[key]",
+        ]
+
+    if many:
+        lines = [
+            "def load_many(items):",
+            "    results = []",
+            "    append = results.append",
+            "    for data in items:",
+            *_indent(body, 2),
+            "        append(loaded)",
+            "    return results",
+        ]
+    else:
+        lines = ["def load(data):", *_indent(body, 1), "    return loaded"]
+    filename = f"<compiled loader for {type(schema).__name__}>"
+    exec(compile("\n".join(lines), filename, "exec"), namespace)
+    return namespace["load_many" if many else "load"]
+
+
+def _is_compilable(schema: marshmallow.Schema) -> bool:
+    # Empty lists are left behind for every tag marshmallow has looked up
+    hooks = {
+        tag[0] if isinstance(tag, tuple) else tag
+        for tag, tag_hooks in schema._hooks.items()
+        if tag_hooks
+    }
+    return (
+        not hooks & LOAD_HOOKS
+        and not schema.many
+        # None since marshmallow 3.13, False before
+        and not schema.partial
+        and all(
+            "." not in (field.attribute or name)
+            for name, field in schema.load_fields.items()
+        )
+    )
+
+
+def _type_check(schema: marshmallow.Schema, namespace: Dict, fail: str) -> List[str]:
+    namespace["KNOWN"] = frozenset(
+        field.data_key if field.data_key is not None else name
+        for name, field in schema.load_fields.items()
+    )
+    lines = ["if type(data) is not dict:", f"    {fail}"]
+    if schema.unknown == marshmallow.RAISE:
+        lines += ["if not data.keys() <= KNOWN:", f"    {fail}"]
+    return lines + ["loaded = {}"]
+
+
+def _field_load(
+    index: int, name: str, field: fields.Field, namespace: Dict, fail: str
+) -> List[str]:
+    key = field.data_key if field.data_key is not None else name
+    attribute = field.attribute or name
+    load_default = _load_default(field)
+    namespace[f"field_{index}"] = field
+    namespace[f"default_{index}"] = load_default
+
+    lines = [f"value = data.get({key!r}, MISSING)", "if value is MISSING:"]
+    if field.required:
+        lines.append(f"    {fail}")
+    elif load_default is marshmallow.missing:
+        lines.append("    pass")
+    elif callable(load_default):
+        lines.append(f"    loaded[{attribute!r}] = default_{index}()")
+    else:
+        lines.append(f"    loaded[{attribute!r}] = default_{index}")
+    fast_check = _FAST_CHECKS.get(type(field))
+    if fast_check is not None and _has_default_options(field):
+        lines += [f"elif {fast_check}:", f"    loaded[{attribute!r}] = value"]
+    return lines + [
+        "else:",
+        "    try:",
+        f"        loaded[{attribute!r}] = field_{index}.deserialize(value, {key!r}, data)",
+        "    except FieldError:",
+        f"        {fail}",
+    ]
+
+
+def _load_default(field: fields.Field) -> Any:
+    # Called `missing` before marshmallow 3.13, and deprecated since
+    if hasattr(field, "load_default"):
+        return field.load_default
+    return field.missing
+
+
+def _has_default_options(field: fields.Field) -> bool:
+    if field.validators:
+        return False
+    if isinstance(field, fields.Boolean):
+        # Custom truthy or falsy sets may leave out True or False
+        return (
+            field.truthy == fields.Boolean.truthy
+            and field.falsy == fields.Boolean.falsy
+        )
+    return True
+
+
+def _indent(lines: List[str], levels: int) -> List[str]:
+    return ["    " * levels + line for line in lines]
@@ -0,0 +1,149 @@
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Any, Callable, Dict, Mapping, MutableMapping
+
+from aiohttp import web
+
+from aiokea.repos.aiopg_copy import DEFAULT_MAX_COPY_CONNECTIONS
+
+logger = logging.getLogger(__name__)
+
+
+def split_pool_conf(pool_conf: Mapping, workers: int) -> MutableMapping:
+    """
+    Divide an aiopg pool config between `workers` processes
+
+    Keeps the total number of pooled connections across all workers at or
+    below what a single process would have opened. COPY connections are
+    divided too, but every worker keeps at least one.
+
+    :raises ValueError: if there are more workers than pooled connections
+    """
+    total_maxsize = pool_conf.get("maxsize", 10)
+    # A maxsize of 0 is an unbounded pool, and stays one
+    if total_maxsize and workers > total_maxsize:
+        raise ValueError(
+            f"{workers} workers cannot share a pool of maxsize {total_maxsize}"
+        )
+    split_conf = dict(pool_conf)
+    maxsize = total_maxsize // workers
+    minsize = max(1, pool_conf.get("minsize", 1) // workers)
+    split_conf["maxsize"] = maxsize
+    split_conf["minsize"] = min(minsize, maxsize) if maxsize else minsize
+    split_conf["max_copy_connections"] = max(
+        1,
+        pool_conf.get("max_copy_connections", DEFAULT_MAX_COPY_CONNECTIONS) // workers,
+    )
+    return split_conf
+
+
+def run_workers(
+    app_factory: Callable[[int], web.Application],
+    host: str,
+    port: int,
+    workers: int,
+    restart_delay: float = 1.0,
+    max_restart_delay: float = 30.0,
+    **run_app_kwargs: Any,
+) -> None:
+    """
+    Serve the app from `workers` forked processes sharing one listening socket
+
+    The socket is bound once in the supervising process and inherited by each
+    worker, so the kernel spreads incoming connections across them.
+    `app_factory` is called in the worker with its index; anything bound to
+    the event loop, such as a database engine, must be created in the app's
+    `on_startup` rather than in the factory.
+
+    SIGTERM or SIGINT to the supervisor is forwarded to every worker, which shuts
+    down gracefully through `web.run_app`. A worker exiting any other way
+    is restarted after `restart_delay` seconds, doubled for every crash in a
+    row up to `max_restart_delay`, so one failing at startup does not respawn
+    in a tight loop. A worker that ran for `max_restart_delay` seconds
+    starts over from `restart_delay`.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(socket.SOMAXCONN)
+    sock.set_inheritable(True)
+
+    children: Dict[int, int] = {}
+    started_at: Dict[int, float] = {}
+    # Crashes in a row, by worker index
+    crashes: Dict[int, int] = {}
+    stopping = False
+
+    def spawn(index: int) -> None:
+        pid = os.fork()
+        if pid:
+            children[pid] = index
+            started_at[pid] = time.monotonic()
+            return
+        # Worker process; never returns into the supervisor loop
+        exit_code = 1
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            web.run_app(app_factory(index), sock=sock, print=None, **run_app_kwargs)
+            exit_code = 0
+        except Exception:
+            logger.exception("Worker %s failed", index)
+        finally:
+            os._exit(exit_code)
+
+    def stop(signum: int, frame: Any) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                # Exited, but not reaped yet
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info("Serving on %s:%s with %s workers", host, port, workers)
+    for index in range(workers):
+        spawn(index)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        uptime = time.monotonic() - started_at.pop(pid, 0.0)
+        if index is None or stopping:
+            continue
+        if uptime >= max_restart_delay:
+            crashes[index] = 0
+        delay = _restart_delay(crashes.get(index, 0), restart_delay, max_restart_delay)
+        crashes[index] = crashes.get(index, 0) + 1
+        logger.warning(
+            "Worker %s (pid %s) exited with wait status %s, restarting in %ss",
+            index,
+            pid,
+            status,
+            delay,
+        )
+        # In steps, so a SIGTERM meanwhile is not kept waiting
+        restart_at = time.monotonic() + delay
+        while not stopping and time.monotonic() < restart_at:
+            time.sleep(min(0.1, restart_at - time.monotonic()))
+        if not stopping:
+            spawn(index)
+
+    sock.close()
+
+
+def _restart_delay(
+    crashes: int, restart_delay: float, max_restart_delay: float
+) -> float:
+    """Seconds to wait before restarting a worker after `crashes` in a row"""
+    return min(restart_delay * 2**crashes, max_restart_delay)
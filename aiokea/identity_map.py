@@ -0,0 +1,153 @@
+import contextlib
+import contextvars
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+from aiokea.abc import CompactRow, Entity, IService
+from aiokea.aggregates import Metric
+from aiokea.errors import DuplicateResourceError
+from aiokea.filters import FilterExpression
+
+
+class IdentityMap:
+    """Entities loaded within one scope, per service and id"""
+
+    def __init__(self) -> None:
+        self._entities: Dict[IService, Dict[Any, Entity]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, service: IService, id: Any) -> Optional[Entity]:
+        entity = self._entities.get(service, {}).get(id)
+        if entity is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entity
+
+    def add(self, service: IService, id: Any, entity: Entity) -> Entity:
+        """Map `entity`, unless `id` is mapped already; return the mapped entity"""
+        return self._entities.setdefault(service, {}).setdefault(id, entity)
+
+    def discard(self, service: IService, id: Any) -> None:
+        self._entities.get(service, {}).pop(id, None)
+
+
+_identity_map: contextvars.ContextVar[Optional[IdentityMap]] = contextvars.ContextVar(
+    "aiokea_identity_map", default=None
+)
+
+
+@contextlib.contextmanager
+def identity_scope() -> Iterator[IdentityMap]:
+    """
+    Give every IdentityMappedService call made within the block a fresh identity map
+
+        with identity_scope():
+            user = await user_service.get(id)
+            user = await user_service.get(id)  # served from memory
+    """
+    token = _identity_map.set(IdentityMap())
+    try:
+        yield _identity_map.get()
+    finally:
+        _identity_map.reset(token)
+
+
+def current_identity_map() -> Optional[IdentityMap]:
+    """The identity map of the enclosing `identity_scope`, if any"""
+    return _identity_map.get()
+
+
+class IdentityMappedService(IService):
+    """
+    IService wrapper serving repeated lookups from the current identity map
+
+    Within an `identity_scope`, such as an aiohttp request handled under
+    `aiokea.http.identity_map.identity_map_middleware`, every entity returned
+    by `get`, `where` or `first` is kept by id, and later `get` calls for that
+    id are answered from memory. Entities loaded again are answered with the
+    instance already mapped, so each id has a single instance per scope.
+    Writes made through this service replace or drop the entity they touched.
+    Outside a scope, calls pass straight through.
+
+    Entities are handed out as they were loaded, so changes made to one
+    without calling `update` are seen by later `get` calls in the same scope.
+    Compact and lazy `where` results are not kept, to keep them cheap.
+    """
+
+    def __init__(self, service: IService, id_field: str = "id"):
+        self.service = service
+        self.id_field = id_field
+
+    async def get(self, id: Any) -> Optional[Entity]:
+        identity_map = _identity_map.get()
+        if identity_map is None:
+            return await self.service.get(id)
+        entity = identity_map.get(self, id)
+        if entity is None:
+            entity = self._add(identity_map, await self.service.get(id))
+        return entity
+
+    async def where(
+        self,
+        filters: Optional[Iterable[FilterExpression]] = None,
+        order_by: Optional[Sequence[str]] = None,
+        compact: bool = False,
+        lazy: bool = False,
+    ) -> Sequence[Union[Entity, CompactRow]]:
+        entities = await self.service.where(filters, order_by, compact, lazy)
+        identity_map = _identity_map.get()
+        if identity_map is not None and not (compact or lazy):
+            entities = [self._add(identity_map, entity) for entity in entities]
+        return entities
+
+    async def first(
+        self,
+        filters: Optional[Iterable[FilterExpression]] = None,
+        order_by: Optional[Sequence[str]] = None,
+    ) -> Optional[Entity]:
+        entity = await self.service.first(filters, order_by)
+        return self._add(_identity_map.get(), entity)
+
+    async def aggregate(
+        self,
+        filters: Optional[Iterable[FilterExpression]] = None,
+        group_by: Sequence[str] = (),
+        metrics: Sequence[Metric] = (),
+    ) -> List[Dict[str, Any]]:
+        return await self.service.aggregate(filters, group_by, metrics)
+
+    async def create(self, entity: Entity) -> Entity:
+        created = await self.service.create(entity)
+        return self._add(_identity_map.get(), created)
+
+    async def create_many(
+        self, entities: Iterable[Entity], atomic: bool = False
+    ) -> List[Union[Entity, DuplicateResourceError]]:
+        results = await self.service.create_many(entities, atomic=atomic)
+        identity_map = _identity_map.get()
+        for result in results:
+            if not isinstance(result, DuplicateResourceError):
+                self._add(identity_map, result)
+        return results
+
+    async def update(self, entity: Entity) -> Entity:
+        identity_map = _identity_map.get()
+        if identity_map is not None:
+            # Should the update fail, the entity may have been changed anyway
+            identity_map.discard(self, getattr(entity, self.id_field))
+        updated = await self.service.update(entity)
+        return self._add(identity_map, updated)
+
+    async def delete(self, id: Any) -> Entity:
+        identity_map = _identity_map.get()
+        if identity_map is not None:
+            identity_map.discard(self, id)
+        return await self.service.delete(id)
+
+    def _add(
+        self, identity_map: Optional[IdentityMap], entity: Optional[Entity]
+    ) -> Optional[Entity]:
+        if identity_map is None or entity is None:
+            return entity
+        return identity_map.add(self, getattr(entity, self.id_field), entity)
@@ -0,0 +1,30 @@
+"""
+IRepo implementations
+
+Backends are imported on first attribute access, so `import aiokea.repos`
+does not pay for database drivers the process never uses.
+"""
+
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from aiokea.repos.aiopg import AIOPGRepo
+    from aiokea.repos.sqlite import SQLiteRepo
+
+_LAZY_ATTRIBUTES = {
+    "AIOPGRepo": "aiokea.repos.aiopg",
+    "SQLiteRepo": "aiokea.repos.sqlite",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name: str) -> Any:
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name), name)
+    # Cache on the package so later lookups skip __getattr__
+    globals()[name] = value
+    return value
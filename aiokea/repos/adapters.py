@@ -31,11 +31,23 @@ class BaseMarshmallowSQLAlchemyRepoAdapter(ABC):
         """
         Load repo query result data into Entity
 
-        Override if you need to decouple entity fields from db schema
+        Override `to_entity_sync` instead if you need to decouple entity fields
+        from db schema, so lazily built results are loaded the same way.
+        Adapters overriding this method still work, but have every result
+        loaded through it eagerly, `where(lazy=True)` included.
 
         Not actually async, but needs to be marked async for use in
         async iterators and other async repo patterns
         """
+        return self.to_entity_sync(data)
+
+    @property
+    def loads_sync(self) -> bool:
+        """Whether `to_entity_sync` loads entities the way `to_entity` does"""
+        return type(self).to_entity is BaseMarshmallowSQLAlchemyRepoAdapter.to_entity
+
+    def to_entity_sync(self, data: Mapping) -> Entity:
+        """Load repo query result data into Entity, for callers outside a coroutine"""
         return self.entity_class(**data)
 
     def from_entity(self, entity: Entity) -> Mapping:
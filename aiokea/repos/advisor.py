@@ -0,0 +1,429 @@
+"""
+Filter-shape recorder and index advisor for AIOPGRepo
+
+A FilterShapeRecorder passed to AIOPGRepo counts every `where` and `first`
+call by the shape of its filters: which fields are compared with which
+operators, without the values. `advise` then EXPLAINs the costliest shapes
+and reports those that sequentially scan large tables, along with an index
+that would serve them.
+
+Shapes are EXPLAINed as generic plans, the plan Postgres would use for any
+values, so no filter values are ever kept. This needs Postgres 12 or later.
+
+From the command line, against a snapshot saved with
+`json.dump(recorder.snapshot(), file)`:
+
+    $ python -m aiokea.repos.advisor snapshot.json --dsn "dbname=app" --top 10
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import sys
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+import sqlalchemy as sa
+
+from aiokea.filters import (
+    CONTAINS,
+    EQ,
+    GT,
+    GTE,
+    IN,
+    LT,
+    LTE,
+    PREFIX,
+    SEARCH,
+    And,
+    Filter,
+    FilterExpression,
+    Not,
+    Or,
+    iter_filters,
+    normalize,
+    parse_filter_expression,
+    parse_sort_key,
+)
+from aiokea.repos.sqlalchemy import (
+    TEXT_SEARCH_CONFIG,
+    order_by_clauses,
+    where_clause_from_filters,
+)
+
+if TYPE_CHECKING:
+    import aiopg.sa
+
+DEFAULT_MAX_SHAPES = 1000
+DEFAULT_TOP = 10
+DEFAULT_MIN_ROWS = 10000
+
+# Stands in for every filter value in a shape
+PLACEHOLDER = "?"
+
+_PREPARED_NAME = "aiokea_advisor"
+_PYFORMAT_PARAM_REGEX = re.compile(r"%\((\w+)\)s")
+
+
+class FilterShape(NamedTuple):
+    table: str
+    # Normalized filter expression with every value replaced by PLACEHOLDER,
+    # e.g. `and(is_enabled.eq.?,username.eq.?)`; empty for no filters
+    filters: str
+    sort: Tuple[str, ...] = ()
+
+
+class ShapeStats:
+    """Calls and latency seen for one FilterShape"""
+
+    def __init__(
+        self,
+        shape: FilterShape,
+        count: int = 0,
+        total_latency: float = 0.0,
+        max_latency: float = 0.0,
+    ):
+        self.shape = shape
+        self.count = count
+        self.total_latency = total_latency
+        self.max_latency = max_latency
+
+    @property
+    def mean_latency(self) -> float:
+        return self.total_latency / self.count if self.count else 0.0
+
+    def add(self, latency: float) -> None:
+        self.count += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "table": self.shape.table,
+            "filters": self.shape.filters,
+            "sort": list(self.shape.sort),
+            "count": self.count,
+            "total_latency": self.total_latency,
+            "max_latency": self.max_latency,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "ShapeStats":
+        return cls(
+            FilterShape(data["table"], data["filters"], tuple(data.get("sort", ()))),
+            count=data["count"],
+            total_latency=data["total_latency"],
+            max_latency=data["max_latency"],
+        )
+
+
+class FilterShapeRecorder:
+    """
+    Counts calls and latency per filter shape
+
+    Holds at most `max_shapes` shapes, since clients choose their filters;
+    calls with a shape beyond that are not recorded.
+    """
+
+    def __init__(self, max_shapes: int = DEFAULT_MAX_SHAPES):
+        self.max_shapes = max_shapes
+        self._stats: Dict[FilterShape, ShapeStats] = {}
+
+    def record(
+        self,
+        table: str,
+        filters: Iterable[FilterExpression],
+        latency: float,
+        sort: Iterable[str] = (),
+    ) -> None:
+        shape = FilterShape(table, filter_shape(filters), tuple(sort))
+        stats = self._stats.get(shape)
+        if stats is None:
+            if len(self._stats) >= self.max_shapes:
+                return
+            stats = self._stats[shape] = ShapeStats(shape)
+        stats.add(latency)
+
+    def top(self, n: int = DEFAULT_TOP) -> List[ShapeStats]:
+        """The `n` shapes the database spent the most time on"""
+        return sorted(
+            self._stats.values(), key=lambda stats: stats.total_latency, reverse=True
+        )[:n]
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Every shape's stats as JSON-serializable dicts, costliest first"""
+        return [stats.to_dict() for stats in self.top(len(self._stats))]
+
+    def clear(self) -> None:
+        self._stats.clear()
+
+
+class Advice(NamedTuple):
+    stats: ShapeStats
+    # (relation, estimated rows) for every large table the plan scans sequentially
+    seq_scans: List[Tuple[str, int]]
+    suggested_indexes: List[str]
+
+
+def filter_shape(filters: Iterable[FilterExpression]) -> str:
+    """Render filters as a shape, the same for any values and operand order"""
+    expression = normalize(And(*filters))
+    if isinstance(expression, And) and not expression.operands:
+        return ""
+    return _render_shape(expression)
+
+
+def _render_shape(expression: FilterExpression) -> str:
+    if isinstance(expression, Not):
+        return f"not({_render_shape(expression.operand)})"
+    if isinstance(expression, (And, Or)):
+        name = "and" if isinstance(expression, And) else "or"
+        # Operands differing only in value have the same shape
+        operands = sorted({_render_shape(operand) for operand in expression.operands})
+        if len(operands) == 1:
+            return operands[0]
+        return f"{name}({','.join(operands)})"
+    if expression.operator == IN:
+        return f"{expression.field}.{IN}.({PLACEHOLDER})"
+    return f"{expression.field}.{expression.operator}.{PLACEHOLDER}"
+
+
+def suggest_indexes(
+    table: str, expression: FilterExpression, sort: Iterable[str] = ()
+) -> List[str]:
+    """
+    Suggest indexes serving `expression`, one per branch of a top-level OR
+
+    Each index leads with the fields compared for equality or inclusion,
+    followed by at most one range-compared field, which is as far as a B-tree
+    can narrow down a scan. Negated and not-equal predicates are not selective
+    enough to be worth indexing.
+
+    With `sort` keys, as passed to `order_by`, the sort fields follow the
+    equality fields instead, provided any range-compared field is the first
+    of them, so rows come out of the index already sorted.
+
+    A B-tree cannot serve text filters, so a branch with any gets a GIN index
+    per text-filtered field instead: trigram for prefix and contains, which
+    needs the pg_trgm extension, and full-text for search.
+    """
+    sort_keys = [parse_sort_key(key) for key in sort]
+    # A B-tree reads backwards just as well, so directions only need spelling
+    # out when they differ
+    mixed = len({descending for _, descending in sort_keys}) > 1
+    expression = normalize(expression)
+    branches = expression.operands if isinstance(expression, Or) else (expression,)
+    suggestions: List[str] = []
+    for branch in branches:
+        conjuncts = branch.operands if isinstance(branch, And) else (branch,)
+        predicates = [f for f in conjuncts if isinstance(f, Filter)]
+        text_indexes = [_text_index(table, f) for f in predicates]
+        if any(text_indexes):
+            for suggestion in text_indexes:
+                if suggestion and suggestion not in suggestions:
+                    suggestions.append(suggestion)
+            continue
+        equality = [f.field for f in predicates if f.operator in (EQ, IN)]
+        ranges = [f.field for f in predicates if f.operator in (GT, GTE, LT, LTE)]
+        columns = [_quote(field) for field in dict.fromkeys(equality)]
+        if sort_keys and (not ranges or ranges[0] == sort_keys[0][0]):
+            columns.extend(
+                _quote(field) + (" DESC" if descending and mixed else "")
+                for field, descending in sort_keys
+                if field not in equality
+            )
+        else:
+            columns.extend(_quote(field) for field in ranges[:1])
+        if not columns:
+            continue
+        suggestion = "CREATE INDEX CONCURRENTLY ON {} ({})".format(
+            _quote(table), ", ".join(columns)
+        )
+        if suggestion not in suggestions:
+            suggestions.append(suggestion)
+    return suggestions
+
+
+def _text_index(table: str, filter: Filter) -> Optional[str]:
+    if filter.operator in (PREFIX, CONTAINS):
+        indexed = f"{_quote(filter.field)} gin_trgm_ops"
+    elif filter.operator == SEARCH:
+        indexed = "to_tsvector('{}'::regconfig, {})".format(
+            TEXT_SEARCH_CONFIG, _quote(filter.field)
+        )
+    else:
+        return None
+    return f"CREATE INDEX CONCURRENTLY ON {_quote(table)} USING gin ({indexed})"
+
+
+async def advise(
+    engine: "aiopg.sa.Engine",
+    shapes: Iterable[ShapeStats],
+    min_rows: int = DEFAULT_MIN_ROWS,
+) -> List[Advice]:
+    """
+    EXPLAIN each shape and flag sequential scans of tables with `min_rows` or more
+
+    Table sizes are the planner's estimates, so a table that has never been
+    analyzed counts as empty.
+    """
+    advice: List[Advice] = []
+    async with engine.acquire() as conn:
+        for stats in shapes:
+            expression = _parse_shape(stats.shape.filters)
+            plan = await _explain_generic_plan(conn, engine, stats.shape, expression)
+            seq_scans = []
+            for relation in dict.fromkeys(_seq_scanned_relations(plan)):
+                rows = await conn.scalar(
+                    sa.text(
+                        "SELECT GREATEST(reltuples, 0)::bigint FROM pg_class "
+                        "WHERE oid = to_regclass(quote_ident(:relation))"
+                    ).bindparams(relation=relation)
+                )
+                if rows is not None and rows >= min_rows:
+                    seq_scans.append((relation, rows))
+            suggested_indexes = (
+                suggest_indexes(stats.shape.table, expression, stats.shape.sort)
+                if seq_scans
+                else []
+            )
+            advice.append(Advice(stats, seq_scans, suggested_indexes))
+    return advice
+
+
+def format_report(advice: Iterable[Advice]) -> str:
+    lines = []
+    for item in advice:
+        shape = item.stats.shape
+        lines.append(
+            "{} {}: {} calls, mean {:.1f}ms, max {:.1f}ms".format(
+                shape.table,
+                shape.filters or "(no filters)",
+                item.stats.count,
+                item.stats.mean_latency * 1000,
+                item.stats.max_latency * 1000,
+            )
+        )
+        for relation, rows in item.seq_scans:
+            lines.append(f"  Seq Scan on {relation} (~{rows} rows)")
+        for suggestion in item.suggested_indexes:
+            lines.append(f"  suggest: {suggestion}")
+    return "\n".join(lines)
+
+
+def _parse_shape(filters: str) -> FilterExpression:
+    if not filters:
+        return And()
+    return parse_filter_expression(filters)
+
+
+async def _explain_generic_plan(
+    conn: "aiopg.sa.SAConnection",
+    engine: "aiopg.sa.Engine",
+    shape: FilterShape,
+    expression: FilterExpression,
+) -> Any:
+    # A lightweight table is enough to compile against, so the advisor needs
+    # neither the application's metadata nor reflection
+    fields = dict.fromkeys(f.field for f in iter_filters(expression))
+    sort_fields = dict.fromkeys(parse_sort_key(key)[0] for key in shape.sort)
+    table = sa.table(
+        shape.table, *(sa.column(field) for field in {**fields, **sort_fields})
+    )
+    select = (
+        sa.select([sa.literal_column("*")])
+        .select_from(table)
+        .order_by(*order_by_clauses(table, shape.sort))
+    )
+    if fields:
+        select = select.where(where_clause_from_filters(table, [expression]))
+    sql, param_count = _numbered_params(str(select.compile(dialect=engine.dialect)))
+
+    # A generic plan does not depend on parameter values, so NULL will do
+    await conn.execute("SET plan_cache_mode = force_generic_plan")
+    try:
+        await conn.execute(f"PREPARE {_PREPARED_NAME} AS {sql}")
+        try:
+            args = f"({', '.join(['NULL'] * param_count)})" if param_count else ""
+            plan = await conn.scalar(
+                f"EXPLAIN (FORMAT JSON) EXECUTE {_PREPARED_NAME}{args}"
+            )
+        finally:
+            await conn.execute(f"DEALLOCATE {_PREPARED_NAME}")
+    finally:
+        await conn.execute("RESET plan_cache_mode")
+    return json.loads(plan) if isinstance(plan, str) else plan
+
+
+def _numbered_params(sql: str) -> Tuple[str, int]:
+    """Turn psycopg2's `%(name)s` parameters into PREPARE's `$1`, `$2`, ..."""
+    numbers: Dict[str, int] = {}
+
+    def number(match: "re.Match") -> str:
+        return f"${numbers.setdefault(match.group(1), len(numbers) + 1)}"
+
+    sql = _PYFORMAT_PARAM_REGEX.sub(number, sql).replace("%%", "%")
+    return sql, len(numbers)
+
+
+def _seq_scanned_relations(plan: Any) -> Iterator[str]:
+    nodes = [entry["Plan"] for entry in plan]
+    while nodes:
+        node = nodes.pop()
+        if node.get("Node Type") == "Seq Scan":
+            yield node["Relation Name"]
+        nodes.extend(node.get("Plans", ()))
+
+
+def _quote(identifier: str) -> str:
+    return '"{}"'.format(identifier.replace('"', '""'))
+
+
+async def _main(args: argparse.Namespace) -> int:
+    from aiopg.sa import create_engine
+
+    with open(args.snapshot) as snapshot_file:
+        shapes = [ShapeStats.from_dict(data) for data in json.load(snapshot_file)]
+    shapes.sort(key=lambda stats: stats.total_latency, reverse=True)
+
+    engine = await create_engine(args.dsn, minsize=1, maxsize=1)
+    try:
+        advice = await advise(engine, shapes[: args.top], min_rows=args.min_rows)
+    finally:
+        engine.close()
+        await engine.wait_closed()
+    print(format_report(advice))
+    return 1 if any(item.seq_scans for item in advice) else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Report filter shapes that sequentially scan large tables"
+    )
+    parser.add_argument("snapshot", help="JSON file of FilterShapeRecorder.snapshot()")
+    parser.add_argument("--dsn", required=True, help="libpq connection string")
+    parser.add_argument(
+        "--top", type=int, default=DEFAULT_TOP, help="Costliest shapes to EXPLAIN"
+    )
+    parser.add_argument(
+        "--min-rows",
+        type=int,
+        default=DEFAULT_MIN_ROWS,
+        help="Only flag sequential scans of tables with at least this many rows",
+    )
+    return asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,72 +1,339 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import contextvars
+import time
 from typing import (
+    TYPE_CHECKING,
     Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
     Iterable,
     List,
     Optional,
     Mapping,
+    Sequence,
+    Tuple,
+    Union,
 )
 
-import aiopg.sa
-import psycopg2
 import sqlalchemy as sa
-from aiopg.sa.result import RowProxy, ResultProxy
-from sqlalchemy.dialects.postgresql import Insert
-from sqlalchemy.sql.elements import BinaryExpression
-from sqlalchemy.sql import and_, Select, Update, Delete
-from sqlalchemy.sql.schema import Column
+
+from aiokea.abc import CompactRow, IRepo, Entity
+from aiokea.aggregates import Metric
+from aiokea.errors import (
+    DuplicateResourceError,
+    ResourceNotFoundError,
+    StatementTimeoutError,
+)
+from aiokea.filters import Filter, FilterExpression, FilterOperators
+from aiokea.repos import aiopg_copy, notifications
+from aiokea.repos.batching import MicroBatcher
+from aiokea.repos.results import LazyEntities, from_values
+from aiokea.repos.sqlalchemy import (
+    aggregate_select,
+    compact_row_factory,
+    order_by_clauses,
+    where_clause_from_filters,
+)
+
+if TYPE_CHECKING:
+    # aiopg, psycopg2 and the postgres dialect are only needed once an engine
+    # exists, and whoever created the engine has already imported them
+    import aiopg.sa
+    from aiopg.sa.result import RowProxy, ResultProxy
+    from sqlalchemy.dialects.postgresql import Insert
+    from sqlalchemy.sql.elements import BinaryExpression
+    from sqlalchemy.sql import ClauseElement, Select, Update, Delete
+
+    from aiokea.repos.adapters import BaseMarshmallowSQLAlchemyRepoAdapter
+    from aiokea.repos.advisor import FilterShapeRecorder
+    from aiokea.repos.slow_queries import SlowQueryLog
+
+DEFAULT_CREATE_BATCH_SIZE = 100
+
+# Seconds to wait for a cancelled statement to wind down before giving up on
+# its connection entirely
+CANCEL_GRACE_PERIOD = 1.0
+
+# Marks that no `statement_timeout` block is active, as None means no timeout
+_UNSET: Any = object()
+
+_statement_timeout: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "aiokea_statement_timeout", default=_UNSET
+)
 
 
-from aiokea.abc import IRepo, Entity
-from aiokea.errors import DuplicateResourceError, ResourceNotFoundError
-from aiokea.filters import Filter, FilterOperators
-from aiokea.repos.adapters import BaseMarshmallowSQLAlchemyRepoAdapter
+@contextlib.contextmanager
+def statement_timeout(seconds: Optional[float]) -> Iterator[None]:
+    """
+    Override the statement timeout of every AIOPGRepo call made within the block
+
+        with statement_timeout(0.5):
+            users = await user_repo.where(filters)
+
+    `statement_timeout(None)` lets statements within the block run for as long
+    as they take, whatever the repo's own `statement_timeout`.
+    """
+    token = _statement_timeout.set(seconds)
+    try:
+        yield
+    finally:
+        _statement_timeout.reset(token)
 
 
 class AIOPGRepo(IRepo):
+    """
+    IRepo backed by Postgres through aiopg
+
+    Statements are cancelled on the server when they run past `statement_timeout`
+    seconds, raising StatementTimeoutError, or when the calling task is cancelled.
+    A cancelled statement leaves its connection usable, so it goes straight back
+    to the pool instead of staying busy until the query finishes on its own.
+
+    With a `notify_channel`, every write also sends a NOTIFY on that channel
+    carrying the table, id and operation of each row it touched, for an
+    AIOPGChangeListener on every node to invalidate its caches with.
+    The NOTIFY shares the write's transaction, so it is delivered if and only if
+    the write commits.
+
+    With a `create_batch_window`, concurrent `create` calls arriving within that
+    many seconds of each other, up to `create_batch_size` of them, are written
+    together by `create_many`: one multi-row INSERT and one commit for the lot.
+    Each caller still gets its own entity or its own DuplicateResourceError.
+    Batched creates run outside the caller's context, so a `statement_timeout`
+    block around `create` does not apply to them. Await `close` on shutdown,
+    before the engine is closed, to write the creates still waiting.
+
+    With a `recorder`, every `where` and `first` call is counted by the shape
+    of its filters, for `aiokea.repos.advisor` to find shapes needing an index.
+
+    With a `slow_query_log`, every statement is timed and the slow ones recorded
+    there, along with the repo operation that ran them.
+    """
+
     def __init__(
         self,
         adapter: BaseMarshmallowSQLAlchemyRepoAdapter,
         engine: aiopg.sa.Engine,
         table: sa.Table,
+        statement_timeout: Optional[float] = None,
+        notify_channel: Optional[str] = None,
+        create_batch_window: Optional[float] = None,
+        create_batch_size: int = DEFAULT_CREATE_BATCH_SIZE,
+        recorder: Optional[FilterShapeRecorder] = None,
+        slow_query_log: Optional[SlowQueryLog] = None,
     ):
         self.adapter = adapter
         self.engine = engine
         self.table = table
+        self.statement_timeout = statement_timeout
+        self.notify_channel = notify_channel
+        self.recorder = recorder
+        self.slow_query_log = slow_query_log
+        # Resolved once here rather than per statement; the engine's creator
+        # has already imported psycopg2
+        import psycopg2.errors
+
+        self._unique_violation = psycopg2.errors.UniqueViolation
+        self._create_batcher: Optional[MicroBatcher[Entity, Entity]] = None
+        if create_batch_window is not None:
+            self._create_batcher = MicroBatcher(
+                self.create_many, create_batch_window, create_batch_size
+            )
+
+    async def close(self) -> None:
+        """Write any batched creates still waiting, and refuse further ones"""
+        if self._create_batcher is not None:
+            await self._create_batcher.close()
 
     async def get(self, id: Any) -> Entity:
         where_clause: BinaryExpression = self._where_clause_from_id(id)
         select: Select = self.table.select(whereclause=where_clause).limit(1)
         async with self.engine.acquire() as conn:
-            results: ResultProxy = await conn.execute(select)
+            results: ResultProxy = await self._execute(conn, select, "get")
             if results.rowcount:
                 return await self.adapter.to_entity(await results.first())
             raise ResourceNotFoundError(
                 f"No {self.adapter.entity_class.__name__} found with {self.adapter.schema.Meta.id_field} {id}"
             )
 
-    async def where(self, filters: Optional[Iterable[Filter]] = None) -> List[Entity]:
+    async def where(
+        self,
+        filters: Optional[Iterable[FilterExpression]] = None,
+        order_by: Optional[Sequence[str]] = None,
+        compact: bool = False,
+        lazy: bool = False,
+    ) -> Sequence[Union[Entity, CompactRow]]:
+        # Materialized, as the recorder needs the filters after the query does
+        filters = list(filters or [])
         where_clause: Optional[BinaryExpression] = (
             self._where_clause_from_filters(filters) if filters else None
         )
-        select: Select = self.table.select(whereclause=where_clause)
-        async with self.engine.acquire() as conn:
-            results: ResultProxy = await conn.execute(select)
-            return [await self.adapter.to_entity(result) async for result in results]
+        select: Select = self.table.select(whereclause=where_clause).order_by(
+            *order_by_clauses(self.table, order_by or [])
+        )
+        with self._recording(filters, order_by):
+            async with self.engine.acquire() as conn:
+                results: ResultProxy = await self._execute(conn, select, "where")
+                # Compact and lazy rows are converted as they stream, so the
+                # RowProxy objects never all exist at once
+                if compact:
+                    to_compact_row = compact_row_factory(self.table)
+                    return [to_compact_row(row) async for row in results]
+                if lazy and self.adapter.loads_sync:
+                    rows = [row.as_tuple() async for row in results]
+                    return self._lazy_entities(rows)
+                return [
+                    await self.adapter.to_entity(result) async for result in results
+                ]
 
     async def first(
-        self, filters: Optional[Iterable[Filter]] = None
+        self,
+        filters: Optional[Iterable[FilterExpression]] = None,
+        order_by: Optional[Sequence[str]] = None,
     ) -> Optional[Entity]:
+        filters = list(filters or [])
         where_clause: Optional[BinaryExpression] = (
             self._where_clause_from_filters(filters) if filters else None
         )
-        select: Select = self.table.select(whereclause=where_clause).limit(1)
-        async with self.engine.acquire() as conn:
-            results: ResultProxy = await conn.execute(select)
-            if results.rowcount:
-                return await self.adapter.to_entity(await results.first())
-            return None
+        select: Select = (
+            self.table.select(whereclause=where_clause)
+            .order_by(*order_by_clauses(self.table, order_by or []))
+            .limit(1)
+        )
+        with self._recording(filters, order_by):
+            async with self.engine.acquire() as conn:
+                results: ResultProxy = await self._execute(conn, select, "first")
+                if results.rowcount:
+                    return await self.adapter.to_entity(await results.first())
+                return None
+
+    async def aggregate(
+        self,
+        filters: Optional[Iterable[FilterExpression]] = None,
+        group_by: Sequence[str] = (),
+        metrics: Sequence[Metric] = (),
+    ) -> List[Dict[str, Any]]:
+        filters = list(filters or [])
+        where_clause: Optional[BinaryExpression] = (
+            self._where_clause_from_filters(filters) if filters else None
+        )
+        select: Select = aggregate_select(self.table, where_clause, group_by, metrics)
+        keys = [*group_by, *(metric.name for metric in metrics)]
+        with self._recording(filters):
+            async with self.engine.acquire() as conn:
+                results: ResultProxy = await self._execute(conn, select, "aggregate")
+                return [{key: row[key] for key in keys} async for row in results]
+
+    async def export(
+        self,
+        filters: Optional[Iterable[FilterExpression]] = None,
+        order_by: Optional[Sequence[str]] = None,
+        fields: Optional[Sequence[str]] = None,
+        format: str = aiopg_copy.CSV,
+    ) -> AsyncIterator[bytes]:
+        """
+        Stream the rows matching every filter as CSV or NDJSON, in chunks
+
+        Runs `COPY (SELECT ...) TO STDOUT`, so rows go from Postgres to the
+        caller as bytes, without becoming entities or even Python rows.
+        `fields` picks the columns, all of them by default, named and formatted
+        as in the database rather than as the adapter would.
+
+        COPY needs a blocking connection of its own, opened through the
+        engine's `copy_gate`, so the engine must come from
+        `aiokea.repos.aiopg_engine.create_engine`. The export waits for a free
+        COPY connection, and the statement timeout does not apply.
+        """
+        gate = self._copy_gate("export")
+        columns = (
+            [getattr(self.table.c, field) for field in fields]
+            if fields is not None
+            else list(self.table.columns)
+        )
+        select: Select = sa.select(columns).order_by(
+            *order_by_clauses(self.table, order_by or [])
+        )
+        if filters:
+            select = select.where(self._where_clause_from_filters(filters))
+        sql, params = self._compile_for_copy(select)
+        async with gate.slot():
+            async for chunk in aiopg_copy.copy_to(
+                gate.connect, aiopg_copy.copy_to_sql(sql, format), params, gate.executor
+            ):
+                yield chunk
+
+    async def import_entities(
+        self,
+        batches: AsyncIterable[Sequence[Entity]],
+    ) -> aiopg_copy.ImportSummary:
+        """
+        Insert the entities of every batch in one transaction, through COPY
+
+        Each batch is copied into a temporary staging table as it arrives, so
+        only one batch is held in memory at a time. The staged rows are then
+        merged into the table with `INSERT ... ON CONFLICT DO NOTHING`:
+        rows conflicting with existing ones, or with each other, are left out
+        and counted in the summary rather than failing the import.
+
+        Like export, this runs on a blocking connection from the engine's
+        `copy_gate`. The statement timeout does not apply, and no
+        notifications are sent for the imported rows. Cancelling the import
+        cancels its statement on the server and rolls it back.
+        """
+        gate = self._copy_gate("import_entities")
+        preparer = self.engine.dialect.identifier_preparer
+        target = preparer.format_table(self.table)
+        staging = preparer.quote(f"aiokea_import_{self.table.name}")
+        columns = ", ".join(preparer.quote(column.name) for column in self.table.c)
+
+        run = aiopg_copy.run_blocking
+        # Closing the connection uncommitted rolls the import back
+        async with gate.connection() as conn:
+            await run(
+                conn,
+                gate.executor,
+                aiopg_copy.execute,
+                conn,
+                f"CREATE TEMPORARY TABLE {staging} "
+                f"(LIKE {target} INCLUDING DEFAULTS) ON COMMIT DROP",
+            )
+            staged = 0
+            async for batch in batches:
+                rows = [self.adapter.from_entity(entity) for entity in batch]
+                for batch_columns, data in aiopg_copy.csv_batches(rows):
+                    copy_columns = ", ".join(preparer.quote(c) for c in batch_columns)
+                    await run(
+                        conn,
+                        gate.executor,
+                        aiopg_copy.copy_from,
+                        conn,
+                        f"COPY {staging} ({copy_columns}) FROM STDIN "
+                        "WITH (FORMAT csv)",
+                        data,
+                    )
+                staged += len(rows)
+            inserted = await run(
+                conn,
+                gate.executor,
+                aiopg_copy.execute,
+                conn,
+                f"INSERT INTO {target} ({columns}) SELECT {columns} FROM {staging} "
+                "ON CONFLICT DO NOTHING",
+            )
+            await run(conn, gate.executor, conn.commit)
+        return aiopg_copy.ImportSummary(staged=staged, inserted=inserted)
 
     async def create(self, entity: Entity) -> Entity:
+        if self._create_batcher is not None:
+            return await self._create_batcher.submit(entity)
+
         serialized_entity: Mapping = self.adapter.from_entity(entity)
         insert: Insert = (
             self.table.insert()
@@ -74,13 +341,112 @@ class AIOPGRepo(IRepo):
             .returning(*[column for column in self.table.columns])
         )
         async with self.engine.acquire() as conn:
-            try:
-                results: ResultProxy = await conn.execute(insert)
+            async with self._write_transaction(conn):
+                results: ResultProxy = await self._execute(conn, insert, "create")
                 result = await results.fetchone()
-            except psycopg2.errors.UniqueViolation as e:
-                raise DuplicateResourceError(e)
+                await self._notify(conn, notifications.CREATE, [result])
         return await self.adapter.to_entity(result)
 
+    async def create_many(
+        self, entities: Iterable[Entity], atomic: bool = False
+    ) -> List[Union[Entity, DuplicateResourceError]]:
+        serialized_entities: List[Mapping] = [
+            self.adapter.from_entity(entity) for entity in entities
+        ]
+        if not serialized_entities:
+            return []
+        async with self.engine.acquire() as conn:
+            try:
+                rows = await self._create_rows(
+                    conn, self._insert_all, serialized_entities
+                )
+            except DuplicateResourceError:
+                if atomic:
+                    raise
+                # Retry to find out which rows conflict, under a savepoint each
+                rows = await self._create_rows(
+                    conn, self._insert_each, serialized_entities
+                )
+        return [
+            (
+                row
+                if isinstance(row, DuplicateResourceError)
+                else await self.adapter.to_entity(row)
+            )
+            for row in rows
+        ]
+
+    async def _create_rows(
+        self,
+        conn: aiopg.sa.SAConnection,
+        insert: Callable[
+            [aiopg.sa.SAConnection, List[Mapping]],
+            Awaitable[List[Union[RowProxy, DuplicateResourceError]]],
+        ],
+        serialized_entities: List[Mapping],
+    ) -> List[Union[RowProxy, DuplicateResourceError]]:
+        async with conn.begin():
+            rows = await insert(conn, serialized_entities)
+            await self._notify(
+                conn,
+                notifications.CREATE,
+                [row for row in rows if not isinstance(row, DuplicateResourceError)],
+            )
+        return rows
+
+    async def _insert_all(
+        self, conn: aiopg.sa.SAConnection, serialized_entities: List[Mapping]
+    ) -> List[RowProxy]:
+        """Insert every row or raise DuplicateResourceError for the first conflict"""
+        id_field = self.adapter.schema.Meta.id_field
+        if id_field in serialized_entities[0] and all(
+            serialized.keys() == serialized_entities[0].keys()
+            for serialized in serialized_entities
+        ):
+            # One multi-row INSERT when the rows share a column set. Postgres
+            # does not promise RETURNING order, so rows are matched up by id
+            insert: Insert = (
+                self.table.insert()
+                .values(serialized_entities)
+                .returning(*[column for column in self.table.columns])
+            )
+            results: ResultProxy = await self._execute(conn, insert, "create_many")
+            rows_by_id = {row[id_field]: row for row in await results.fetchall()}
+            return [
+                rows_by_id[serialized[id_field]] for serialized in serialized_entities
+            ]
+        rows = []
+        for serialized in serialized_entities:
+            insert = (
+                self.table.insert()
+                .values(**serialized)
+                .returning(*[column for column in self.table.columns])
+            )
+            results = await self._execute(conn, insert, "create_many")
+            rows.append(await results.fetchone())
+        return rows
+
+    async def _insert_each(
+        self, conn: aiopg.sa.SAConnection, serialized_entities: List[Mapping]
+    ) -> List[Union[RowProxy, DuplicateResourceError]]:
+        """Insert each row under its own savepoint so one conflict only loses that row"""
+        rows: List[Union[RowProxy, DuplicateResourceError]] = []
+        for serialized in serialized_entities:
+            insert: Insert = (
+                self.table.insert()
+                .values(**serialized)
+                .returning(*[column for column in self.table.columns])
+            )
+            try:
+                async with conn.begin_nested():
+                    results: ResultProxy = await self._execute(
+                        conn, insert, "create_many"
+                    )
+                    rows.append(await results.fetchone())
+            except DuplicateResourceError as e:
+                rows.append(e)
+        return rows
+
     async def update(self, entity: Entity) -> Entity:
         id = getattr(entity, self.adapter.schema.Meta.id_field)
         # Call get to make sure the resource exists; will throw error if not
@@ -95,12 +461,11 @@ class AIOPGRepo(IRepo):
             .returning(*[column for column in self.table.columns])
         )
         async with self.engine.acquire() as conn:
-            try:
-                results: ResultProxy = await conn.execute(update)
+            async with self._write_transaction(conn):
+                # TODO possibly raise a more descriptive error than DuplicateResourceError
+                results: ResultProxy = await self._execute(conn, update, "update")
                 result: RowProxy = await results.fetchone()
-            except psycopg2.errors.UniqueViolation as e:
-                # TODO possibly raise a more descriptive error
-                raise DuplicateResourceError(e)
+                await self._notify(conn, notifications.UPDATE, [result])
         return await self.adapter.to_entity(result)
 
     async def delete(self, id: Any) -> Entity:
@@ -113,25 +478,149 @@ class AIOPGRepo(IRepo):
             *[column for column in self.table.columns]
         )
         async with self.engine.acquire() as conn:
-            try:
-                results: ResultProxy = await conn.execute(delete)
+            async with self._write_transaction(conn):
+                results: ResultProxy = await self._execute(conn, delete, "delete")
                 result = await results.fetchone()
-            except psycopg2.errors.UniqueViolation as e:
-                # TODO possibly raise a more descriptive error
-                raise DuplicateResourceError(e)
+                await self._notify(conn, notifications.DELETE, [result])
         return await self.adapter.to_entity(result)
 
+    def _lazy_entities(self, rows: List[Tuple]) -> LazyEntities[Entity]:
+        keys = [column.name for column in self.table.columns]
+        return LazyEntities(rows, from_values(keys, self.adapter.to_entity_sync))
+
+    @contextlib.contextmanager
+    def _recording(
+        self, filters: List[FilterExpression], order_by: Optional[Sequence[str]] = None
+    ) -> Iterator[None]:
+        """Record the block's duration, failed or not, under the filters' shape"""
+        if self.recorder is None:
+            yield
+            return
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.recorder.record(
+                self.table.name,
+                filters,
+                time.monotonic() - started,
+                sort=order_by or (),
+            )
+
+    @contextlib.asynccontextmanager
+    async def _write_transaction(
+        self, conn: aiopg.sa.SAConnection
+    ) -> AsyncIterator[None]:
+        """Wrap a write in a transaction when it has to commit along with a NOTIFY"""
+        if self.notify_channel is None:
+            yield
+            return
+        async with conn.begin():
+            yield
+
+    async def _notify(
+        self, conn: aiopg.sa.SAConnection, operation: str, rows: List[RowProxy]
+    ) -> None:
+        if self.notify_channel is None or not rows:
+            return
+        id_field = self.adapter.schema.Meta.id_field
+        payloads = [
+            notifications.change_payload(self.table.name, row[id_field], operation)
+            for row in rows
+        ]
+        # One round trip however many rows the write touched
+        notify = sa.text(
+            "SELECT pg_notify(:channel, payload) FROM unnest(:payloads) AS payload"
+        ).bindparams(channel=self.notify_channel, payloads=payloads)
+        await self._execute(conn, notify, "notify")
+
+    async def _execute(
+        self, conn: aiopg.sa.SAConnection, query: ClauseElement, operation: str
+    ) -> ResultProxy:
+        """
+        Execute `query` for the repo method `operation` under the statement timeout
+
+        :raises DuplicateResourceError: on a unique constraint violation
+        :raises StatementTimeoutError:
+        """
+        timeout = _statement_timeout.get()
+        if timeout is _UNSET:
+            timeout = self.statement_timeout
+
+        started = time.monotonic()
+        execution = asyncio.ensure_future(conn.execute(query))
+        try:
+            done, _ = await asyncio.wait({execution}, timeout=timeout)
+        except asyncio.CancelledError:
+            # Caller went away, e.g. the HTTP client disconnected
+            await asyncio.shield(self._cancel_execution(conn, execution))
+            raise
+        if not done:
+            await asyncio.shield(self._cancel_execution(conn, execution))
+            raise StatementTimeoutError(
+                f"Statement on {self.table.name} exceeded {timeout}s timeout"
+            )
+        try:
+            results: ResultProxy = execution.result()
+        except self._unique_violation as e:
+            raise DuplicateResourceError(e)
+        if self.slow_query_log is not None:
+            self.slow_query_log.record(
+                self.engine,
+                operation,
+                self.table.name,
+                query,
+                time.monotonic() - started,
+                results.rowcount,
+            )
+        return results
+
+    async def _cancel_execution(
+        self, conn: aiopg.sa.SAConnection, execution: asyncio.Future
+    ) -> None:
+        """
+        Send a Postgres cancel request for `execution` and wait for it to stop
+
+        The cancel request travels on its own socket, and the blocking libpq call
+        runs in the default executor. If the statement has not stopped within
+        CANCEL_GRACE_PERIOD, the execution is cancelled locally, which closes the
+        connection and lets the pool replace it.
+        """
+        import psycopg2
+
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(None, conn.connection.raw.cancel)
+        except psycopg2.Error:
+            pass
+        try:
+            await asyncio.wait_for(execution, CANCEL_GRACE_PERIOD)
+        except (asyncio.CancelledError, asyncio.TimeoutError, psycopg2.Error):
+            pass
+
+    def _copy_gate(self, operation: str) -> aiopg_copy.CopyGate:
+        gate = getattr(self.engine, "copy_gate", None)
+        if gate is None:
+            raise TypeError(
+                f"{operation} needs an engine created by aiokea.repos.aiopg_engine"
+            )
+        return gate
+
+    def _compile_for_copy(self, query: ClauseElement) -> Tuple[str, Mapping]:
+        # Bind values the way aiopg does when executing a ClauseElement
+        compiled = query.compile(dialect=self.engine.dialect)
+        processors = compiled._bind_processors
+        params = {
+            key: processors[key](value) if key in processors else value
+            for key, value in compiled.construct_params().items()
+        }
+        return str(compiled), params
+
     def _where_clause_from_id(self, id: Any) -> BinaryExpression:
         id_filter = Filter(self.adapter.schema.Meta.id_field, FilterOperators.EQ, id)
         return self._where_clause_from_filters([id_filter])
 
-    def _where_clause_from_filters(self, filters: Iterable[Filter]) -> BinaryExpression:
-        eq_ands = []
-        ne_ands = []
-        for filter in filters:
-            table_col: Column = getattr(self.table.c, filter.field)
-            if filter.operator == FilterOperators.EQ:
-                eq_ands.append(table_col == filter.value)
-            elif filter.operator == FilterOperators.NE:
-                ne_ands.append(table_col != filter.value)
-        return and_(*eq_ands, *ne_ands)
+    def _where_clause_from_filters(
+        self, filters: Iterable[FilterExpression]
+    ) -> BinaryExpression:
+        return where_clause_from_filters(self.table, filters)
@@ -0,0 +1,302 @@
+"""
+COPY between Postgres and the event loop, for AIOPGRepo
+
+aiopg's asynchronous connections cannot run COPY, so COPY runs on a blocking
+psycopg2 connection in an executor thread. Data crosses between the thread and
+the event loop in chunks through a bounded queue, so memory stays constant
+however much is copied, and a slow consumer slows the COPY down rather than
+letting data pile up.
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+if TYPE_CHECKING:
+    import psycopg2.extensions
+
+CSV = "csv"
+NDJSON = "ndjson"
+
+FORMATS = {CSV, NDJSON}
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# Chunks buffered between the COPY thread and the event loop
+DEFAULT_MAX_CHUNKS = 16
+# COPY connections open at once, per process, on top of the engine's pool
+DEFAULT_MAX_COPY_CONNECTIONS = 2
+
+T = TypeVar("T")
+
+Connect = Callable[[], "psycopg2.extensions.connection"]
+
+
+class CopyGate:
+    """
+    Bounds the blocking connections COPY opens outside the engine's pool
+
+    At most `max_connections` are open at once; further COPYs wait for one
+    to close. They run in an executor of their own, with a thread per
+    connection, so a long COPY neither waits for nor holds up the threads
+    of the loop's default executor.
+    """
+
+    def __init__(self, connect: Connect, max_connections: int):
+        self.connect = connect
+        self.max_connections = max_connections
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_connections, thread_name_prefix="aiokea-copy"
+        )
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @contextlib.asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Wait until fewer than `max_connections` COPYs are running"""
+        if self._slots is None:
+            # Created on first use, to bind to the running loop
+            self._slots = asyncio.Semaphore(self.max_connections)
+        async with self._slots:
+            yield
+
+    @contextlib.asynccontextmanager
+    async def connection(self) -> AsyncIterator["psycopg2.extensions.connection"]:
+        """Open a connection in a free slot, closing it on the way out"""
+        async with self.slot():
+            loop = asyncio.get_event_loop()
+            connecting = loop.run_in_executor(self.executor, self.connect)
+            try:
+                conn = await asyncio.shield(connecting)
+            except asyncio.CancelledError:
+                connecting.add_done_callback(_close_connected)
+                raise
+            try:
+                yield conn
+            finally:
+                await asyncio.shield(loop.run_in_executor(self.executor, conn.close))
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
+
+
+async def run_blocking(
+    conn: "psycopg2.extensions.connection",
+    executor: Executor,
+    fn: Callable[..., T],
+    *args: Any,
+) -> T:
+    """
+    Call `fn(*args)`, a blocking call using `conn`, in `executor`
+
+    If the caller is cancelled, the statement running on `conn` is cancelled
+    on the server, and the call is waited for before the cancellation goes
+    on, so nothing closes `conn` while the thread is still using it.
+    """
+    loop = asyncio.get_event_loop()
+    call = loop.run_in_executor(executor, fn, *args)
+    try:
+        return await asyncio.shield(call)
+    except asyncio.CancelledError:
+        try:
+            # A cancel request travels on its own socket; safe from any thread
+            conn.cancel()
+        except Exception:
+            pass
+        await asyncio.wait({call})
+        if not call.cancelled():
+            # Expected to fail with the cancellation
+            call.exception()
+        raise
+
+
+class ImportSummary(NamedTuple):
+    # Rows copied into the staging table
+    staged: int
+    # Staged rows merged into the target table
+    inserted: int
+
+    @property
+    def conflicts(self) -> int:
+        """Staged rows left out for conflicting with a row already there"""
+        return self.staged - self.inserted
+
+
+def copy_to_sql(select_sql: str, format: str) -> str:
+    """
+    Wrap a SELECT in a `COPY ... TO STDOUT` producing `format`
+
+    CSV comes with a header row. NDJSON is one `row_to_json` object per line;
+    it is copied in CSV format with quote and delimiter characters that JSON
+    always escapes, since COPY's text format would escape JSON's backslashes.
+    """
+    if format == CSV:
+        return f"COPY ({select_sql}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+    if format == NDJSON:
+        return (
+            f"COPY (SELECT row_to_json(exported) FROM ({select_sql}) AS exported) "
+            "TO STDOUT WITH (FORMAT csv, QUOTE e'\\x01', DELIMITER e'\\x02')"
+        )
+    raise ValueError(f"Invalid format {format}. Must be one of {FORMATS}")
+
+
+async def copy_to(
+    connect: Connect,
+    sql: str,
+    params: Optional[Mapping[str, Any]] = None,
+    executor: Optional[Executor] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_chunks: int = DEFAULT_MAX_CHUNKS,
+) -> AsyncIterator[bytes]:
+    """
+    Run a `COPY ... TO STDOUT` statement, yielding its output in chunks
+
+    `params` are interpolated into `sql` by psycopg2, as COPY takes none.
+    Stopping the iteration early cancels the COPY on the server.
+    """
+    loop = asyncio.get_event_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_chunks)
+    writer = _ChunkWriter(loop, queue, chunk_size)
+    conn = await loop.run_in_executor(executor, connect)
+
+    def run_copy() -> None:
+        try:
+            with conn.cursor() as cursor:
+                cursor.copy_expert(cursor.mogrify(sql, params).decode(), writer)
+            writer.flush()
+        finally:
+            conn.close()
+
+    copy = loop.run_in_executor(executor, run_copy)
+    try:
+        while True:
+            get = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(
+                {get, copy}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if get in done:
+                yield get.result()
+                continue
+            get.cancel()
+            while not queue.empty():
+                yield queue.get_nowait()
+            # Raises whatever stopped the COPY
+            copy.result()
+            return
+    finally:
+        if not copy.done():
+            await _abort(conn, writer, queue, copy)
+
+
+async def _abort(
+    conn: "psycopg2.extensions.connection",
+    writer: "_ChunkWriter",
+    queue: asyncio.Queue,
+    copy: "asyncio.Future[None]",
+) -> None:
+    writer.aborted = True
+    try:
+        # A cancel request travels on its own socket; safe from any thread
+        conn.cancel()
+    except Exception:
+        pass
+    while not copy.done():
+        # Unblock a writer waiting for room in the queue
+        while not queue.empty():
+            queue.get_nowait()
+        await asyncio.wait({copy}, timeout=0.05)
+    if not copy.cancelled():
+        # Expected to fail with the cancellation
+        copy.exception()
+
+
+def _close_connected(connecting: "asyncio.Future") -> None:
+    # A connection opened for a caller that went away in the meantime
+    if not connecting.cancelled() and connecting.exception() is None:
+        connecting.result().close()
+
+
+class _CopyAborted(Exception):
+    pass
+
+
+class _ChunkWriter:
+    """File-like target of `copy_expert`, writing from the COPY thread"""
+
+    def __init__(
+        self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue, chunk_size: int
+    ):
+        self.loop = loop
+        self.queue = queue
+        self.chunk_size = chunk_size
+        self.aborted = False
+        self._buffer = bytearray()
+
+    def write(self, data: Any) -> None:
+        if self.aborted:
+            raise _CopyAborted()
+        # psycopg2 writes a row at a time; handing chunks over instead keeps
+        # the thread switches down to one per chunk_size bytes
+        self._buffer += data if isinstance(data, bytes) else data.encode()
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffer or self.aborted:
+            return
+        chunk = bytes(self._buffer)
+        self._buffer.clear()
+        asyncio.run_coroutine_threadsafe(self.queue.put(chunk), self.loop).result()
+
+
+def execute(conn: "psycopg2.extensions.connection", sql: str) -> int:
+    """Run `sql` on a blocking connection, returning the affected row count"""
+    with conn.cursor() as cursor:
+        cursor.execute(sql)
+        return cursor.rowcount
+
+
+def copy_from(conn: "psycopg2.extensions.connection", sql: str, data: bytes) -> None:
+    """Run a `COPY ... FROM STDIN` statement on a blocking connection, feeding `data`"""
+    with conn.cursor() as cursor:
+        cursor.copy_expert(sql, io.BytesIO(data))
+
+
+def csv_batches(rows: Iterable[Mapping[str, Any]]) -> Iterator[Tuple[List[str], bytes]]:
+    """
+    Encode rows for `COPY ... FROM STDIN WITH (FORMAT csv)`, by column set
+
+    Yields the columns and CSV data of each group of rows having the same
+    columns, so columns a row leaves out get their defaults. None is NULL,
+    and every other value is quoted, so an empty string stays one.
+    """
+    groups: Dict[Tuple[str, ...], List[str]] = {}
+    for row in rows:
+        groups.setdefault(tuple(row), []).append(
+            ",".join(_csv_value(row[column]) for column in row) + "\n"
+        )
+    for columns, lines in groups.items():
+        yield list(columns), "".join(lines).encode()
+
+
+def _csv_value(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return '"{}"'.format(str(value).replace('"', '""'))
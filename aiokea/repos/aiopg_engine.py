@@ -0,0 +1,356 @@
+"""
+aiopg engines that are warm before they serve and drop dead connections
+
+Kept apart from aiokea.repos.aiopg because building an engine needs aiopg
+and psycopg2 at import time, while using one through AIOPGRepo does not.
+"""
+
+import asyncio
+import logging
+import math
+import weakref
+from typing import Any, Awaitable, Callable, Generator, Optional
+
+import aiopg
+import psycopg2
+import psycopg2.extensions
+from aiopg.connection import TIMEOUT, Connection
+from aiopg.sa.engine import Engine, get_dialect
+
+from aiokea.repos.aiopg_copy import DEFAULT_MAX_COPY_CONNECTIONS, CopyGate
+
+logger = logging.getLogger(__name__)
+
+# libpq TCP keepalive settings, so a connection idling in the pool behind a
+# NAT or load balancer is neither dropped silently nor kept when dead
+DEFAULT_KEEPALIVES = {
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 3,
+}
+
+DEFAULT_MAX_AGE = 30 * 60.0
+DEFAULT_PRE_PING_AFTER = 1.0
+DEFAULT_PRE_PING_TIMEOUT = 5.0
+# Backoff between failed warm-ups in warm_up_with_retry
+DEFAULT_WARM_UP_RETRY_DELAY = 1.0
+DEFAULT_WARM_UP_MAX_RETRY_DELAY = 30.0
+# Seconds to wait for a blocking COPY connection to be established
+DEFAULT_COPY_CONNECT_TIMEOUT = 10.0
+
+
+class PrePingPool(aiopg.Pool):
+    """
+    aiopg.Pool that validates connections on checkout and retires old ones
+
+    A connection idle for more than `pre_ping_after` seconds runs `SELECT 1`
+    before it is handed out; one that fails, or that is older than `max_age`
+    seconds, is closed and another is taken in its place. Connections used
+    within the last `pre_ping_after` seconds are handed out unchecked, so
+    a busy pool pays nothing for the check.
+
+    Checkout is validated around the public `acquire`. `warm_up` and
+    `connect_sync` still read aiopg.Pool internals, as found in aiopg 1.1
+    through 1.4, the versions pinned in pyproject.toml.
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        max_age: Optional[float] = DEFAULT_MAX_AGE,
+        pre_ping_after: Optional[float] = DEFAULT_PRE_PING_AFTER,
+        pre_ping_timeout: float = DEFAULT_PRE_PING_TIMEOUT,
+        on_connect: Optional[Callable[[Connection], Awaitable[None]]] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(*args, on_connect=self._on_new_connection, **kwargs)
+        self.max_age = max_age
+        self.pre_ping_after = pre_ping_after
+        self.pre_ping_timeout = pre_ping_timeout
+        self._user_on_connect = on_connect
+        self._opened_at: "weakref.WeakKeyDictionary[Connection, float]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._warm = False
+
+    @property
+    def ready(self) -> bool:
+        """Whether warm_up has completed and the pool is still open"""
+        return self._warm and not self.closed
+
+    async def warm_up(self) -> None:
+        """
+        Open `minsize` connections concurrently and validate the idle ones
+
+        aiopg opens connections one after the other, so warming up in parallel
+        turns `minsize` handshakes into roughly one.
+        """
+        async with self._cond:
+            missing = max(0, self.minsize - self.size)
+            self._acquiring += missing
+            try:
+                results = await asyncio.gather(
+                    *(self._connect() for _ in range(missing)),
+                    return_exceptions=True,
+                )
+            finally:
+                self._acquiring -= missing
+            for result in results:
+                if isinstance(result, Connection):
+                    self._free.append(result)
+            self._cond.notify_all()
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            raise errors[0]
+
+        # Connections that were already there may have died in the meantime
+        for _ in range(self.freesize):
+            async with self.acquire():
+                pass
+        self._warm = True
+        logger.info("Warmed up pool with %s connections", self.size)
+
+    def connect_sync(
+        self, connect_timeout: Optional[float] = DEFAULT_COPY_CONNECT_TIMEOUT
+    ) -> psycopg2.extensions.connection:
+        """Open a blocking psycopg2 connection with the pool's settings"""
+        kwargs = dict(self._conn_kwargs)
+        if connect_timeout is not None:
+            # libpq takes whole seconds
+            kwargs.setdefault("connect_timeout", math.ceil(connect_timeout))
+        return psycopg2.connect(self._dsn, **kwargs)
+
+    def acquire(self) -> "_Acquiring":
+        """Acquire a connection that is young enough and still answers"""
+        return _Acquiring(self._acquire_usable(), self)
+
+    async def _acquire_usable(self) -> Connection:
+        while True:
+            conn = await super().acquire()
+            try:
+                usable = self._is_usable(conn) and await self._ping_if_idle(conn)
+            except BaseException:
+                await self._discard(conn)
+                raise
+            if usable:
+                return conn
+            await self._discard(conn)
+
+    async def _connect(self) -> Connection:
+        conn = await aiopg.connect(
+            self._dsn,
+            timeout=self._timeout,
+            enable_json=self._enable_json,
+            enable_hstore=self._enable_hstore,
+            enable_uuid=self._enable_uuid,
+            echo=self._echo,
+            **self._conn_kwargs,
+        )
+        try:
+            await self._on_new_connection(conn)
+        except BaseException:
+            await conn.close()
+            raise
+        return conn
+
+    async def _on_new_connection(self, conn: Connection) -> None:
+        self._opened_at[conn] = asyncio.get_event_loop().time()
+        if self._user_on_connect is not None:
+            await self._user_on_connect(conn)
+
+    def _is_usable(self, conn: Connection) -> bool:
+        if conn.closed:
+            return False
+        opened_at = self._opened_at.get(conn)
+        if self.max_age is not None and opened_at is not None:
+            if asyncio.get_event_loop().time() - opened_at > self.max_age:
+                logger.debug("Recycling connection older than %ss", self.max_age)
+                return False
+        return True
+
+    async def _ping_if_idle(self, conn: Connection) -> bool:
+        if self.pre_ping_after is None:
+            return True
+        if asyncio.get_event_loop().time() - conn.last_usage <= self.pre_ping_after:
+            return True
+        try:
+            async with conn.cursor(timeout=self.pre_ping_timeout) as cur:
+                await cur.execute("SELECT 1")
+        except (psycopg2.Error, OSError, asyncio.TimeoutError) as e:
+            logger.debug("Dropping connection that failed pre-ping: %s", e)
+            return False
+        return True
+
+    async def _discard(self, conn: Connection) -> None:
+        await conn.close()
+        # Releasing a closed connection only forgets it, making room for
+        # the new one the caller goes on to acquire
+        await self.release(conn)
+
+
+class _Acquiring:
+    """Awaitable and async context manager over a PrePingPool checkout"""
+
+    def __init__(self, checkout: Awaitable[Connection], pool: PrePingPool):
+        self._checkout = checkout
+        self._pool = pool
+        self._conn: Optional[Connection] = None
+
+    def __await__(self) -> Generator[Any, None, Connection]:
+        return self._checkout.__await__()
+
+    async def __aenter__(self) -> Connection:
+        self._conn = await self._checkout
+        return self._conn
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            await self._pool.release(conn)
+
+
+class AIOPGEngine(Engine):
+    """
+    aiopg.sa.Engine over a PrePingPool, exposing its readiness
+
+    `copy_gate` bounds the blocking connections AIOPGRepo opens for COPY.
+    """
+
+    __slots__ = ("copy_gate",)
+
+    def __init__(
+        self,
+        dialect: Any,
+        pool: PrePingPool,
+        dsn: str,
+        max_copy_connections: int = DEFAULT_MAX_COPY_CONNECTIONS,
+        copy_connect_timeout: Optional[float] = DEFAULT_COPY_CONNECT_TIMEOUT,
+    ):
+        super().__init__(dialect, pool, dsn)
+        self.copy_gate = CopyGate(
+            lambda: pool.connect_sync(copy_connect_timeout), max_copy_connections
+        )
+
+    @property
+    def ready(self) -> bool:
+        return self._pool.ready
+
+    async def warm_up(self) -> None:
+        await self._pool.warm_up()
+
+    def connect_sync(self) -> psycopg2.extensions.connection:
+        """
+        Open a blocking psycopg2 connection to the engine's database
+
+        For what aiopg's asynchronous connections cannot do, such as COPY.
+        The connection is not pooled, and blocks: use it from a thread.
+        Prefer `copy_gate`, which bounds how many are open at once.
+        """
+        return self._pool.connect_sync()
+
+    def close(self) -> None:
+        super().close()
+        self.copy_gate.close()
+
+
+async def create_engine(
+    dsn: Optional[str] = None,
+    *,
+    minsize: int = 1,
+    maxsize: int = 10,
+    timeout: float = TIMEOUT,
+    pool_recycle: float = -1,
+    max_age: Optional[float] = DEFAULT_MAX_AGE,
+    pre_ping_after: Optional[float] = DEFAULT_PRE_PING_AFTER,
+    pre_ping_timeout: float = DEFAULT_PRE_PING_TIMEOUT,
+    max_copy_connections: int = DEFAULT_MAX_COPY_CONNECTIONS,
+    copy_connect_timeout: Optional[float] = DEFAULT_COPY_CONNECT_TIMEOUT,
+    warm_up: bool = True,
+    enable_json: bool = True,
+    enable_hstore: bool = True,
+    enable_uuid: bool = True,
+    echo: bool = False,
+    on_connect: Optional[Callable[[Connection], Awaitable[None]]] = None,
+    **kwargs: Any,
+) -> AIOPGEngine:
+    """
+    Create an aiopg.sa engine whose pool is warm and keeps itself healthy
+
+    Takes the same arguments as `aiopg.sa.create_engine`, plus the PrePingPool
+    settings. TCP keepalives are enabled unless `kwargs` say otherwise.
+    COPY connections, up to `max_copy_connections` of them, are opened on top
+    of the pool's `maxsize`.
+
+    With `warm_up`, returns once `minsize` connections are open and validated.
+    Without it, returns an engine that opens connections on demand until
+    `engine.warm_up()` is awaited, typically in a background task while
+    a readiness check reports `engine.ready`.
+    """
+    kwargs = {**DEFAULT_KEEPALIVES, **kwargs}
+    pool = PrePingPool(
+        dsn,
+        minsize,
+        maxsize,
+        timeout,
+        max_age=max_age,
+        pre_ping_after=pre_ping_after,
+        pre_ping_timeout=pre_ping_timeout,
+        enable_json=enable_json,
+        enable_hstore=enable_hstore,
+        enable_uuid=enable_uuid,
+        echo=echo,
+        on_connect=on_connect,
+        pool_recycle=pool_recycle,
+        **kwargs,
+    )
+    engine = AIOPGEngine(
+        get_dialect(),
+        pool,
+        _masked_dsn(dsn, kwargs),
+        max_copy_connections,
+        copy_connect_timeout,
+    )
+    if warm_up:
+        try:
+            await engine.warm_up()
+        except BaseException:
+            engine.close()
+            await engine.wait_closed()
+            raise
+    return engine
+
+
+async def warm_up_with_retry(
+    engine: AIOPGEngine,
+    initial_delay: float = DEFAULT_WARM_UP_RETRY_DELAY,
+    max_delay: float = DEFAULT_WARM_UP_MAX_RETRY_DELAY,
+) -> None:
+    """
+    Warm `engine` up, retrying with exponential backoff until it succeeds
+
+    Meant for a background task started with `create_engine(warm_up=False)`,
+    so a database that is unreachable at boot delays readiness rather than
+    leaving the process unready for good. Cancel the task on shutdown.
+    """
+    delay = initial_delay
+    while True:
+        try:
+            await engine.warm_up()
+            return
+        except Exception:
+            logger.exception("Could not warm up pool, retrying in %ss", delay)
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+
+def _masked_dsn(dsn: Optional[str], kwargs: dict) -> str:
+    # Matches what psycopg2 reports as connection.dsn; anything that is not
+    # a plain value, such as a cursor_factory, is not a libpq parameter
+    dsn_kwargs = {k: v for k, v in kwargs.items() if isinstance(v, (str, int))}
+    params = psycopg2.extensions.parse_dsn(
+        psycopg2.extensions.make_dsn(dsn, **dsn_kwargs)
+    )
+    if "password" in params:
+        params["password"] = "xxx"
+    return psycopg2.extensions.make_dsn(**params)
@@ -0,0 +1,107 @@
+import asyncio
+from typing import (
+    Awaitable,
+    Callable,
+    Generic,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Coalesces concurrent single-item calls into batched calls
+
+    Items submitted within `window` seconds of the first pending item, up to
+    `max_size` of them, are handed to `flush` together. `flush` must return one
+    result per item, in order; a result that is an Exception is raised to that
+    item's caller alone, while an exception raised by `flush` itself is raised
+    to every caller in the batch.
+
+    A caller cancelled before its batch is flushed is dropped from the batch;
+    once the batch is in flight, the item is processed regardless. Should the
+    flush itself be cancelled, every caller in the batch is cancelled too.
+
+    `close` flushes what is pending and waits for every flush in flight;
+    items submitted afterwards are refused.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List[T]], Awaitable[Sequence[Union[R, Exception]]]],
+        window: float,
+        max_size: int,
+    ):
+        self.flush = flush
+        self.window = window
+        self.max_size = max_size
+        self._pending: List[Tuple[T, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: Set[asyncio.Future] = set()
+        self._closed = False
+
+    async def submit(self, item: T) -> R:
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        loop = asyncio.get_event_loop()
+        entry = (item, loop.create_future())
+        self._pending.append(entry)
+        if len(self._pending) >= self.max_size:
+            self._flush_pending()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush_pending)
+        try:
+            return await entry[1]
+        except asyncio.CancelledError:
+            if entry in self._pending:
+                self._pending.remove(entry)
+            raise
+
+    async def close(self) -> None:
+        """Flush pending items now, and wait for every flush in flight"""
+        self._closed = True
+        self._flush_pending()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def _flush_pending(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            flush = asyncio.ensure_future(self._flush_batch(batch))
+            # Hold a reference so the flush is not garbage collected mid-flight
+            self._flushes.add(flush)
+            flush.add_done_callback(self._flushes.discard)
+
+    async def _flush_batch(self, batch: List[Tuple[T, asyncio.Future]]) -> None:
+        try:
+            try:
+                results = await self.flush([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        finally:
+            # Left unresolved when the flush is cancelled, e.g. on shutdown,
+            # which would keep every caller waiting forever
+            for _, future in batch:
+                if not future.done():
+                    future.cancel()
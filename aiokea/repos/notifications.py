@@ -0,0 +1,141 @@
+import asyncio
+import json
+import logging
+from typing import Any, Callable, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+CREATE = "create"
+UPDATE = "update"
+DELETE = "delete"
+
+
+class Change(NamedTuple):
+    """A write to one row, as announced by AIOPGRepo on its notify channel"""
+
+    table: str
+    id: Any
+    operation: str
+
+
+def change_payload(table: str, id: Any, operation: str) -> str:
+    return json.dumps({"table": table, "id": id, "operation": operation}, default=str)
+
+
+class AIOPGChangeListener:
+    """
+    Listens for AIOPGRepo change notifications and fans them out to local caches
+
+    Holds one dedicated connection, outside of any pool, LISTENing on `channel`.
+    Every notification is passed to each `on_change` subscriber as a Change.
+
+    Notifications sent while the listener is disconnected are lost, so after
+    every (re)connect, including the first one, each `on_reset` subscriber is
+    called to flush everything it holds. Caches can therefore use long TTLs:
+    an entry is dropped either by its own Change or by a reset.
+
+    `connect_kwargs` are passed to `aiopg.connect` and must be connection
+    parameters only, not pool parameters such as `minsize`. Enabling TCP
+    keepalives there makes a silently dropped connection show up sooner.
+    """
+
+    def __init__(
+        self, channel: str, reconnect_delay: float = 1.0, **connect_kwargs: Any
+    ):
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self.connect_kwargs = connect_kwargs
+        self.listening = asyncio.Event()
+        self._on_change: List[Callable[[Change], None]] = []
+        self._on_reset: List[Callable[[], None]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(
+        self,
+        on_change: Callable[[Change], None],
+        on_reset: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self._on_change.append(on_change)
+        if on_reset is not None:
+            self._on_reset.append(on_reset)
+
+    async def start(self) -> None:
+        """Start listening in a background task and wait for the first LISTEN"""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._listen_forever())
+        await self.listening.wait()
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.listening.clear()
+
+    async def _listen_forever(self) -> None:
+        # Driver imports are deferred so AIOPGRepo can use this module for free
+        import psycopg2
+
+        while True:
+            try:
+                await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except (psycopg2.Error, OSError) as e:
+                logger.warning(
+                    "Lost change notification connection on %s: %s", self.channel, e
+                )
+            except Exception:
+                # Ending the task would leave caches uninvalidated for good
+                logger.exception(
+                    "Change notification listener on %s failed", self.channel
+                )
+            self.listening.clear()
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def _listen(self) -> None:
+        import aiopg
+        from psycopg2 import sql
+
+        async with aiopg.connect(**self.connect_kwargs) as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    sql.SQL("LISTEN {}").format(sql.Identifier(self.channel))
+                )
+            # Anything may have changed while we were not listening
+            self._reset()
+            self.listening.set()
+            while True:
+                notify = await conn.notifies.get()
+                self._dispatch(notify.payload)
+
+    def _dispatch(self, payload: str) -> None:
+        try:
+            change = Change(**json.loads(payload))
+        except (ValueError, TypeError):
+            logger.warning(
+                "Malformed change notification on %s: %r", self.channel, payload
+            )
+            # Cannot tell what changed, so assume anything did
+            self._reset()
+            return
+        for on_change in self._on_change:
+            try:
+                on_change(change)
+            except Exception:
+                logger.exception(
+                    "Change subscriber %r failed on %s", on_change, self.channel
+                )
+
+    def _reset(self) -> None:
+        for on_reset in self._on_reset:
+            try:
+                on_reset()
+            except Exception:
+                logger.exception(
+                    "Reset subscriber %r failed on %s", on_reset, self.channel
+                )
@@ -0,0 +1,86 @@
+from typing import (
+    Any,
+    Callable,
+    Iterator,
+    List,
+    Mapping,
+    Sequence,
+    TypeVar,
+    Union,
+    overload,
+)
+
+R = TypeVar("R")
+T = TypeVar("T")
+
+_UNSET: Any = object()
+
+
+class LazyEntities(Sequence[T]):
+    """
+    Sequence of entities built from raw rows only as they are accessed
+
+    Holds the rows a query returned and calls `to_entity` on a row the first
+    time its position is indexed or iterated over, caching the result, so
+    `len()` or looking at the first few items never pays for the rest.
+    A slice is another LazyEntities over the same rows and cache entries.
+    """
+
+    def __init__(self, rows: Sequence[R], to_entity: Callable[[R], T]):
+        self._rows = rows
+        self._to_entity = to_entity
+        self._entities: List[Any] = [_UNSET] * len(rows)
+        # Positions in _rows this sequence covers; a slice narrows them
+        self._positions = range(len(rows))
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    @overload
+    def __getitem__(self, index: int) -> T: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "LazyEntities[T]": ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[T, "LazyEntities[T]"]:
+        if isinstance(index, slice):
+            sliced: LazyEntities[T] = LazyEntities.__new__(LazyEntities)
+            sliced.__dict__.update(self.__dict__)
+            sliced._positions = self._positions[index]
+            return sliced
+        return self._entity_at(self._positions[index])
+
+    def __iter__(self) -> Iterator[T]:
+        for position in self._positions:
+            yield self._entity_at(position)
+
+    def _entity_at(self, position: int) -> T:
+        entity = self._entities[position]
+        if entity is _UNSET:
+            entity = self._entities[position] = self._to_entity(self._rows[position])
+        return entity
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, LazyEntities):
+            other = list(other)
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        built = sum(
+            self._entities[position] is not _UNSET for position in self._positions
+        )
+        return f"<LazyEntities {built}/{len(self)} built>"
+
+
+def from_values(
+    keys: Sequence[str], to_entity: Callable[[Mapping], T]
+) -> Callable[[Sequence], T]:
+    """Adapt `to_entity` to rows kept as plain tuples of values, in `keys` order"""
+    keys = tuple(keys)
+
+    def to_entity_from_values(values: Sequence) -> T:
+        return to_entity(dict(zip(keys, values)))
+
+    return to_entity_from_values
@@ -0,0 +1,139 @@
+import asyncio
+import collections
+import logging
+import random
+import re
+from typing import TYPE_CHECKING, Any, Deque, Dict, NamedTuple, Optional, Set
+
+if TYPE_CHECKING:
+    import aiopg.sa
+    from sqlalchemy.sql import ClauseElement
+    from sqlalchemy.sql.compiler import Compiled
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_QUERIES = 1000
+DEFAULT_MAX_PLANS = 100
+
+# Quoted literals in plan conditions, e.g. `(email = 'brian@example.com'::text)`
+_PLAN_LITERAL_REGEX = re.compile(r"'(?:[^']|'')*'")
+
+_EXPLAIN = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+
+
+class SlowQuery(NamedTuple):
+    operation: str
+    table: str
+    sql: str
+    # Parameter name to the type of its value; values are never kept
+    parameters: Dict[str, str]
+    duration: float
+    rows: int
+    # EXPLAIN (ANALYZE, BUFFERS) output, for the sampled queries only
+    plan: Optional[Any] = None
+
+
+class SlowQueryLog:
+    """
+    Records AIOPGRepo statements that take `threshold` seconds or longer
+
+    Each slow statement is logged as a warning and kept in `queries`, a ring
+    buffer of the latest `max_queries`. A fraction `explain_rate` of them are
+    re-run in the background under EXPLAIN (ANALYZE, BUFFERS) on a connection
+    of their own, inside a transaction that is rolled back, so writes are
+    measured without taking effect. The plans go to `plans`, a ring buffer of
+    the latest `max_plans`.
+
+    The parameter values are only used to re-run a statement. Quoted literals
+    are blanked out of the stored plans, but numeric ones are left as is.
+
+    Statements that time out or are cancelled are not recorded.
+    One log can be shared by any number of repos.
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        explain_rate: float = 0.0,
+        max_queries: int = DEFAULT_MAX_QUERIES,
+        max_plans: int = DEFAULT_MAX_PLANS,
+    ):
+        self.threshold = threshold
+        self.explain_rate = explain_rate
+        self.queries: Deque[SlowQuery] = collections.deque(maxlen=max_queries)
+        self.plans: Deque[SlowQuery] = collections.deque(maxlen=max_plans)
+        self._explains: Set[asyncio.Future] = set()
+
+    def record(
+        self,
+        engine: "aiopg.sa.Engine",
+        operation: str,
+        table: str,
+        query: "ClauseElement",
+        duration: float,
+        rows: int,
+    ) -> None:
+        """Record `query` if it was slow; compiles it again, so only call it then"""
+        if duration < self.threshold:
+            return
+        compiled = query.compile(dialect=engine.dialect)
+        slow_query = SlowQuery(
+            operation=operation,
+            table=table,
+            sql=str(compiled),
+            parameters={
+                name: type(value).__name__ for name, value in compiled.params.items()
+            },
+            duration=duration,
+            rows=rows,
+        )
+        self.queries.append(slow_query)
+        logger.warning(
+            "Slow %s on %s took %.3fs for %s rows: %s",
+            operation,
+            table,
+            duration,
+            rows,
+            slow_query.sql,
+        )
+        if self.explain_rate and random.random() < self.explain_rate:
+            explain = asyncio.ensure_future(self._explain(engine, compiled, slow_query))
+            # Hold a reference so the explain is not garbage collected mid-flight
+            self._explains.add(explain)
+            explain.add_done_callback(self._explains.discard)
+
+    async def wait_explained(self) -> None:
+        """Wait for the EXPLAINs in flight, e.g. before shutting down"""
+        if self._explains:
+            await asyncio.wait(set(self._explains))
+
+    async def _explain(
+        self, engine: "aiopg.sa.Engine", compiled: "Compiled", slow_query: SlowQuery
+    ) -> None:
+        # Bind values the way aiopg does when executing a ClauseElement
+        processors = compiled._bind_processors
+        params = {
+            key: processors[key](value) if key in processors else value
+            for key, value in compiled.construct_params().items()
+        }
+        try:
+            async with engine.acquire() as conn:
+                transaction = await conn.begin()
+                try:
+                    plan = await conn.scalar(_EXPLAIN + slow_query.sql, params)
+                finally:
+                    await transaction.rollback()
+        except Exception as e:
+            logger.warning("Could not explain slow %s: %s", slow_query.operation, e)
+            return
+        self.plans.append(slow_query._replace(plan=_scrub_literals(plan)))
+
+
+def _scrub_literals(plan: Any) -> Any:
+    if isinstance(plan, str):
+        return _PLAN_LITERAL_REGEX.sub("'?'", plan)
+    if isinstance(plan, list):
+        return [_scrub_literals(item) for item in plan]
+    if isinstance(plan, dict):
+        return {key: _scrub_literals(value) for key, value in plan.items()}
+    return plan
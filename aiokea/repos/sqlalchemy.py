@@ -0,0 +1,185 @@
+import collections
+import functools
+from typing import Any, Callable, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import sqlalchemy as sa
+from sqlalchemy.sql import Select, and_, not_, or_
+from sqlalchemy.sql.elements import ClauseElement
+from sqlalchemy.sql.schema import Column
+
+from aiokea.aggregates import AggregateFunctions, Metric
+from aiokea.filters import (
+    And,
+    Filter,
+    FilterExpression,
+    FilterOperators,
+    Not,
+    Or,
+    normalize,
+    parse_sort_key,
+)
+
+# Text search configuration of SEARCH filters: `simple` lowercases words but,
+# unlike the language configurations, neither stems them nor drops stop words,
+# which suits names and identifiers
+TEXT_SEARCH_CONFIG = "simple"
+
+LIKE_ESCAPE = "\\"
+
+
+def where_clause_from_filters(
+    table: sa.Table, filters: Iterable[FilterExpression]
+) -> ClauseElement:
+    """
+    Compile aiokea Filters into a SQLAlchemy where clause against `table`
+
+    Shared by every repo built on the SQLAlchemy Table API so that a Filter
+    means the same thing regardless of which database is behind the repo.
+    `filters` are ANDed together and normalized first, so a composite
+    expression becomes a single WHERE without redundant predicates.
+    """
+    return _compile(table, normalize(And(*filters)))
+
+
+@functools.lru_cache(maxsize=None)
+def compact_row_factory(table: sa.Table) -> Callable[[Mapping], Tuple]:
+    """
+    Build a function turning result rows of `table` into compact, read-only rows
+
+    A compact row is a named tuple with one attribute per column, named after
+    the column. Column names live on the row class, shared by every row, so
+    each row costs little more than its values; an attrs or plain class entity
+    carries a `__dict__` on top of that. The class is built once per table.
+    """
+    keys = [column.name for column in table.columns]
+    # rename=True swaps column names that are not identifiers for _0, _1, ...
+    row_class = collections.namedtuple("CompactRow", keys, rename=True)
+    make = row_class._make
+
+    def to_compact_row(row: Mapping) -> Tuple:
+        return make([row[key] for key in keys])
+
+    return to_compact_row
+
+
+def order_by_clauses(table: sa.Table, order_by: Iterable[str]) -> List[ClauseElement]:
+    """
+    Compile sort keys such as `["-created_at", "id"]` into ORDER BY clauses
+
+    Nulls sort the database's default way, which is what a plain B-tree index
+    on the columns provides on Postgres, so `first` with an order can be
+    answered by reading a single index entry.
+    """
+    clauses = []
+    for key in order_by:
+        field, descending = parse_sort_key(key)
+        table_col: Column = getattr(table.c, field)
+        clauses.append(table_col.desc() if descending else table_col.asc())
+    return clauses
+
+
+def aggregate_select(
+    table: sa.Table,
+    where_clause: Optional[ClauseElement],
+    group_by: Sequence[str],
+    metrics: Sequence[Metric],
+) -> Select:
+    """
+    Compile an `aggregate` call into a single GROUP BY select against `table`
+
+    Each metric is labelled with its name, and groups come out ordered by
+    their `group_by` values, nulls last, as `aggregate_entities` orders them.
+    """
+    if not group_by and not metrics:
+        raise ValueError("Nothing to aggregate: no group_by fields and no metrics")
+    group_columns = [getattr(table.c, field) for field in group_by]
+    select = sa.select(
+        group_columns
+        + [_compile_metric(table, metric).label(metric.name) for metric in metrics]
+    )
+    if where_clause is not None:
+        select = select.where(where_clause)
+    if group_columns:
+        select = select.group_by(*group_columns).order_by(
+            *(column.asc().nullslast() for column in group_columns)
+        )
+    return select
+
+
+def _compile_metric(table: sa.Table, metric: Metric) -> ClauseElement:
+    if metric.field is None:
+        return sa.func.count()
+    table_col: Column = getattr(table.c, metric.field)
+    if metric.function == AggregateFunctions.COUNT:
+        return sa.func.count(table_col)
+    elif metric.function == AggregateFunctions.MIN:
+        return sa.func.min(table_col)
+    elif metric.function == AggregateFunctions.MAX:
+        return sa.func.max(table_col)
+    raise ValueError(f"Invalid aggregate function {metric.function}")
+
+
+def _compile(table: sa.Table, expression: FilterExpression) -> ClauseElement:
+    if isinstance(expression, And):
+        if not expression.operands:
+            return sa.true()
+        return and_(*(_compile(table, operand) for operand in expression.operands))
+    if isinstance(expression, Or):
+        if not expression.operands:
+            return sa.false()
+        return or_(*(_compile(table, operand) for operand in expression.operands))
+    if isinstance(expression, Not):
+        return not_(_compile(table, expression.operand))
+    return _compile_filter(table, expression)
+
+
+def _compile_filter(table: sa.Table, filter: Filter) -> ClauseElement:
+    table_col: Column = getattr(table.c, filter.field)
+    if filter.operator == FilterOperators.EQ:
+        return table_col == filter.value
+    elif filter.operator == FilterOperators.NE:
+        return table_col != filter.value
+    elif filter.operator == FilterOperators.GT:
+        return table_col > filter.value
+    elif filter.operator == FilterOperators.GTE:
+        return table_col >= filter.value
+    elif filter.operator == FilterOperators.LT:
+        return table_col < filter.value
+    elif filter.operator == FilterOperators.LTE:
+        return table_col <= filter.value
+    elif filter.operator == FilterOperators.IN:
+        return table_col.in_(filter.value)
+    elif filter.operator == FilterOperators.PREFIX:
+        return table_col.like(f"{_escape_like(filter.value)}%", escape=LIKE_ESCAPE)
+    elif filter.operator == FilterOperators.CONTAINS:
+        return table_col.ilike(f"%{_escape_like(filter.value)}%", escape=LIKE_ESCAPE)
+    elif filter.operator == FilterOperators.SEARCH:
+        return text_search_vector(table_col).op("@@")(
+            sa.func.plainto_tsquery(_text_search_config(), filter.value)
+        )
+    raise ValueError(f"Invalid operator {filter.operator}")
+
+
+def text_search_vector(column: ClauseElement) -> ClauseElement:
+    """
+    The tsvector a SEARCH filter matches against, on Postgres only
+
+    A GIN index can only serve the filter if it is built on this same
+    expression, configuration included:
+
+        CREATE INDEX ON users USING gin (to_tsvector('simple', username));
+    """
+    return sa.func.to_tsvector(_text_search_config(), column)
+
+
+def _text_search_config() -> ClauseElement:
+    # Inlined rather than bound, as a parameter would not match the expression
+    # an index was built on
+    return sa.literal_column(f"'{TEXT_SEARCH_CONFIG}'::regconfig")
+
+
+def _escape_like(value: Any) -> str:
+    value = str(value)
+    for char in (LIKE_ESCAPE, "%", "_"):
+        value = value.replace(char, LIKE_ESCAPE + char)
+    return value
@@ -0,0 +1,349 @@
+import asyncio
+import datetime
+import functools
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Mapping,
+    MutableMapping,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import sqlalchemy as sa
+from sqlalchemy.engine import Connection, Engine, RowProxy
+from sqlalchemy.pool import SingletonThreadPool
+from sqlalchemy.sql import Select, Update, Delete
+from sqlalchemy.sql.elements import BinaryExpression
+from sqlalchemy.sql.expression import Insert
+
+from aiokea.abc import CompactRow, IRepo, Entity
+from aiokea.aggregates import Metric
+from aiokea.errors import (
+    DuplicateResourceError,
+    ResourceNotFoundError,
+    UnsupportedFilterError,
+)
+from aiokea.filters import (
+    And,
+    Filter,
+    FilterExpression,
+    FilterOperators,
+    iter_filters,
+)
+from aiokea.repos.adapters import BaseMarshmallowSQLAlchemyRepoAdapter
+from aiokea.repos.results import LazyEntities, from_values
+from aiokea.repos.sqlalchemy import (
+    aggregate_select,
+    compact_row_factory,
+    order_by_clauses,
+    where_clause_from_filters,
+)
+
+DEFAULT_POOL_SIZE = 5
+
+
+def create_engine(
+    path: str, pool_size: int = DEFAULT_POOL_SIZE, **kwargs: Any
+) -> Engine:
+    """
+    Create a SQLAlchemy Engine suitable for use with SQLiteRepo
+
+    Every thread gets its own connection to the database file, and every
+    connection is switched into WAL mode so that readers do not block the writer.
+    `path` must point to a file; each connection to `:memory:` would be its own
+    private database.
+    """
+    engine = sa.create_engine(
+        f"sqlite:///{path}",
+        poolclass=SingletonThreadPool,
+        pool_size=pool_size,
+        connect_args={"check_same_thread": False},
+        **kwargs,
+    )
+
+    @sa.event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        # Stop pysqlite from issuing its own BEGIN/COMMIT, which breaks SAVEPOINT;
+        # SQLAlchemy emits BEGIN itself through the "begin" listener below
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        # Make LIKE case-sensitive as on Postgres, so PREFIX filters agree
+        cursor.execute("PRAGMA case_sensitive_like=ON")
+        cursor.close()
+
+    @sa.event.listens_for(engine, "begin")
+    def _on_begin(conn):
+        conn.execute("BEGIN")
+
+    return engine
+
+
+class SQLiteRepo(IRepo):
+    """
+    IRepo backed by an embedded SQLite database
+
+    sqlite3 calls are blocking, so all database work runs in a thread executor.
+    The executor should not have more workers than the engine has pooled
+    connections, as each worker thread holds on to its own connection.
+    """
+
+    def __init__(
+        self,
+        adapter: BaseMarshmallowSQLAlchemyRepoAdapter,
+        engine: Engine,
+        table: sa.Table,
+        executor: Optional[Executor] = None,
+    ):
+        self.adapter = adapter
+        self.engine = engine
+        self.table = table
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=DEFAULT_POOL_SIZE, thread_name_prefix="aiokea-sqlite"
+        )
+
+    async def get(self, id: Any) -> Entity:
+        where_clause: BinaryExpression = self._where_clause_from_id(id)
+        select: Select = self.table.select(whereclause=where_clause).limit(1)
+
+        def _get(conn: Connection) -> Optional[RowProxy]:
+            return conn.execute(select).first()
+
+        result = await self._run(_get)
+        if result is None:
+            self._raise_not_found(id)
+        return await self.adapter.to_entity(result)
+
+    async def where(
+        self,
+        filters: Optional[Iterable[FilterExpression]] = None,
+        order_by: Optional[Sequence[str]] = None,
+        compact: bool = False,
+        lazy: bool = False,
+    ) -> Sequence[Union[Entity, CompactRow]]:
+        where_clause: Optional[BinaryExpression] = (
+            self._where_clause_from_filters(filters) if filters else None
+        )
+        select: Select = self.table.select(whereclause=where_clause).order_by(
+            *order_by_clauses(self.table, order_by or [])
+        )
+
+        loads_lazily = lazy and self.adapter.loads_sync
+
+        def _where(conn: Connection) -> List[Union[RowProxy, Tuple]]:
+            results = conn.execute(select)
+            # Compact and lazy rows are converted as they stream, so the
+            # RowProxy objects never all exist at once
+            if compact:
+                to_compact_row = compact_row_factory(self.table)
+                return [to_compact_row(row) for row in results]
+            if loads_lazily:
+                return [tuple(row) for row in results]
+            return results.fetchall()
+
+        results = await self._run(_where)
+        if compact:
+            return results
+        if loads_lazily:
+            return self._lazy_entities(results)
+        return [await self.adapter.to_entity(result) for result in results]
+
+    async def first(
+        self,
+        filters: Optional[Iterable[FilterExpression]] = None,
+        order_by: Optional[Sequence[str]] = None,
+    ) -> Optional[Entity]:
+        where_clause: Optional[BinaryExpression] = (
+            self._where_clause_from_filters(filters) if filters else None
+        )
+        select: Select = (
+            self.table.select(whereclause=where_clause)
+            .order_by(*order_by_clauses(self.table, order_by or []))
+            .limit(1)
+        )
+
+        def _first(conn: Connection) -> Optional[RowProxy]:
+            return conn.execute(select).first()
+
+        result = await self._run(_first)
+        if result is None:
+            return None
+        return await self.adapter.to_entity(result)
+
+    async def aggregate(
+        self,
+        filters: Optional[Iterable[FilterExpression]] = None,
+        group_by: Sequence[str] = (),
+        metrics: Sequence[Metric] = (),
+    ) -> List[Dict[str, Any]]:
+        where_clause: Optional[BinaryExpression] = (
+            self._where_clause_from_filters(filters) if filters else None
+        )
+        select: Select = aggregate_select(self.table, where_clause, group_by, metrics)
+        keys = [*group_by, *(metric.name for metric in metrics)]
+
+        def _aggregate(conn: Connection) -> List[Dict[str, Any]]:
+            return [{key: row[key] for key in keys} for row in conn.execute(select)]
+
+        return await self._run(_aggregate)
+
+    async def create(self, entity: Entity) -> Entity:
+        serialized_entity: Mapping = self._bind_values(self.adapter.from_entity(entity))
+
+        def _create(conn: Connection) -> RowProxy:
+            return self._insert(conn, serialized_entity)
+
+        result = await self._run(_create, transaction=True)
+        return await self.adapter.to_entity(result)
+
+    async def create_many(
+        self, entities: Iterable[Entity], atomic: bool = False
+    ) -> List[Union[Entity, DuplicateResourceError]]:
+        serialized_entities: List[Mapping] = [
+            self._bind_values(self.adapter.from_entity(entity)) for entity in entities
+        ]
+
+        def _create_many(
+            conn: Connection,
+        ) -> List[Union[RowProxy, DuplicateResourceError]]:
+            rows: List[Union[RowProxy, DuplicateResourceError]] = []
+            for serialized_entity in serialized_entities:
+                if atomic:
+                    # Any conflict escapes and rolls back the whole transaction
+                    rows.append(self._insert(conn, serialized_entity))
+                    continue
+                savepoint = conn.begin_nested()
+                try:
+                    rows.append(self._insert(conn, serialized_entity))
+                except sa.exc.IntegrityError as e:
+                    savepoint.rollback()
+                    if not _is_unique_violation(e):
+                        raise
+                    rows.append(DuplicateResourceError(e))
+                else:
+                    savepoint.commit()
+            return rows
+
+        rows = await self._run(_create_many, transaction=True)
+        return [
+            (
+                row
+                if isinstance(row, DuplicateResourceError)
+                else await self.adapter.to_entity(row)
+            )
+            for row in rows
+        ]
+
+    async def update(self, entity: Entity) -> Entity:
+        id = getattr(entity, self.adapter.schema.Meta.id_field)
+        serialized_entity: Mapping = self._bind_values(self.adapter.from_entity(entity))
+        where_clause: BinaryExpression = self._where_clause_from_id(id)
+        update: Update = self.table.update(whereclause=where_clause).values(
+            **serialized_entity
+        )
+
+        def _update(conn: Connection) -> Optional[RowProxy]:
+            results = conn.execute(update)
+            if not results.rowcount:
+                return None
+            return conn.execute(self.table.select(whereclause=where_clause)).first()
+
+        result = await self._run(_update, transaction=True)
+        if result is None:
+            self._raise_not_found(id)
+        return await self.adapter.to_entity(result)
+
+    async def delete(self, id: Any) -> Entity:
+        where_clause: BinaryExpression = self._where_clause_from_id(id)
+        select: Select = self.table.select(whereclause=where_clause)
+        delete: Delete = self.table.delete(whereclause=where_clause)
+
+        def _delete(conn: Connection) -> Optional[RowProxy]:
+            result = conn.execute(select).first()
+            if result is not None:
+                conn.execute(delete)
+            return result
+
+        result = await self._run(_delete, transaction=True)
+        if result is None:
+            self._raise_not_found(id)
+        return await self.adapter.to_entity(result)
+
+    async def _run(self, fn: Callable[[Connection], Any], transaction: bool = False):
+        """Run `fn` with a connection on the executor, mapping database errors"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(self._run_sync, fn, transaction)
+        )
+
+    def _run_sync(self, fn: Callable[[Connection], Any], transaction: bool) -> Any:
+        connect = self.engine.begin if transaction else self.engine.connect
+        try:
+            with connect() as conn:
+                return fn(conn)
+        except sa.exc.IntegrityError as e:
+            if _is_unique_violation(e):
+                raise DuplicateResourceError(e)
+            raise
+
+    def _insert(self, conn: Connection, serialized_entity: Mapping) -> RowProxy:
+        # SQLite has no RETURNING; read the row back inside the same transaction
+        insert: Insert = self.table.insert().values(**serialized_entity)
+        results = conn.execute(insert)
+        where_clause = self._where_clause_from_id(results.inserted_primary_key[0])
+        return conn.execute(self.table.select(whereclause=where_clause)).first()
+
+    def _bind_values(self, serialized_entity: Mapping) -> MutableMapping:
+        """
+        Undo the adapter's datetime dumping
+
+        The repo adapter dumps datetimes to ISO strings, which Postgres parses on
+        its own but the SQLite DateTime type refuses to bind.
+        """
+        values = dict(serialized_entity)
+        for k, v in values.items():
+            column = self.table.c.get(k)
+            if (
+                column is not None
+                and isinstance(column.type, sa.DateTime)
+                and isinstance(v, str)
+            ):
+                values[k] = datetime.datetime.fromisoformat(v)
+        return values
+
+    def _lazy_entities(self, rows: List[Tuple]) -> LazyEntities[Entity]:
+        keys = [column.name for column in self.table.columns]
+        return LazyEntities(rows, from_values(keys, self.adapter.to_entity_sync))
+
+    def _raise_not_found(self, id: Any):
+        raise ResourceNotFoundError(
+            f"No {self.adapter.entity_class.__name__} found with {self.adapter.schema.Meta.id_field} {id}"
+        )
+
+    def _where_clause_from_id(self, id: Any) -> BinaryExpression:
+        id_filter = Filter(self.adapter.schema.Meta.id_field, FilterOperators.EQ, id)
+        return self._where_clause_from_filters([id_filter])
+
+    def _where_clause_from_filters(
+        self, filters: Iterable[FilterExpression]
+    ) -> BinaryExpression:
+        filters = list(filters)
+        for f in iter_filters(And(*filters)):
+            if f.operator == FilterOperators.SEARCH:
+                raise UnsupportedFilterError(
+                    "Full-text search is not supported on SQLite"
+                )
+        return where_clause_from_filters(self.table, filters)
+
+
+def _is_unique_violation(e: sa.exc.IntegrityError) -> bool:
+    return "UNIQUE constraint failed" in str(e.orig)
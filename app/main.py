@@ -1,4 +1,5 @@
 import argparse
+import asyncio
 import json
 import logging
 import os
@@ -6,12 +7,15 @@ import sys
 from typing import Mapping
 
 from aiohttp import web
-from aiopg.sa import create_engine
 
+from aiokea.http.compression import Compression
+from aiokea.http.health import readiness_handler
+from aiokea.http.metrics import HTTPMetrics
+from aiokea.http.workers import run_workers, split_pool_conf
+from aiokea.repos.aiopg_engine import create_engine, warm_up_with_retry
 
 from app.infrastructure.datastore.postgres.user_repo import PostgresUserRepo
 from app.infrastructure.server.http.adapters.user import UserHTTPAdapter
-from app.infrastructure.server.http.handlers import health
 from app.infrastructure.server.http.handlers.base import HTTPHandler
 from app.infrastructure.server.http.routes import (
     HEALTH_PATH,
@@ -30,11 +34,17 @@ def on_startup(conf: Mapping):
         These are tasks that should be run after the event loop has been started
         but before the HTTP server has been started.
         """
-        pg_engine = await create_engine(**conf["postgres"])
+        # Warm the pool up in the background; the health check reports
+        # unavailable until it is done, so no request pays for a handshake
+        pg_engine = await create_engine(warm_up=False, **conf["postgres"])
+        app["pg_engine"] = pg_engine
+        app["pg_warm_up"] = asyncio.ensure_future(warm_up_with_retry(pg_engine))
         user_pg_client = PostgresUserRepo(pg_engine)
 
         # Health check
-        app.router.add_get(HEALTH_PATH, health.health_check, name=HEALTH_NAME)
+        app.router.add_get(
+            HEALTH_PATH, readiness_handler(lambda: pg_engine.ready), name=HEALTH_NAME
+        )
 
         # Users endpoint
         user_handler = HTTPHandler(db_client=user_pg_client, adapter=UserHTTPAdapter())
@@ -45,12 +55,40 @@ def on_startup(conf: Mapping):
     return startup_handler
 
 
+async def on_cleanup(app: web.Application) -> None:
+    """Stop warming up and close the Postgres pool"""
+    warm_up = app.get("pg_warm_up")
+    if warm_up is not None:
+        warm_up.cancel()
+        await asyncio.gather(warm_up, return_exceptions=True)
+    pg_engine = app.get("pg_engine")
+    if pg_engine is not None:
+        pg_engine.close()
+        await pg_engine.wait_closed()
+
+
+def create_app(conf: Mapping) -> web.Application:
+    app = web.Application()
+    HTTPMetrics().setup(app)
+    # After the metrics, so response sizes are measured compressed
+    Compression().setup(app)
+    app.on_startup.append(on_startup(conf))
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-c", "--config", help="Config file")
     parser.add_argument(
         "--level", default=os.environ.get("LOG_LEVEL", "INFO"), help="Logging level."
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.environ.get("WORKERS", 1)),
+        help="Number of worker processes. Postgres pool sizes are split between them.",
+    )
     args = parser.parse_args()
 
     # Load config.
@@ -60,7 +98,12 @@ def main():
     # Initialize logger
     logging.basicConfig(stream=sys.stdout, level=args.level)
 
-    app = web.Application()
-    app.on_startup.append(on_startup(conf))
+    host = "0.0.0.0"
     port = int(os.environ.get("PORT", 8080))
-    web.run_app(app, host="0.0.0.0", port=port)
+    if args.workers > 1:
+        worker_conf = dict(
+            conf, postgres=split_pool_conf(conf["postgres"], args.workers)
+        )
+        run_workers(lambda index: create_app(worker_conf), host, port, args.workers)
+    else:
+        web.run_app(create_app(conf), host=host, port=port)
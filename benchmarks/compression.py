@@ -0,0 +1,72 @@
+"""
+Compression benchmark for aiokea.http.compression
+
+Compresses a `GET /users`-like JSON body at every zlib level and reports the
+CPU time per response against the bytes saved, to pick `Compression(level=)`:
+
+    $ python benchmarks/compression.py
+    $ python benchmarks/compression.py --users 100000 --encoding deflate
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from aiokea.http.compression import ENCODINGS, compress  # noqa: E402
+
+
+def users_body(count: int) -> bytes:
+    """A JSON listing of `count` users, shaped like the users endpoint's"""
+    created_at = datetime(2019, 6, 1)
+    users = [
+        {
+            "id": str(uuid.UUID(int=i)),
+            "username": f"user{i}",
+            "email": f"user{i}@example.com",
+            "is_enabled": i % 7 != 0,
+            "created_at": (created_at + timedelta(minutes=i)).isoformat(),
+            "updated_at": (created_at + timedelta(minutes=2 * i)).isoformat(),
+        }
+        for i in range(count)
+    ]
+    return json.dumps({"data": users}).encode()
+
+
+def best_time_ms(body: bytes, encoding: str, level: int, runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        compress(body, encoding, level)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000, help="Users in the body")
+    parser.add_argument("--encoding", choices=ENCODINGS, default=ENCODINGS[0])
+    parser.add_argument("--runs", type=int, default=5, help="Runs per level")
+    args = parser.parse_args()
+
+    body = users_body(args.users)
+    print(f"{args.users} users, {len(body)} bytes uncompressed, {args.encoding}")
+    print(f"{'level':>5} {'bytes':>10} {'ratio':>6} {'ms':>8} {'MB/s':>8}")
+    for level in range(1, 10):
+        size = len(compress(body, args.encoding, level))
+        elapsed_ms = best_time_ms(body, args.encoding, level, args.runs)
+        print(
+            f"{level:>5} {size:>10} {len(body) / size:>6.1f} {elapsed_ms:>8.2f} "
+            f"{len(body) / 1000 / elapsed_ms:>8.1f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""
+Import-time benchmark for aiokea modules
+
+Imports each module in a fresh interpreter under `python -X importtime` and
+reports the best cumulative import time over several runs. Exits non-zero
+when any module is over its budget, so it can run as a CI regression check:
+
+    $ python benchmarks/import_time.py
+    $ python benchmarks/import_time.py --runs 10 --scale 1.5
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Budgets in milliseconds, with headroom for slower CI machines.
+# aiohttp alone is most of the handlers budget, and SQLAlchemy most of the
+# repo budgets; aiopg and psycopg2 would add another ~100ms on top.
+BUDGETS_MS: Dict[str, float] = {
+    "aiokea.abc": 30,
+    "aiokea.filters": 30,
+    "aiokea.repos": 30,
+    "aiokea.repos.aiopg": 200,
+    "aiokea.repos.sqlite": 250,
+    "aiokea.http.handlers": 400,
+}
+
+
+def import_time_ms(module: str) -> float:
+    """Cumulative time in ms to import `module` into a fresh interpreter"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT,
+        stderr=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        check=True,
+        universal_newlines=True,
+    )
+    # Lines look like `import time:  self [us] | cumulative | imported package`
+    for line in reversed(completed.stderr.splitlines()):
+        _, cumulative, name = line.split("|")
+        if name.strip() == module:
+            return int(cumulative) / 1000
+    raise RuntimeError(f"{module} missing from -X importtime output")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5, help="Runs per module")
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="Multiply every budget by this"
+    )
+    args = parser.parse_args()
+
+    over_budget = False
+    for module, budget in BUDGETS_MS.items():
+        best = min(import_time_ms(module) for _ in range(args.runs))
+        budget *= args.scale
+        status = "ok" if best <= budget else "OVER BUDGET"
+        over_budget = over_budget or best > budget
+        print(f"{module:<24} {best:8.1f}ms  budget {budget:8.1f}ms  {status}")
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
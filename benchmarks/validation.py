@@ -0,0 +1,70 @@
+"""
+Validation benchmark for BaseMarshmallowHTTPAdapter
+
+Validates a batch POST-like list of users into entities with marshmallow's
+`Schema.load`, with the compiled loader one item at a time, and with the
+compiled loader's batch mode:
+
+    $ python benchmarks/validation.py
+    $ python benchmarks/validation.py --users 10000 --runs 10
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import Callable, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from tests.stubs.user.http_adapter import UserHTTPAdapter  # noqa: E402
+
+
+def users_post(count: int) -> List[dict]:
+    """A batch POST body of `count` users, shaped like the users endpoint's"""
+    return [
+        {
+            "username": f"user{i}",
+            "email": f"user{i}@example.com",
+            "is_enabled": i % 7 != 0,
+        }
+        for i in range(count)
+    ]
+
+
+def best_time_ms(validate: Callable[[], object], runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        validate()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000, help="Users in the body")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per mode")
+    args = parser.parse_args()
+
+    items = users_post(args.users)
+    marshmallow_adapter = UserHTTPAdapter()
+    marshmallow_adapter._load = marshmallow_adapter._load_many = None
+    compiled_adapter = UserHTTPAdapter()
+    modes = {
+        "marshmallow": lambda: [marshmallow_adapter.to_entity(i) for i in items],
+        "compiled": lambda: [compiled_adapter.to_entity(i) for i in items],
+        "compiled many": lambda: compiled_adapter.to_entities(items),
+    }
+
+    print(f"{args.users} users")
+    print(f"{'mode':>14} {'ms':>8} {'us/item':>8}")
+    for mode, validate in modes.items():
+        elapsed_ms = best_time_ms(validate, args.runs)
+        print(f"{mode:>14} {elapsed_ms:>8.2f} {elapsed_ms * 1000 / args.users:>8.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Peak memory benchmark for SQLiteRepo.where
+
+Fills a SQLite database with users, then lists them all in a fresh process
+per mode: eager entities, `compact=True` rows and `lazy=True` results. Each
+mode reports how far the listing raised the process's peak RSS:
+
+    $ python benchmarks/where_memory.py
+    $ python benchmarks/where_memory.py --users 500000
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from aiokea.repos.sqlite import create_engine  # noqa: E402
+from tests.stubs.user.repo import METADATA, USER, SQLiteUserRepo  # noqa: E402
+
+MODES = {"eager": {}, "compact": {"compact": True}, "lazy": {"lazy": True}}
+
+
+def fill(path: str, count: int) -> None:
+    engine = create_engine(path)
+    METADATA.create_all(engine)
+    created_at = datetime(2019, 6, 1)
+    rows = [
+        {
+            "id": str(uuid.UUID(int=i)),
+            "username": f"user{i}",
+            "email": f"user{i}@example.com",
+            "is_enabled": i % 7 != 0,
+            "created_at": created_at + timedelta(minutes=i),
+            "updated_at": created_at + timedelta(minutes=2 * i),
+        }
+        for i in range(count)
+    ]
+    with engine.begin() as conn:
+        conn.execute(USER.insert(), rows)
+    engine.dispose()
+
+
+def peak_rss_kb() -> int:
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # Some kernels carry ru_maxrss over from the parent process; bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def measure(path: str, mode: str) -> None:
+    """Print the peak RSS growth, in KB, of listing every user in `mode`"""
+    repo = SQLiteUserRepo(create_engine(path))
+    loop = asyncio.new_event_loop()
+    # Warm up connections, threads and caches outside the measurement
+    loop.run_until_complete(repo.first())
+    before = peak_rss_kb()
+    results = loop.run_until_complete(repo.where(**MODES[mode]))
+    print(len(results), peak_rss_kb() - before)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=200000, help="Users listed")
+    parser.add_argument("--measure", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.db, args.measure)
+        return 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "users.db")
+        fill(path, args.users)
+        print(f"{args.users} users")
+        print(f"{'mode':>8} {'peak MB':>8} {'B/row':>6}")
+        for mode in MODES:
+            output = subprocess.run(
+                [sys.executable, __file__, "--measure", mode, "--db", path],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            listed, growth_kb = map(int, output.split())
+            print(f"{mode:>8} {growth_kb / 1024:>8.1f} {growth_kb * 1024 // listed:>6}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
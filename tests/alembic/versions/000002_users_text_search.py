@@ -0,0 +1,38 @@
+"""users text search indexes
+
+Revision ID: 000002
+Revises: 000001
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "000002"
+down_revision = "000001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Trigram indexes serve both prefix (LIKE) and contains (ILIKE) filters
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute(
+        "CREATE INDEX ix_users_username_trgm ON users "
+        "USING gin (username gin_trgm_ops)"
+    )
+    op.execute(
+        "CREATE INDEX ix_users_email_trgm ON users USING gin (email gin_trgm_ops)"
+    )
+    # Must match the expression search filters compile to
+    op.execute(
+        "CREATE INDEX ix_users_username_tsv ON users "
+        "USING gin (to_tsvector('simple'::regconfig, username))"
+    )
+
+
+def downgrade():
+    op.drop_index("ix_users_username_tsv", table_name="users")
+    op.drop_index("ix_users_email_trgm", table_name="users")
+    op.drop_index("ix_users_username_trgm", table_name="users")
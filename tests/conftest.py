@@ -6,10 +6,21 @@ from aiohttp import web
 from aiopg.sa import create_engine, Engine
 
 from aiokea.http.handlers import AIOHTTPServiceHandler
+from aiokea.repos.sqlite import create_engine as create_sqlite_engine
 from tests.stubs.user.http_adapter import UserHTTPAdapter
-from tests.stubs.user.repo import AIOPGUserRepo, USER, setup_user_repo
+from tests.stubs.user.repo import (
+    AIOPGUserRepo,
+    METADATA,
+    SQLiteUserRepo,
+    USER,
+    setup_user_repo,
+)
 from tests.stubs.user.repo_adapter import UserRepoAdapter
 
+# Repo backends the contract tests run against, e.g. AIOKEA_TEST_BACKENDS=sqlite
+# to skip everything that needs a Postgres server
+TEST_BACKENDS = os.getenv("AIOKEA_TEST_BACKENDS", default="aiopg,sqlite").split(",")
+
 
 @pytest.fixture
 def user_repo_adapter():
@@ -17,15 +28,21 @@ def user_repo_adapter():
 
 
 @pytest.fixture
-async def aiopg_engine() -> Engine:
-    conf = {
+def aiopg_conf():
+    if "aiopg" not in TEST_BACKENDS:
+        pytest.skip("aiopg backend not in AIOKEA_TEST_BACKENDS")
+    return {
         "host": os.getenv("POSTGRES_HOST", default="127.0.0.1"),
         "port": os.getenv("POSTGRES_PORT", default=5432),
         "user": os.getenv("POSTGRES_USER", default="postgres"),
         "password": os.getenv("POSTGRES_PASSWORD", default="postgres"),
         "database": "aiokea_test",
     }
-    return await create_engine(**conf)
+
+
+@pytest.fixture
+async def aiopg_engine(aiopg_conf) -> Engine:
+    return await create_engine(**aiopg_conf)
 
 
 @pytest.fixture
@@ -56,6 +73,34 @@ async def aiopg_db(loop, aiopg_engine, aiopg_user_repo):
     await aiopg_engine.wait_closed()
 
 
+@pytest.fixture
+def sqlite_engine(tmp_path):
+    engine = create_sqlite_engine(str(tmp_path / "aiokea_test.db"))
+    METADATA.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+async def sqlite_user_repo(sqlite_engine):
+    repo = SQLiteUserRepo(sqlite_engine)
+    yield repo
+    repo.executor.shutdown()
+
+
+@pytest.fixture
+async def sqlite_db(loop, sqlite_user_repo):
+    await setup_user_repo(sqlite_user_repo)
+    yield
+
+
+@pytest.fixture(params=TEST_BACKENDS)
+def user_repo(request, loop):
+    """The same user repo contract, once per backend in TEST_BACKENDS"""
+    request.getfixturevalue(f"{request.param}_db")
+    return request.getfixturevalue(f"{request.param}_user_repo")
+
+
 @pytest.fixture
 def user_http_adapter():
     return UserHTTPAdapter()
@@ -68,8 +113,7 @@ def user_post():
 
 @pytest.fixture
 def http_app(
-    aiopg_db,
-    aiopg_user_repo,
+    user_repo,
     user_http_adapter,
 ):
     async def startup_handler(app):
@@ -81,7 +125,7 @@ def http_app(
 
         # Users endpoint
         user_handler = AIOHTTPServiceHandler(
-            service=aiopg_user_repo, adapter=user_http_adapter
+            service=user_repo, adapter=user_http_adapter
         )
         app.router.add_get("/api/v1/users", user_handler.get_handler)
         app.router.add_post("/api/v1/users", user_handler.post_handler)
@@ -1,6 +1,7 @@
 import sqlalchemy as sa
 
 from aiokea.repos.aiopg import AIOPGRepo
+from aiokea.repos.sqlite import SQLiteRepo
 from tests.stubs.user.repo_adapter import UserRepoAdapter
 from tests.stubs.user.entity import User, stub_users
 
@@ -29,6 +30,11 @@ class AIOPGUserRepo(AIOPGRepo):
         super().__init__(UserRepoAdapter(), engine, USER)
 
 
-async def setup_user_repo(user_repo: AIOPGUserRepo):
+class SQLiteUserRepo(SQLiteRepo):
+    def __init__(self, engine):
+        super().__init__(UserRepoAdapter(), engine, USER)
+
+
+async def setup_user_repo(user_repo):
     for user in stub_users:
         await user_repo.create(user)
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from aiokea.admission import AdaptiveAdmissionController, AdmissionController
+from aiokea.errors import AdmissionRejectedError
+
+
+async def test_admit_rejects_beyond_limit_and_queue():
+    admission = AdmissionController(max_in_flight=1, max_queued=1, retry_after=2)
+    release = asyncio.Event()
+
+    async def hold_slot():
+        async with admission.admit():
+            await release.wait()
+
+    # Fill the in-flight slot and the queue
+    holder = asyncio.ensure_future(hold_slot())
+    queued = asyncio.ensure_future(hold_slot())
+    await asyncio.sleep(0)
+    assert admission.in_flight == 1
+    assert admission.queued == 1
+
+    # Assert anything more is rejected right away
+    with pytest.raises(AdmissionRejectedError) as e:
+        async with admission.admit():
+            pass
+    assert e.value.retry_after == 2
+
+    # Assert the queued operation takes over the slot once it is released
+    release.set()
+    await asyncio.gather(holder, queued)
+    assert admission.in_flight == 0
+    assert admission.queued == 0
+
+
+async def test_admit_queue_timeout():
+    admission = AdmissionController(max_in_flight=1, max_queued=1, queue_timeout=0.01)
+    await admission.acquire()
+
+    # Assert a queued operation gives up once its queue timeout passes
+    with pytest.raises(AdmissionRejectedError):
+        await admission.acquire()
+    assert admission.queued == 0
+
+    admission.release()
+    assert admission.in_flight == 0
+
+
+async def test_adaptive_limit_follows_latency():
+    admission = AdaptiveAdmissionController(
+        max_in_flight=10, latency_target=0.1, min_in_flight=2, backoff_ratio=0.5
+    )
+
+    # Assert a slow completion shrinks the limit
+    await admission.acquire()
+    admission.release(latency=1.0)
+    assert admission.limit == 5
+
+    # Assert fast completions at the limit grow it back
+    for _ in range(admission.limit):
+        await admission.acquire()
+    admission.release(latency=0.01)
+    assert admission.limit == 6
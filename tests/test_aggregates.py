@@ -0,0 +1,36 @@
+import pytest
+
+from aiokea.aggregates import COUNT, MAX, MIN, Metric, aggregate_entities, parse_metric
+from tests.stubs.user.entity import User
+
+
+def test_parse_metric():
+    assert parse_metric("count") == Metric(COUNT)
+    assert parse_metric(" max( created_at ) ") == Metric(MAX, "created_at")
+    assert parse_metric("max(created_at)").name == "max_created_at"
+
+    # Assert unknown functions, missing fields and junk are rejected
+    for text in ["sum(id)", "min", "max(created_at", "count(a,b)"]:
+        with pytest.raises(ValueError):
+            parse_metric(text)
+
+
+def test_aggregate_entities():
+    users = [
+        User(username="brian", email="b", is_enabled=True),
+        User(username="roman", email="r", is_enabled=True),
+        User(username="han", email="h", is_enabled=False),
+    ]
+
+    # Assert groups are ordered by value and carry every metric by name
+    assert aggregate_entities(
+        users, ["is_enabled"], [Metric(COUNT), Metric(MIN, "username")]
+    ) == [
+        {"is_enabled": False, "count": 1, "min_username": "han"},
+        {"is_enabled": True, "count": 2, "min_username": "brian"},
+    ]
+
+    # Assert no group_by yields one group, even over no entities
+    assert aggregate_entities([], [], [Metric(COUNT), Metric(MAX, "email")]) == [
+        {"count": 0, "max_email": None}
+    ]
@@ -0,0 +1,66 @@
+import pytest
+
+from aiokea.filters import (
+    And,
+    EQ,
+    Filter,
+    IN,
+    LT,
+    Not,
+    Or,
+    normalize,
+    parse_filter_expression,
+)
+
+
+def test_normalize():
+    status = Filter("status", EQ, "active")
+    owner = Filter("owner", EQ, "me")
+    expression = Or(status, Or(owner, status), And(Not(Not(owner))))
+
+    # Assert nested ORs are flattened, duplicates dropped and wrappers removed
+    assert normalize(expression) == Or(status, owner)
+
+    # Assert a group reduced to one operand is replaced by that operand
+    assert normalize(And(status, status)) == status
+
+
+def test_filters_hashable():
+    status = Filter("status", EQ, "active")
+    ids = Filter("id", IN, [1, 2])
+
+    # Assert equal expressions hash alike, so they work as set members
+    expressions = {
+        status,
+        Filter("status", EQ, "active"),
+        ids,
+        Filter("id", IN, [1, 2]),
+    }
+    assert expressions == {status, ids}
+    assert hash(Or(status, Not(ids))) == hash(Or(status, Not(Filter("id", IN, [1, 2]))))
+    assert len({And(status), Or(status)}) == 2
+
+
+def test_parse_filter_expression():
+    expression = parse_filter_expression(
+        'or(status.eq.active,and(owner.eq.me,not(created_at.lt.2019-06-01)),id.in.(1,"2,3"))'
+    )
+    assert expression == Or(
+        Filter("status", EQ, "active"),
+        And(Filter("owner", EQ, "me"), Not(Filter("created_at", LT, "2019-06-01"))),
+        Filter("id", IN, ["1", "2,3"]),
+    )
+
+    # Assert quoted values may contain separators and escaped quotes
+    assert parse_filter_expression(r'name.eq."a,\"b\")"') == Filter(
+        "name", EQ, 'a,"b")'
+    )
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["", "or(", "status.eq", "status.like.a", "xor(a.eq.1)", "not(a.eq.1,b.eq.2)"],
+)
+def test_parse_filter_expression_invalid(text):
+    with pytest.raises(ValueError):
+        parse_filter_expression(text)
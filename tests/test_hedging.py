@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from aiokea.abc import IService
+from aiokea.errors import ResourceNotFoundError, StatementTimeoutError
+from aiokea.hedging import HedgedService, LatencyTracker
+from tests.stubs.user.entity import stub_users
+
+
+class ScriptedService(IService):
+    """Answers `get` after the delays it is given, one per call, in order"""
+
+    def __init__(self, delays, error=None):
+        self.delays = list(delays)
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+
+    async def get(self, id):
+        call = self.calls
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delays[call])
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None and call == 0:
+            raise self.error
+        return stub_users[0]
+
+    async def where(self, filters=None, order_by=None, compact=False, lazy=False):
+        return stub_users
+
+    async def first(self, filters=None, order_by=None):
+        return stub_users[0]
+
+    async def create(self, entity):
+        return entity
+
+    async def update(self, entity):
+        return entity
+
+    async def delete(self, id):
+        return stub_users[0]
+
+
+async def test_hedge_wins_over_slow_attempt():
+    service = ScriptedService(delays=[10, 0])
+    hedged = HedgedService(service, initial_delay=0.01)
+    await asyncio.wait_for(hedged.get("id"), 1)
+    await asyncio.sleep(0)
+
+    # Assert the hedge answered, and the slow attempt was cancelled
+    assert service.calls == 2
+    assert service.cancelled == 1
+    assert (hedged.stats.reads, hedged.stats.fired, hedged.stats.won) == (1, 1, 1)
+
+
+async def test_hedge_budget():
+    service = ScriptedService(delays=[0.02, 10, 0.02, 0.02])
+    hedged = HedgedService(service, initial_delay=0.01, budget=0, max_burst=1)
+    for _ in range(3):
+        await hedged.get("id")
+
+    # Assert a single hedge fired and lost, and the rest were over budget
+    assert (hedged.stats.fired, hedged.stats.won, hedged.stats.skipped) == (1, 0, 2)
+    assert hedged.stats.win_rate == 0
+
+
+async def test_hedge_failed_attempt_does_not_win():
+    # Assert a failing attempt waits for the other one to answer
+    service = ScriptedService(delays=[0.02, 0.05], error=StatementTimeoutError())
+    hedged = HedgedService(service, initial_delay=0.01)
+    assert await hedged.get("id") == stub_users[0]
+    assert hedged.stats.won == 1
+
+    # Assert resources not found are an answer, not a failure
+    service = ScriptedService(delays=[0.02, 10], error=ResourceNotFoundError())
+    hedged = HedgedService(service, initial_delay=0.01)
+    with pytest.raises(ResourceNotFoundError):
+        await asyncio.wait_for(hedged.get("id"), 1)
+    assert hedged.stats.won == 0
+
+
+async def test_hedge_delay_follows_percentile():
+    hedged = HedgedService(
+        ScriptedService([]), percentile=0.9, initial_delay=0.5, min_samples=10
+    )
+    assert hedged.hedge_delay("get") == 0.5
+    for latency in range(1, 11):
+        hedged._observe("get", latency / 100)
+
+    # Assert the delay is the observed percentile, per method
+    assert hedged.hedge_delay("get") == 0.1
+    assert hedged.hedge_delay("first") == 0.5
+
+
+async def test_hedge_observes_first_attempt():
+    service = ScriptedService(delays=[10, 0, 10])
+    hedged = HedgedService(service, initial_delay=0.02)
+    await asyncio.wait_for(hedged.get("id"), 1)
+    await asyncio.sleep(0)
+
+    # Assert a first attempt beaten by its hedge is observed as slower than the delay
+    tracker = hedged._latencies["get"]
+    assert len(tracker) == 1
+    assert tracker.value >= 0.02
+
+    # Assert a read cancelled before its hedge delay is not observed
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(hedged.get("id"), 0.001)
+    await asyncio.sleep(0)
+    assert len(tracker) == 1
+
+
+def test_latency_tracker_window():
+    tracker = LatencyTracker(percentile=0.5, window=20)
+    for latency in [1.0] * 20 + [2.0] * 20:
+        tracker.observe(latency)
+
+    # Assert old latencies fall out of the window
+    assert len(tracker) == 20
+    assert tracker.value == 2.0
@@ -1,7 +1,11 @@
+import attr
+import marshmallow
 import pytest
 
 from aiokea.errors import ValidationError
+from aiokea.http.adapters import BaseMarshmallowHTTPAdapter
 from tests.stubs.user.entity import User
+from tests.stubs.user.http_adapter import UserHTTPAdapter, UserHTTPSchema
 
 
 def test_load_to_entity_success(user_http_adapter, user_post):
@@ -32,3 +36,58 @@ def test_dump_from_entity_success(user_http_adapter):
         "created_at": None,
         "updated_at": None,
     }
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {"username": "test", "email": "test@test.com"},
+        {"username": "test", "email": "test@test.com", "is_enabled": "false"},
+        {"username": "test", "email": "test@test.com", "created_at": "2019-06-01"},
+        {"username": 1738},
+        {"username": "test", "email": "test@test.com", "is_enabled": None},
+        {"username": "test", "email": "test@test.com", "id": "1"},
+        ["test"],
+    ],
+)
+def test_compiled_load_matches_marshmallow(user_http_adapter, data):
+    marshmallow_adapter = UserHTTPAdapter()
+    marshmallow_adapter._load = marshmallow_adapter._load_many = None
+
+    def load(adapter):
+        try:
+            user = adapter.to_entity(data)
+        except ValidationError as e:
+            return e.errors
+        return {**attr.asdict(user), "id": None}
+
+    # Assert the compiled loader accepts and rejects what marshmallow does,
+    # with the same errors
+    assert user_http_adapter._load is not None
+    assert load(user_http_adapter) == load(marshmallow_adapter)
+
+
+def test_load_many_to_entities(user_http_adapter, user_post):
+    items = [user_post, {"username": "test"}, {**user_post, "username": "other"}]
+    results = user_http_adapter.to_entities(items)
+
+    # Assert each invalid item gets its own error, in place
+    assert [user.username for user in results[::2]] == ["test", "other"]
+    assert results[1].errors == [{"email": ["Missing data for required field."]}]
+
+
+def test_load_uncompilable_schema():
+    class HookedSchema(UserHTTPSchema):
+        @marshmallow.pre_load
+        def lower_username(self, data, **kwargs):
+            return {**data, "username": data["username"].lower()}
+
+    adapter = BaseMarshmallowHTTPAdapter(schema=HookedSchema(), entity_class=User)
+
+    # Assert schemas with load hooks are left to marshmallow
+    assert adapter._load is None
+    user = adapter.to_entity({"username": "TEST", "email": "test@test.com"})
+    assert user.username == "test"
+    assert adapter.to_entities([{"username": "TEST"}])[0].errors == [
+        {"email": ["Missing data for required field."]}
+    ]
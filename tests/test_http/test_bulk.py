@@ -0,0 +1,150 @@
+import json
+
+from aiohttp import web
+
+from aiokea.http.bulk import AIOHTTPBulkHandler
+from aiokea.repos.aiopg_copy import ImportSummary
+from aiokea.repos.aiopg_engine import create_engine
+from tests.stubs.user.entity import stub_users
+from tests.stubs.user.repo import AIOPGUserRepo, setup_user_repo
+
+
+async def test_export_handler(aiohttp_client, aiopg_conf, user_http_adapter):
+    engine = await create_engine(**aiopg_conf)
+    user_repo = AIOPGUserRepo(engine)
+    async with engine.acquire() as conn:
+        await conn.execute("TRUNCATE TABLE users CASCADE")
+    await setup_user_repo(user_repo)
+    app = web.Application()
+    bulk_handler = AIOHTTPBulkHandler(user_repo, user_http_adapter)
+    app.router.add_get("/api/v1/users/export", bulk_handler.export_handler)
+    client = await aiohttp_client(app)
+    try:
+        # Export disabled users as NDJSON
+        response = await client.get(
+            "/api/v1/users/export", params={"format": "ndjson", "is_enabled": "false"}
+        )
+        assert response.status == 200
+        assert response.content_type == "application/x-ndjson"
+        lines = (await response.read()).splitlines()
+        assert [json.loads(line)["username"] for line in lines] == ["han"]
+
+        # Assert unknown formats are rejected
+        response = await client.get("/api/v1/users/export", params={"format": "xml"})
+        assert response.status == 400
+    finally:
+        engine.close()
+        await engine.wait_closed()
+
+
+class RecordingRepo:
+    """Stands in for AIOPGRepo.import_entities, keeping what it was given"""
+
+    def __init__(self):
+        self.entities = []
+
+    async def import_entities(self, batches):
+        async for batch in batches:
+            self.entities.extend(batch)
+        return ImportSummary(staged=len(self.entities), inserted=len(self.entities))
+
+
+async def test_import_handler_parses_records(aiohttp_client, user_http_adapter):
+    repo = RecordingRepo()
+    app = web.Application()
+    bulk_handler = AIOHTTPBulkHandler(repo, user_http_adapter, import_batch_size=2)
+    app.router.add_post("/api/v1/users/import", bulk_handler.import_handler)
+    client = await aiohttp_client(app)
+
+    # Import CSV with a record spanning lines and an invalid record
+    body = (
+        "username,email\r\n"
+        "dom,dom@example.com\r\n"
+        '"mia ""m""\nt",mia@example.com\r\n'
+        ",no-username@example.com\r\n"
+        "\r\n"
+        "letty,letty@example.com"
+    )
+    response = await client.post("/api/v1/users/import", data=body)
+    assert response.status == 200
+    response_data = await response.json()
+    assert response_data["data"] == {
+        "received": 4,
+        "rejected": 1,
+        "imported": 3,
+        "conflicts": 0,
+    }
+    assert [error["index"] for error in response_data["errors"]] == [2]
+    assert [user.username for user in repo.entities] == ["dom", 'mia "m"\nt', "letty"]
+
+    # Import NDJSON, picked by Content-Type
+    repo.entities = []
+    body = '{"username": "tej", "email": "tej@example.com"}\n[]\nnot json\n'
+    response = await client.post(
+        "/api/v1/users/import",
+        data=body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    response_data = await response.json()
+    assert response_data["data"]["received"] == 3
+    assert response_data["data"]["rejected"] == 2
+    assert [user.username for user in repo.entities] == ["tej"]
+
+
+async def test_import_handler_limits(aiohttp_client, user_http_adapter):
+    app = web.Application()
+    bulk_handler = AIOHTTPBulkHandler(
+        RecordingRepo(), user_http_adapter, max_line_bytes=64
+    )
+    app.router.add_post("/api/v1/users/import", bulk_handler.import_handler)
+    client = await aiohttp_client(app)
+
+    # Assert overlong lines and unterminated quotes fail the whole import
+    response = await client.post(
+        "/api/v1/users/import", data="username,email\n" + "x" * 100
+    )
+    assert response.status == 413
+    response = await client.post(
+        "/api/v1/users/import", data='username,email\n"' + "x\n" * 100
+    )
+    assert response.status == 413
+
+    # Assert unknown formats are rejected
+    response = await client.post("/api/v1/users/import?format=xml", data="")
+    assert response.status == 400
+
+
+async def test_import_handler(aiohttp_client, aiopg_conf, user_http_adapter):
+    engine = await create_engine(**aiopg_conf)
+    user_repo = AIOPGUserRepo(engine)
+    async with engine.acquire() as conn:
+        await conn.execute("TRUNCATE TABLE users CASCADE")
+    await setup_user_repo(user_repo)
+    app = web.Application()
+    bulk_handler = AIOHTTPBulkHandler(user_repo, user_http_adapter)
+    app.router.add_post("/api/v1/users/import", bulk_handler.import_handler)
+    client = await aiohttp_client(app)
+    try:
+        # Import two new users, one twice, and one existing username
+        body = (
+            "username,email\n"
+            "tej,tej@example.com\n"
+            "mia,mia@example.com\n"
+            "mia,mia2@example.com\n"
+            "brian,brian2@example.com\n"
+        )
+        response = await client.post("/api/v1/users/import", data=body)
+        assert response.status == 200
+        response_data = await response.json()
+        assert response_data["data"] == {
+            "received": 4,
+            "rejected": 0,
+            "imported": 2,
+            "conflicts": 2,
+        }
+        users = await user_repo.where()
+        assert len(users) == len(stub_users) + 2
+        assert {"tej", "mia"} <= {user.username for user in users}
+    finally:
+        engine.close()
+        await engine.wait_closed()
@@ -0,0 +1,63 @@
+import gzip
+import zlib
+
+from aiohttp import web
+
+from aiokea.http.compression import Compression, negotiate_encoding
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding("gzip, deflate, br") == "gzip"
+    assert negotiate_encoding("deflate") == "deflate"
+    assert negotiate_encoding("gzip;q=0.5, deflate") == "deflate"
+    assert negotiate_encoding("gzip;q=0, *") == "deflate"
+    assert negotiate_encoding("br") == "identity"
+    assert negotiate_encoding("") == "identity"
+
+
+async def test_compression_middleware(aiohttp_client):
+    compression = Compression(threshold=100, executor_threshold=1000)
+    app = web.Application()
+    compression.setup(app)
+    sizes = {"small": 10, "medium": 500, "large": 5000}
+    for name, size in sizes.items():
+        app.router.add_get(
+            f"/{name}", lambda request, size=size: web.json_response(["x" * size])
+        )
+    client = await aiohttp_client(app, auto_decompress=False)
+
+    # Assert bodies above the threshold are compressed, in and out of an executor
+    for name in ["medium", "large"]:
+        response = await client.get(f"/{name}", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.headers["Vary"] == "Accept-Encoding"
+        assert gzip.decompress(await response.read()) == b'["%s"]' % (
+            b"x" * sizes[name]
+        )
+
+    response = await client.get("/large", headers={"Accept-Encoding": "deflate"})
+    assert response.headers["Content-Encoding"] == "deflate"
+    assert zlib.decompress(await response.read()).startswith(b'["xxx')
+
+    # Assert small bodies and clients not accepting compression get identity
+    response = await client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    response = await client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Vary"] == "Accept-Encoding"
+
+
+async def test_compressed_variants_cached():
+    compression = Compression(threshold=1, cache_bytes=1000)
+    body = b"x" * 500
+
+    # Assert an unchanged body is compressed once per encoding
+    first = await compression._compressed(body, "gzip")
+    assert await compression._compressed(body, "gzip") is first
+    assert await compression._compressed(body, "deflate") is not first
+    assert len(compression._cache) == 2
+
+    # Assert the cache stays within its byte budget
+    for i in range(100):
+        await compression._compressed(body + bytes([i]), "gzip")
+    assert compression._cached_bytes <= compression.cache_bytes
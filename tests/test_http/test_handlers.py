@@ -1,4 +1,10 @@
-from aiokea.http.handlers import _valid_query_params
+from aiohttp import web
+
+from aiokea.abc import IService
+from aiokea.admission import AdmissionController
+from aiokea.http.handlers import AIOHTTPServiceHandler, _valid_query_params
+from aiokea.http.identity_map import identity_map_middleware
+from aiokea.identity_map import IdentityMappedService, current_identity_map
 from tests.stubs.user.entity import stub_users
 
 
@@ -25,6 +31,73 @@ async def test_get_success(http_client):
     assert len(response_data) == len(stub_users)
 
 
+async def test_get_filter_expression(http_client):
+    # GET users matching either of two conditions
+    response = await http_client.get(
+        "/api/v1/users",
+        params={"filter": "or(username.eq.brian,username.in.(han,roman))"},
+    )
+    assert response.status == 200
+    response_body = await response.json()
+    usernames = sorted(user["username"] for user in response_body["data"])
+    assert usernames == ["brian", "han", "roman"]
+
+    # Assert malformed expressions and unknown fields are rejected
+    for expression in ["or(username.eq.brian", "or(password.eq.hunter2)"]:
+        response = await http_client.get("/api/v1/users", params={"filter": expression})
+        assert response.status == 400
+
+
+async def test_get_text_filters(http_client):
+    # GET users by username prefix, bracket style and expression style
+    for params in [{"username[prefix]": "dom"}, {"filter": "username.prefix.dom"}]:
+        response = await http_client.get("/api/v1/users", params=params)
+        assert response.status == 200
+        response_body = await response.json()
+        assert [user["username"] for user in response_body["data"]] == ["domtoretto"]
+
+    # GET users by a case-insensitive substring of their email
+    response = await http_client.get(
+        "/api/v1/users", params={"email[contains]": "LUCK"}
+    )
+    response_body = await response.json()
+    assert [user["username"] for user in response_body["data"]] == ["han"]
+
+
+async def test_get_sort(http_client):
+    # GET users sorted by username, descending
+    response = await http_client.get("/api/v1/users", params={"sort": "-username"})
+    assert response.status == 200
+    response_body = await response.json()
+    usernames = [user["username"] for user in response_body["data"]]
+    assert usernames == sorted(usernames, reverse=True)
+
+    # Assert sorting on an unknown field is rejected
+    response = await http_client.get("/api/v1/users", params={"sort": "password"})
+    assert response.status == 400
+
+
+async def test_get_aggregate(http_client):
+    # GET a count of users per enabled status instead of the users
+    response = await http_client.get(
+        "/api/v1/users",
+        params={"group_by": "is_enabled", "aggregate": "count,max(created_at)"},
+    )
+    assert response.status == 200
+    response_body = await response.json()
+    assert [(g["is_enabled"], g["count"]) for g in response_body["data"]] == [
+        (False, 1),
+        (True, 3),
+    ]
+    # Assert field values are serialized like the resources' own
+    assert all(isinstance(g["max_created_at"], str) for g in response_body["data"])
+
+    # Assert unknown fields and functions are rejected
+    for params in [{"group_by": "password"}, {"aggregate": "sum(id)"}]:
+        response = await http_client.get("/api/v1/users", params=params)
+        assert response.status == 400
+
+
 async def test_post_success(http_client, user_post):
     # GET baseline
     response = await http_client.get("/api/v1/users")
@@ -42,3 +115,137 @@ async def test_post_success(http_client, user_post):
     response = await http_client.get("/api/v1/users")
     response_body = await response.json()
     assert len(response_body["data"]) == old_user_count + 1
+
+
+async def test_post_batch(http_client, user_post):
+    # POST a batch with one valid, one duplicate and one invalid user
+    duplicate_post = dict(user_post, email="other@test.com")
+    invalid_post = dict(user_post, username=1738)
+    response = await http_client.post(
+        "/api/v1/users", json=[user_post, duplicate_post, invalid_post]
+    )
+    assert response.status == 207
+    response_data = (await response.json())["data"]
+    assert [item["status"] for item in response_data] == [200, 409, 422]
+    assert response_data[0]["data"]["username"] == user_post["username"]
+
+    # Check only the valid user was created
+    response = await http_client.get("/api/v1/users")
+    response_body = await response.json()
+    assert len(response_body["data"]) == len(stub_users) + 1
+
+
+async def test_post_batch_atomic_conflict(http_client, user_post):
+    # POST an all-or-nothing batch containing a duplicate
+    duplicate_post = dict(user_post, email="other@test.com")
+    response = await http_client.post(
+        "/api/v1/users?atomic=true", json=[user_post, duplicate_post]
+    )
+    assert response.status == 409
+
+    # Check nothing was created
+    response = await http_client.get("/api/v1/users")
+    response_body = await response.json()
+    assert len(response_body["data"]) == len(stub_users)
+
+
+class NonAtomicUserService(IService):
+    """User service relying on IService's default create_many"""
+
+    def __init__(self, user_repo):
+        self.user_repo = user_repo
+
+    async def get(self, id):
+        return await self.user_repo.get(id)
+
+    async def where(self, filters=None, order_by=None, compact=False, lazy=False):
+        return await self.user_repo.where(filters, order_by, compact, lazy)
+
+    async def first(self, filters=None, order_by=None):
+        return await self.user_repo.first(filters, order_by)
+
+    async def create(self, entity):
+        return await self.user_repo.create(entity)
+
+    async def update(self, entity):
+        return await self.user_repo.update(entity)
+
+    async def delete(self, id):
+        return await self.user_repo.delete(id)
+
+
+async def test_post_batch_atomic_not_supported(
+    aiohttp_client, user_repo, user_http_adapter, user_post
+):
+    user_handler = AIOHTTPServiceHandler(
+        service=NonAtomicUserService(user_repo), adapter=user_http_adapter
+    )
+    app = web.Application()
+    app.router.add_post("/api/v1/users", user_handler.post_handler)
+    client = await aiohttp_client(app)
+
+    # Assert an atomic batch the service cannot honor is a client error
+    response = await client.post("/api/v1/users?atomic=true", json=[user_post])
+    assert response.status == 400
+    assert await response.json() == {"errors": ["atomic_not_supported"]}
+
+    # Assert the batch still works without atomic
+    response = await client.post("/api/v1/users", json=[user_post])
+    assert response.status == 207
+
+
+async def test_get_unsupported_filter(
+    aiohttp_client, sqlite_db, sqlite_user_repo, user_http_adapter
+):
+    user_handler = AIOHTTPServiceHandler(
+        service=sqlite_user_repo, adapter=user_http_adapter
+    )
+    app = web.Application()
+    app.router.add_get("/api/v1/users", user_handler.get_handler)
+    client = await aiohttp_client(app)
+
+    # Assert a filter the repo cannot apply is a client error
+    response = await client.get("/api/v1/users", params={"username[search]": "han"})
+    assert response.status == 400
+    assert await response.json() == {
+        "errors": ["Full-text search is not supported on SQLite"]
+    }
+
+
+async def test_get_overloaded(aiohttp_client, user_repo, user_http_adapter):
+    # Serve users through a handler that admits nothing
+    user_handler = AIOHTTPServiceHandler(
+        service=user_repo,
+        adapter=user_http_adapter,
+        admission=AdmissionController(max_in_flight=0, retry_after=3),
+    )
+    app = web.Application()
+    app.router.add_get("/api/v1/users", user_handler.get_handler)
+    client = await aiohttp_client(app)
+
+    # Assert the request is shed with a hint on when to retry
+    response = await client.get("/api/v1/users")
+    assert response.status == 503
+    assert response.headers["Retry-After"] == "3"
+
+
+async def test_identity_map_middleware(aiohttp_client, user_repo):
+    service = IdentityMappedService(user_repo)
+    user_id = stub_users[0].id
+
+    async def handler(request):
+        first = await service.get(user_id)
+        second = await service.get(user_id)
+        identity_map = current_identity_map()
+        return web.json_response(
+            {"same": first is second, "misses": identity_map.misses}
+        )
+
+    app = web.Application(middlewares=[identity_map_middleware])
+    app.router.add_get("/", handler)
+    client = await aiohttp_client(app)
+
+    # Assert each request gets its own identity map
+    for _ in range(2):
+        response = await client.get("/")
+        assert await response.json() == {"same": True, "misses": 1}
@@ -0,0 +1,21 @@
+from aiohttp import web
+
+from aiokea.http.health import readiness_handler
+
+
+async def test_readiness_handler(aiohttp_client):
+    state = {"ready": False}
+    app = web.Application()
+    app.router.add_get(
+        "/health", readiness_handler(lambda: True, lambda: state["ready"])
+    )
+    client = await aiohttp_client(app)
+
+    # Assert the process reports unavailable until every check passes
+    response = await client.get("/health")
+    assert response.status == 503
+
+    state["ready"] = True
+    response = await client.get("/health")
+    assert response.status == 200
+    assert await response.json() == {"status": "OK"}
@@ -0,0 +1,172 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from aiokea.http.handlers import AIOHTTPServiceHandler
+from aiokea.http.idempotency import (
+    AIOPGIdempotencyStore,
+    Idempotency,
+    MemoryIdempotencyStore,
+    StoredResponse,
+)
+from tests.stubs.user.entity import stub_users
+
+
+@pytest.fixture
+async def idempotent_client(aiohttp_client, user_repo, user_http_adapter):
+    user_handler = AIOHTTPServiceHandler(
+        service=user_repo, adapter=user_http_adapter, idempotency=Idempotency()
+    )
+    app = web.Application()
+    app.router.add_get("/api/v1/users", user_handler.get_handler)
+    app.router.add_post("/api/v1/users", user_handler.post_handler)
+    return await aiohttp_client(app)
+
+
+async def test_post_replayed(idempotent_client, user_post):
+    # POST the same user twice under one key
+    headers = {"Idempotency-Key": "abc"}
+    first = await idempotent_client.post(
+        "/api/v1/users", json=user_post, headers=headers
+    )
+    retry = await idempotent_client.post(
+        "/api/v1/users", json=user_post, headers=headers
+    )
+
+    # Assert the retry got the first response instead of a 409
+    assert first.status == retry.status == 200
+    assert await first.json() == await retry.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+
+    # Assert the user was created once
+    response = await idempotent_client.get("/api/v1/users")
+    assert len((await response.json())["data"]) == len(stub_users) + 1
+
+    # Assert reusing the key for another request is rejected
+    other_post = {**user_post, "username": "other"}
+    response = await idempotent_client.post(
+        "/api/v1/users", json=other_post, headers=headers
+    )
+    assert response.status == 422
+
+
+async def test_post_concurrent_duplicates(idempotent_client, user_post):
+    # POST the same user under one key, concurrently
+    headers = {"Idempotency-Key": "abc"}
+    responses = await asyncio.gather(
+        *(
+            idempotent_client.post("/api/v1/users", json=user_post, headers=headers)
+            for _ in range(3)
+        )
+    )
+
+    # Assert the duplicates waited for the original and share its response
+    assert [response.status for response in responses] == [200, 200, 200]
+    bodies = [await response.json() for response in responses]
+    assert bodies[0] == bodies[1] == bodies[2]
+
+
+async def test_post_error_replayed(idempotent_client):
+    # POST a duplicate user, then retry it
+    duplicate = {"username": "brian", "email": "brian@example.com"}
+    headers = {"Idempotency-Key": "abc"}
+    first = await idempotent_client.post(
+        "/api/v1/users", json=duplicate, headers=headers
+    )
+    retry = await idempotent_client.post(
+        "/api/v1/users", json=duplicate, headers=headers
+    )
+
+    # Assert client errors are stored like any other response
+    assert first.status == retry.status == 409
+    assert "Idempotent-Replayed" in retry.headers
+
+
+class FailingStore(MemoryIdempotencyStore):
+    async def get(self, key):
+        raise ConnectionError("store unavailable")
+
+
+async def test_text_response_replayed_with_charset(aiohttp_client):
+    idempotency = Idempotency()
+
+    async def create_note(request):
+        return web.Response(text="café")
+
+    async def post_note(request):
+        return await idempotency.handle(request, create_note)
+
+    app = web.Application()
+    app.router.add_post("/notes", post_note)
+    client = await aiohttp_client(app)
+    headers = {"Idempotency-Key": "abc"}
+    first = await client.post("/notes", data="note", headers=headers)
+    retry = await client.post("/notes", data="note", headers=headers)
+
+    # Assert the replayed response keeps its charset
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.headers["Content-Type"] == first.headers["Content-Type"]
+    assert retry.charset == "utf-8"
+    assert await retry.text() == "café"
+
+
+async def test_store_errors_run_handler(aiohttp_client, user_repo, user_http_adapter):
+    user_handler = AIOHTTPServiceHandler(
+        service=user_repo,
+        adapter=user_http_adapter,
+        idempotency=Idempotency(FailingStore()),
+    )
+    app = web.Application()
+    app.router.add_post("/api/v1/users", user_handler.post_handler)
+    client = await aiohttp_client(app)
+
+    # Assert a store that cannot be read lets the request through
+    user_post = {"username": "nora", "email": "nora@example.com"}
+    response = await client.post(
+        "/api/v1/users", json=user_post, headers={"Idempotency-Key": "abc"}
+    )
+    assert response.status == 200
+
+
+async def test_memory_store_evicts_least_recently_used():
+    store = MemoryIdempotencyStore(max_entries=2)
+    responses = {
+        key: StoredResponse(200, key.encode(), "application/json", key) for key in "abc"
+    }
+    await store.save("a", responses["a"])
+    await store.save("b", responses["b"])
+    await store.get("a")
+    await store.save("c", responses["c"])
+
+    # Assert the entry unused for longest made room
+    assert await store.get("b") is None
+    assert await store.get("a") == responses["a"]
+    assert await store.get("c") == responses["c"]
+
+    # Assert the first response saved under a key is kept
+    await store.save("a", responses["b"])
+    assert await store.get("a") == responses["a"]
+
+
+async def test_aiopg_store(aiopg_engine):
+    store = AIOPGIdempotencyStore(aiopg_engine, table_name="aiokea_test_idempotency")
+    await store.create_table()
+    try:
+        response = StoredResponse(
+            201, b'{"data": {}}', "application/json", "f", "utf-8"
+        )
+        await store.save("abc", response)
+        await store.save("abc", response._replace(status=409))
+
+        # Assert the first response is kept, and expired ones are purged
+        assert await store.get("abc") == response
+        assert await store.get("xyz") is None
+        store.ttl = 0
+        assert await store.get("abc") is None
+        assert await store.purge_expired() == 1
+    finally:
+        async with aiopg_engine.acquire() as conn:
+            await conn.execute("DROP TABLE aiokea_test_idempotency")
+        aiopg_engine.close()
+        await aiopg_engine.wait_closed()
@@ -0,0 +1,68 @@
+from aiohttp import web
+
+from aiokea.hedging import HedgedService
+from aiokea.http.metrics import HTTPMetrics, Histogram
+
+
+def test_histogram_render():
+    histogram = Histogram("latency", "Latency.", ["route"], buckets=[0.1, 1])
+    for value in [0.05, 0.1, 0.5, 2]:
+        histogram.observe(("/users",), value)
+
+    # Assert buckets are cumulative and inclusive of their upper bound
+    assert list(histogram.render()) == [
+        "# HELP latency Latency.",
+        "# TYPE latency histogram",
+        'latency_bucket{route="/users",le="0.1"} 2',
+        'latency_bucket{route="/users",le="1"} 3',
+        'latency_bucket{route="/users",le="+Inf"} 4',
+        'latency_sum{route="/users"} 2.65',
+        'latency_count{route="/users"} 4',
+    ]
+
+
+async def test_metrics(aiohttp_client):
+    async def get_user(request):
+        if request.match_info["id"] == "missing":
+            raise web.HTTPNotFound()
+        return web.json_response({"data": {"id": request.match_info["id"]}})
+
+    app = web.Application()
+    HTTPMetrics().setup(app)
+    app.router.add_get("/users/{id}", get_user)
+    client = await aiohttp_client(app)
+    for user_id in ["1", "2", "missing"]:
+        await client.get(f"/users/{user_id}")
+    await client.get("/nowhere")
+
+    response = await client.get("/metrics")
+    assert response.status == 200
+    assert (
+        response.headers["Content-Type"] == "text/plain; version=0.0.4; charset=utf-8"
+    )
+    text = await response.text()
+
+    # Assert requests are counted by route pattern and status
+    route = 'method="GET",route="/users/{id}"'
+    assert f'aiokea_http_requests_total{{{route},status="200"}} 2' in text
+    assert f'aiokea_http_requests_total{{{route},status="404"}} 1' in text
+    assert f"aiokea_http_request_duration_seconds_count{{{route}}} 3" in text
+    assert 'route="unmatched",status="404"} 1' in text
+    assert f"aiokea_http_requests_in_flight{{{route}}} 0" in text
+
+
+def test_metrics_hedging():
+    metrics = HTTPMetrics()
+    assert "aiokea_hedging" not in metrics.render()
+
+    hedged = HedgedService(service=None)
+    hedged.stats.reads, hedged.stats.fired, hedged.stats.won = 20, 2, 1
+    metrics.track_hedging("users", hedged)
+    text = metrics.render()
+
+    # Assert hedging stats are exported as counters per service
+    assert "# TYPE aiokea_hedging_reads_total counter" in text
+    assert 'aiokea_hedging_reads_total{service="users"} 20' in text
+    assert 'aiokea_hedging_fired_total{service="users"} 2' in text
+    assert 'aiokea_hedging_won_total{service="users"} 1' in text
+    assert 'aiokea_hedging_skipped_total{service="users"} 0' in text
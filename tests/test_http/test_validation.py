@@ -0,0 +1,43 @@
+import marshmallow
+import pytest
+from marshmallow import fields
+
+from aiokea.http.validation import INVALID, compile_loader
+
+# `missing` was renamed `load_default` in marshmallow 3.13
+LOAD_DEFAULT = "load_default" if hasattr(fields.Field(), "load_default") else "missing"
+
+
+class OptionsSchema(marshmallow.Schema):
+    answer = fields.Boolean(truthy={"yes"}, falsy={"no"})
+    flag = fields.Boolean(data_key="isFlag", **{LOAD_DEFAULT: False})
+    count = fields.Integer(strict=True, validate=marshmallow.validate.Range(min=0))
+    name = fields.String(validate=marshmallow.validate.Length(max=3))
+    tags = fields.List(fields.String(), **{LOAD_DEFAULT: list})
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {},
+        {"answer": "yes", "isFlag": True},
+        {"answer": True},
+        {"answer": "no", "flag": True},
+        {"count": 1, "name": "abc"},
+        {"count": -1},
+        {"count": "1"},
+        {"name": "abcd"},
+        {"tags": ["a", 1]},
+    ],
+)
+def test_compiled_loader_matches_schema_load(data):
+    schema = OptionsSchema()
+    load = compile_loader(schema)
+    try:
+        expected = schema.load(data)
+    except marshmallow.ValidationError:
+        expected = INVALID
+
+    # Assert non-default field options are honoured, not bypassed
+    assert load(data) == expected
+    assert compile_loader(schema, many=True)([data]) == [expected]
@@ -0,0 +1,33 @@
+import pytest
+
+from aiokea.http.workers import _restart_delay, split_pool_conf
+
+
+def test_split_pool_conf():
+    pool_conf = {"host": "db", "minsize": 4, "maxsize": 10, "max_copy_connections": 4}
+
+    # Assert the pool is divided between workers, leaving other settings alone
+    assert split_pool_conf(pool_conf, 4) == {
+        "host": "db",
+        "minsize": 1,
+        "maxsize": 2,
+        "max_copy_connections": 1,
+    }
+
+    # Assert every worker keeps at least one COPY connection
+    assert split_pool_conf(pool_conf, 10) == {
+        "host": "db",
+        "minsize": 1,
+        "maxsize": 1,
+        "max_copy_connections": 1,
+    }
+
+    # Assert the pool cannot be split between more workers than connections
+    with pytest.raises(ValueError):
+        split_pool_conf(pool_conf, 11)
+
+
+def test_restart_delay():
+    # Assert restarts back off exponentially, up to the maximum
+    delays = [_restart_delay(crashes, 1.0, 30.0) for crashes in range(7)]
+    assert delays == [1.0, 2.0, 4.0, 8.0, 16.0, 30.0, 30.0]
@@ -0,0 +1,55 @@
+from aiokea.filters import Filter, FilterOperators
+from aiokea.identity_map import (
+    IdentityMappedService,
+    current_identity_map,
+    identity_scope,
+)
+from tests.stubs.user.entity import stub_users
+
+
+async def test_get_served_from_identity_map(user_repo):
+    service = IdentityMappedService(user_repo)
+    user_id = stub_users[0].id
+
+    # Assert repeated lookups in a scope hit the repo once
+    with identity_scope() as identity_map:
+        user = await service.get(user_id)
+        assert await service.get(user_id) is user
+        assert (identity_map.hits, identity_map.misses) == (1, 1)
+
+    # Assert nothing is kept outside a scope, or across scopes
+    assert current_identity_map() is None
+    assert await service.get(user_id) is not user
+    with identity_scope():
+        assert await service.get(user_id) is not user
+
+
+async def test_where_and_writes_update_identity_map(user_repo):
+    service = IdentityMappedService(user_repo)
+    with identity_scope() as identity_map:
+        # Assert entities listed by where are then served by get
+        users = await service.where([Filter("username", FilterOperators.EQ, "brian")])
+        assert await service.get(users[0].id) is users[0]
+        assert identity_map.misses == 0
+
+        # Assert updates replace the mapped entity
+        users[0].email = "brian@example.com"
+        updated = await service.update(users[0])
+        assert await service.get(updated.id) is updated
+
+        # Assert deletes drop it
+        await service.delete(updated.id)
+        assert identity_map.get(service, updated.id) is None
+
+
+async def test_reloaded_entities_keep_mapped_instance(user_repo):
+    service = IdentityMappedService(user_repo)
+    with identity_scope():
+        user = await service.get(stub_users[0].id)
+        user.email = "unsaved@example.com"
+
+        # Assert loading a mapped id again hands out the mapped instance
+        users = await service.where()
+        assert [u for u in users if u.id == user.id][0] is user
+        assert await service.first([Filter("id", FilterOperators.EQ, user.id)]) is user
+        assert user.email == "unsaved@example.com"
@@ -0,0 +1,35 @@
+import subprocess
+import sys
+from typing import Set
+
+
+def _modules_loaded_by(module: str) -> Set[str]:
+    completed = subprocess.run(
+        [sys.executable, "-c", f"import sys, {module}; print(*sys.modules)"],
+        stdout=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    )
+    return set(completed.stdout.split())
+
+
+def test_repos_package_imports_backends_lazily():
+    loaded = _modules_loaded_by("aiokea.repos")
+    assert not {"sqlalchemy", "aiopg", "psycopg2", "marshmallow"} & loaded
+
+
+def test_aiopg_repo_defers_driver_imports():
+    loaded = _modules_loaded_by("aiokea.repos.aiopg")
+    assert not {"aiopg", "psycopg2", "marshmallow"} & loaded
+
+
+def test_http_handlers_skip_repo_dependencies():
+    loaded = _modules_loaded_by("aiokea.http.handlers")
+    assert not {"sqlalchemy", "aiopg", "psycopg2", "marshmallow"} & loaded
+
+
+def test_repos_package_lazy_attribute():
+    from aiokea import repos
+    from aiokea.repos.sqlite import SQLiteRepo
+
+    assert repos.SQLiteRepo is SQLiteRepo
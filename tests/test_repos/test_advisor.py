@@ -0,0 +1,123 @@
+from aiokea.filters import CONTAINS, EQ, GT, IN, LT, NE, PREFIX, SEARCH, And, Filter, Or
+from aiokea.repos.advisor import (
+    FilterShapeRecorder,
+    ShapeStats,
+    advise,
+    filter_shape,
+    suggest_indexes,
+)
+from aiokea.repos.aiopg import AIOPGRepo
+from tests.stubs.user.repo import USER
+from tests.stubs.user.repo_adapter import UserRepoAdapter
+
+
+def test_filter_shape():
+    # Assert shapes ignore values and operand order
+    assert filter_shape(
+        [Or(Filter("username", EQ, "brian"), Filter("id", IN, ["1", "2"]))]
+    ) == filter_shape([Or(Filter("id", IN, ["3"]), Filter("username", EQ, "han"))])
+    assert filter_shape([Filter("username", EQ, "brian")]) == "username.eq.?"
+    assert filter_shape([]) == ""
+
+
+def test_recorder():
+    recorder = FilterShapeRecorder(max_shapes=2)
+    recorder.record("users", [Filter("username", EQ, "brian")], 0.1)
+    recorder.record("users", [Filter("username", EQ, "han")], 0.3)
+    recorder.record("users", [], 0.2)
+    recorder.record("users", [Filter("email", EQ, "x")], 1.0)
+
+    # Assert calls are aggregated per shape, costliest first, up to max_shapes
+    top = recorder.top()
+    assert [stats.shape.filters for stats in top] == ["username.eq.?", ""]
+    assert top[0].count == 2
+    assert top[0].max_latency == 0.3
+
+    # Assert snapshots round-trip
+    restored = [ShapeStats.from_dict(data) for data in recorder.snapshot()]
+    assert [stats.shape for stats in restored] == [stats.shape for stats in top]
+
+
+def test_suggest_indexes():
+    expression = Or(
+        And(
+            Filter("created_at", GT, "2019"),
+            Filter("username", EQ, "brian"),
+            Filter("updated_at", LT, "2020"),
+        ),
+        Filter("email", NE, "x"),
+        Filter("is_enabled", EQ, False),
+    )
+
+    # Assert one index per OR branch, equality columns first, one range column
+    assert suggest_indexes("users", expression) == [
+        'CREATE INDEX CONCURRENTLY ON "users" ("username", "created_at")',
+        'CREATE INDEX CONCURRENTLY ON "users" ("is_enabled")',
+    ]
+
+
+def test_suggest_sorted_indexes():
+    expression = And(Filter("is_enabled", EQ, True), Filter("created_at", GT, "2019"))
+
+    # Assert sort fields follow equality fields when the range field leads them
+    assert suggest_indexes("users", expression, ["-created_at", "-id"]) == [
+        'CREATE INDEX CONCURRENTLY ON "users" ("is_enabled", "created_at", "id")'
+    ]
+    assert suggest_indexes("users", expression, ["-created_at", "id"]) == [
+        'CREATE INDEX CONCURRENTLY ON "users" '
+        '("is_enabled", "created_at" DESC, "id")'
+    ]
+
+    # Assert a sort the range field cannot lead is left out
+    assert suggest_indexes("users", expression, ["username"]) == [
+        'CREATE INDEX CONCURRENTLY ON "users" ("is_enabled", "created_at")'
+    ]
+
+
+def test_suggest_text_indexes():
+    expression = Or(
+        And(Filter("username", PREFIX, "dom"), Filter("is_enabled", EQ, True)),
+        Filter("email", CONTAINS, "fast"),
+        Filter("username", SEARCH, "dom toretto"),
+    )
+
+    # Assert text filters get GIN indexes in place of B-trees
+    assert suggest_indexes("users", expression) == [
+        'CREATE INDEX CONCURRENTLY ON "users" USING gin ("username" gin_trgm_ops)',
+        'CREATE INDEX CONCURRENTLY ON "users" USING gin ("email" gin_trgm_ops)',
+        'CREATE INDEX CONCURRENTLY ON "users" '
+        "USING gin (to_tsvector('simple'::regconfig, \"username\"))",
+    ]
+
+
+async def test_advise(aiopg_db, aiopg_engine):
+    # Filter users on an unindexed column through a recording repo
+    recorder = FilterShapeRecorder()
+    user_repo = AIOPGRepo(UserRepoAdapter(), aiopg_engine, USER, recorder=recorder)
+    await user_repo.where([Filter("is_enabled", EQ, False)])
+
+    # Assert the sequential scan is reported with an index to fix it
+    [advice] = await advise(aiopg_engine, recorder.top(), min_rows=0)
+    assert [relation for relation, _ in advice.seq_scans] == ["users"]
+    assert advice.suggested_indexes == [
+        'CREATE INDEX CONCURRENTLY ON "users" ("is_enabled")'
+    ]
+
+    # Assert small tables are not worth reporting
+    [advice] = await advise(aiopg_engine, recorder.top(), min_rows=10**9)
+    assert advice.seq_scans == []
+
+
+async def test_recorded_sort(aiopg_db, aiopg_engine):
+    # Get the newest enabled user through a recording repo
+    recorder = FilterShapeRecorder()
+    user_repo = AIOPGRepo(UserRepoAdapter(), aiopg_engine, USER, recorder=recorder)
+    await user_repo.first([Filter("is_enabled", EQ, True)], order_by=["-created_at"])
+
+    # Assert the sort is part of the shape, and of the suggested index
+    [stats] = recorder.top()
+    assert stats.shape.sort == ("-created_at",)
+    [advice] = await advise(aiopg_engine, [stats], min_rows=0)
+    assert advice.suggested_indexes == [
+        'CREATE INDEX CONCURRENTLY ON "users" ("is_enabled", "created_at")'
+    ]
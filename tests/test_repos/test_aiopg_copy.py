@@ -0,0 +1,184 @@
+import asyncio
+import csv
+import io
+import json
+import threading
+import time
+
+import pytest
+
+from aiokea.filters import EQ, Filter
+from aiokea.repos.aiopg_copy import (
+    CSV,
+    NDJSON,
+    CopyGate,
+    copy_to,
+    copy_to_sql,
+    run_blocking,
+)
+from aiokea.repos.aiopg_engine import create_engine
+from tests.stubs.user.repo import AIOPGUserRepo, setup_user_repo
+
+
+class FakeConnection:
+    """psycopg2 connection whose COPY writes `rows`, for the thread handoff"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.cancelled = False
+        self.closed = False
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def mogrify(self, sql, params):
+        return (sql % params).encode()
+
+    def copy_expert(self, sql, file):
+        for row in self.rows:
+            if self.cancelled:
+                raise RuntimeError("canceling statement due to user request")
+            file.write(row)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def close(self):
+        self.closed = True
+
+
+def test_copy_to_sql():
+    assert copy_to_sql("SELECT 1", CSV) == (
+        "COPY (SELECT 1) TO STDOUT WITH (FORMAT csv, HEADER true)"
+    )
+    assert "row_to_json" in copy_to_sql("SELECT 1", NDJSON)
+    with pytest.raises(ValueError):
+        copy_to_sql("SELECT 1", "xml")
+
+
+async def test_copy_to_chunks():
+    rows = [b"%05d\n" % i for i in range(10000)]
+    conn = FakeConnection(rows)
+
+    # Copy with small chunks and little room between the thread and the loop
+    chunks = [
+        chunk
+        async for chunk in copy_to(
+            lambda: conn, "COPY %(x)s", {"x": 1}, chunk_size=1000, max_chunks=2
+        )
+    ]
+
+    # Assert every row arrived, in order, in chunks of about chunk_size
+    assert b"".join(chunks) == b"".join(rows)
+    assert all(len(chunk) < 1006 for chunk in chunks)
+    assert len(chunks) == 60
+    assert conn.closed
+
+
+async def test_copy_to_aborted():
+    conn = FakeConnection(b"row\n" for _ in range(10**9))
+
+    # Stop reading after the first chunk
+    chunks = copy_to(lambda: conn, "COPY %(x)s", {"x": 1}, chunk_size=100)
+    assert await chunks.__anext__()
+    await chunks.aclose()
+
+    # Assert the COPY was cancelled and its connection closed
+    assert conn.cancelled
+    assert conn.closed
+
+
+async def test_copy_gate_bounds_connections():
+    connections = []
+
+    def connect():
+        connections.append(FakeConnection([]))
+        return connections[-1]
+
+    gate = CopyGate(connect, max_connections=1)
+    first_open = asyncio.Event()
+    release = asyncio.Event()
+
+    async def hold():
+        async with gate.connection():
+            first_open.set()
+            await release.wait()
+
+    holder = asyncio.ensure_future(hold())
+    await first_open.wait()
+    waiter = asyncio.ensure_future(gate.connection().__aenter__())
+    await asyncio.sleep(0.05)
+
+    # Assert a second connection waits for the first one to be closed
+    assert len(connections) == 1 and not waiter.done()
+    release.set()
+    await holder
+    conn = await asyncio.wait_for(waiter, 1)
+    assert connections[0].closed and conn is connections[1]
+    gate.close()
+
+
+async def test_run_blocking_cancelled():
+    conn = FakeConnection([])
+    finished = threading.Event()
+
+    def copy_until_cancelled():
+        try:
+            while not conn.cancelled:
+                time.sleep(0.01)
+        finally:
+            time.sleep(0.05)
+            finished.set()
+
+    gate = CopyGate(lambda: conn, max_connections=1)
+    call = asyncio.ensure_future(
+        run_blocking(conn, gate.executor, copy_until_cancelled)
+    )
+    await asyncio.sleep(0.05)
+    call.cancel()
+
+    # Assert the statement was cancelled, and the call waited for the thread
+    with pytest.raises(asyncio.CancelledError):
+        await call
+    assert conn.cancelled
+    assert finished.is_set()
+    gate.close()
+
+
+async def test_export(aiopg_conf):
+    engine = await create_engine(**aiopg_conf)
+    user_repo = AIOPGUserRepo(engine)
+    async with engine.acquire() as conn:
+        await conn.execute("TRUNCATE TABLE users CASCADE")
+    await setup_user_repo(user_repo)
+    try:
+        # Export enabled users as CSV, sorted
+        chunks = user_repo.export(
+            filters=[Filter("is_enabled", EQ, True)],
+            order_by=["username"],
+            fields=["username", "email"],
+        )
+        body = b"".join([chunk async for chunk in chunks]).decode()
+        rows = list(csv.DictReader(io.StringIO(body)))
+        assert [row["username"] for row in rows] == ["brian", "domtoretto", "roman"]
+        assert set(rows[0]) == {"username", "email"}
+
+        # Export every user as NDJSON
+        chunks = user_repo.export(format=NDJSON)
+        lines = b"".join([chunk async for chunk in chunks]).splitlines()
+        users = [json.loads(line) for line in lines]
+        assert sorted(user["username"] for user in users) == [
+            "brian",
+            "domtoretto",
+            "han",
+            "roman",
+        ]
+    finally:
+        engine.close()
+        await engine.wait_closed()
@@ -0,0 +1,117 @@
+import asyncio
+
+import aiopg
+
+from aiokea.repos.aiopg_engine import (
+    PrePingPool,
+    create_engine,
+    warm_up_with_retry,
+)
+
+
+async def _backend_pid(engine) -> int:
+    async with engine.acquire() as conn:
+        return await conn.scalar("SELECT pg_backend_pid()")
+
+
+async def test_warm_up(aiopg_conf):
+    engine = await create_engine(minsize=3, warm_up=False, **aiopg_conf)
+    assert not engine.ready
+
+    # Assert warming up opens minsize connections before anything is acquired
+    await engine.warm_up()
+    assert engine.ready
+    assert engine.size == engine.freesize == 3
+
+    engine.close()
+    await engine.wait_closed()
+    assert not engine.ready
+
+
+async def test_warm_up_with_retry():
+    class UnreachableEngine:
+        def __init__(self, failures):
+            self.failures = failures
+            self.attempts = 0
+
+        async def warm_up(self):
+            self.attempts += 1
+            if self.attempts <= self.failures:
+                raise OSError("could not connect to server")
+
+    # Assert warming up is retried until the database can be reached
+    engine = UnreachableEngine(failures=2)
+    await warm_up_with_retry(engine, initial_delay=0.001)
+    assert engine.attempts == 3
+
+
+async def test_acquire_discards_unusable_connections(monkeypatch):
+    class FakeConnection:
+        def __init__(self, closed):
+            self.closed = closed
+            self.last_usage = asyncio.get_event_loop().time()
+
+        async def close(self):
+            self.closed = True
+
+    checked_out = [FakeConnection(closed=True), FakeConnection(closed=False)]
+    released = []
+
+    async def acquire(pool):
+        return checked_out.pop(0)
+
+    async def release(conn):
+        released.append(conn)
+
+    monkeypatch.setattr(aiopg.Pool, "acquire", lambda pool: acquire(pool))
+    pool = PrePingPool(
+        "",
+        0,
+        2,
+        1.0,
+        enable_json=False,
+        enable_hstore=False,
+        enable_uuid=False,
+        echo=False,
+        pool_recycle=-1,
+    )
+    monkeypatch.setattr(pool, "release", release)
+    dead, alive = checked_out
+
+    # Assert a dead connection is released and replaced, both when awaited
+    # and when used as a context manager
+    assert await pool.acquire() is alive
+    assert released == [dead]
+    checked_out.append(alive)
+    async with pool.acquire() as conn:
+        assert conn is alive
+    assert released == [dead, alive]
+
+
+async def test_pre_ping_drops_dead_connections(aiopg_conf):
+    engine = await create_engine(pre_ping_after=0, **aiopg_conf)
+    pid = await _backend_pid(engine)
+
+    # Kill the pooled connection from the server side
+    killer = await create_engine(**aiopg_conf)
+    async with killer.acquire() as conn:
+        await conn.execute("SELECT pg_terminate_backend(%s)", pid)
+    killer.close()
+    await killer.wait_closed()
+
+    # Assert checkout replaces the dead connection instead of handing it out
+    assert await _backend_pid(engine) != pid
+
+    engine.close()
+    await engine.wait_closed()
+
+
+async def test_max_age(aiopg_conf):
+    engine = await create_engine(max_age=0, **aiopg_conf)
+
+    # Assert every checkout past the maximum age gets a fresh connection
+    first_pid = await _backend_pid(engine)
+    assert await _backend_pid(engine) != first_pid
+
+    engine.close()
+    await engine.wait_closed()
@@ -1,137 +1,134 @@
-from typing import Optional, List
+import asyncio
+from typing import List
 
 import pytest
 
-from aiokea.errors import DuplicateResourceError, ResourceNotFoundError
-from aiokea.filters import Filter, EQ, NE
+from aiokea.errors import DuplicateResourceError, StatementTimeoutError
+from aiokea.filters import Filter, SEARCH
+from aiokea.repos.aiopg import AIOPGRepo, statement_timeout
+from aiokea.repos.notifications import AIOPGChangeListener, Change, CREATE, DELETE
 from tests.stubs.user.entity import User, stub_users
+from tests.stubs.user.repo import USER
+from tests.stubs.user.repo_adapter import UserRepoAdapter
 
 
-async def test_get(aiopg_db, aiopg_user_repo):
-    # Insert a user
-    new_user = await aiopg_user_repo.create(
-        User(username="test", email="test@test.com")
-    )
-
-    # Assert we can retrieve user by its id
-    retrieved_user = await aiopg_user_repo.get(id=new_user.id)
-    assert retrieved_user == new_user
+async def test_statement_timeout(aiopg_db, aiopg_engine):
+    user_repo = AIOPGRepo(UserRepoAdapter(), aiopg_engine, USER, statement_timeout=0.1)
+    async with aiopg_engine.acquire() as lock_conn:
+        # Block every read of the users table until the lock is released
+        lock = await lock_conn.begin()
+        await lock_conn.execute("LOCK TABLE users IN ACCESS EXCLUSIVE MODE")
 
+        # Assert a read outliving the repo's timeout is cancelled
+        with pytest.raises(StatementTimeoutError):
+            await user_repo.where()
 
-async def test_get_not_found(aiopg_db, aiopg_user_repo):
-    # Attempt to retrieve user by nonexistent ID
-    with pytest.raises(ResourceNotFoundError):
-        _ = await aiopg_user_repo.get(id="xxx")
+        # Assert a block can tighten the timeout
+        with statement_timeout(0.05):
+            with pytest.raises(StatementTimeoutError):
+                await user_repo.first()
 
+        # Assert statement_timeout(None) waits past the repo's timeout
+        loop = asyncio.get_event_loop()
+        loop.call_later(0.3, lambda: asyncio.ensure_future(lock.rollback()))
+        with statement_timeout(None):
+            assert len(await user_repo.where()) == len(stub_users)
 
-async def test_where(aiopg_db, aiopg_user_repo):
-    # Get baseline
-    stub_count = len(stub_users)
+    # Assert the cancelled statements left their connections reusable
+    assert await user_repo.first() is not None
 
-    # Get all user by using no filters
-    results: List[User] = await aiopg_user_repo.where()
-    assert len(results) == stub_count
 
-    # Get all user as disjoint sets by using equal to and not equal to
-    result_equal_to: List[User] = await aiopg_user_repo.where(
-        [Filter("username", EQ, "brian")]
+async def test_where_search(aiopg_db, aiopg_user_repo):
+    # Get users by full-text search, Postgres only
+    results: List[User] = await aiopg_user_repo.where(
+        [Filter("username", SEARCH, "Roman")]
     )
-    result_not_equal_to: List[User] = await aiopg_user_repo.where(
-        [Filter("username", NE, "brian")]
-    )
-
-    # Assert the total equals the the sum of the two disjoint sets
-    assert len(result_equal_to) + len(result_not_equal_to) == stub_count
+    assert [user.username for user in results] == ["roman"]
 
+    # Assert every word must match
+    assert await aiopg_user_repo.where([Filter("username", SEARCH, "han solo")]) == []
 
-async def test_first(aiopg_db, aiopg_user_repo):
-    # Get baseline of all user
-    users: List[User] = await aiopg_user_repo.where()
 
-    # Use convenience method to get first user
-    first_user: User = await aiopg_user_repo.first()
+async def test_change_notifications(aiopg_db, aiopg_conf, aiopg_engine):
+    # Listen for changes to users
+    listener = AIOPGChangeListener("aiokea_test_changes", **aiopg_conf)
+    changes = asyncio.Queue()
+    resets = []
+    listener.subscribe(changes.put_nowait, lambda: resets.append(True))
+    await listener.start()
 
-    # Compare first_where user with first where user
-    assert first_user == users[0]
+    # Assert the initial LISTEN flushed subscribers
+    assert resets == [True]
 
-
-async def test_first_no_results(aiopg_db, aiopg_user_repo):
-    # Attempt to retrieve user by nonexistent ID
-    user: Optional[User] = await aiopg_user_repo.first(
-        filters=[Filter("id", EQ, "xxx")]
+    # Write through a repo that announces its changes
+    user_repo = AIOPGRepo(
+        UserRepoAdapter(), aiopg_engine, USER, notify_channel="aiokea_test_changes"
     )
+    new_user = await user_repo.create(User(username="test", email="test@test.com"))
+    await user_repo.delete(new_user.id)
 
-    # Assert None was returned
-    assert user is None
-
-
-async def test_insert(aiopg_db, aiopg_user_repo):
-    # Get baseline
-    old_user_count = len(stub_users)
+    # Assert each committed write arrived as a change
+    create = await asyncio.wait_for(changes.get(), 1)
+    delete = await asyncio.wait_for(changes.get(), 1)
+    assert create == Change(table="users", id=new_user.id, operation=CREATE)
+    assert delete == Change(table="users", id=new_user.id, operation=DELETE)
 
-    # Insert a user
-    new_user = User(username="test", email="test@test.com")
-    inserted_user = await aiopg_user_repo.create(new_user)
+    await listener.stop()
 
-    # Assert that the user took the id we generated within the app
-    assert inserted_user.id == new_user.id
 
-    # Assert we have one more user in the repo
-    new_user_count = len(await aiopg_user_repo.where())
-    assert new_user_count == old_user_count + 1
+async def test_change_listener_survives_failures():
+    listener = AIOPGChangeListener("aiokea_test_changes", reconnect_delay=0)
+    changes = []
 
+    def failing_subscriber(change):
+        raise RuntimeError("cache is broken")
 
-async def test_create_duplicate_error(aiopg_db, aiopg_user_repo):
-    # Get baseline
-    old_user_count = len(await aiopg_user_repo.where())
+    listener.subscribe(failing_subscriber)
+    listener.subscribe(changes.append)
 
-    # Create a user
-    new_user = User(username="test", email="test@test.com")
-    await aiopg_user_repo.create(new_user)
+    # Assert a failing subscriber does not keep others from their changes
+    listener._dispatch('{"table": "users", "id": "1", "operation": "delete"}')
+    assert changes == [Change(table="users", id="1", operation=DELETE)]
 
-    # Attempt to re-create the same user
-    with pytest.raises(DuplicateResourceError):
-        await aiopg_user_repo.create(new_user)
+    # Fail the first connection with something other than a connection error
+    attempts = []
 
-    # Check that only one user was created
-    new_user_count = len(await aiopg_user_repo.where())
-    assert new_user_count == old_user_count + 1
+    async def listen():
+        attempts.append(True)
+        if len(attempts) == 1:
+            raise RuntimeError("unexpected")
+        listener.listening.set()
+        await asyncio.Event().wait()
 
+    listener._listen = listen
 
-async def test_update(aiopg_db, aiopg_user_repo):
-    # Get an existing user
-    roman: User = await aiopg_user_repo.first([Filter("username", EQ, "roman")])
-    roman.username = "bigassforehead"
-    # Update the user
-    await aiopg_user_repo.update(roman)
+    # Assert the listener logged it and reconnected
+    await asyncio.wait_for(listener.start(), 1)
+    assert len(attempts) == 2
+    await listener.stop()
 
-    # Check that the user has been updated
-    updated_roman: User = await aiopg_user_repo.first([Filter("id", EQ, roman.id)])
-    assert updated_roman.username == "bigassforehead"
 
+async def test_batched_creates(aiopg_db, aiopg_engine):
+    user_repo = AIOPGRepo(
+        UserRepoAdapter(), aiopg_engine, USER, create_batch_window=0.01
+    )
 
-async def test_delete(aiopg_db, aiopg_user_repo):
-    # Get baseline
-    old_users: List[User] = await aiopg_user_repo.where()
-    old_user_count = len(await aiopg_user_repo.where())
-
-    # Delete a user
-    first_old_user = old_users[0]
-    deleted_user = await aiopg_user_repo.delete(id=first_old_user.id)
-
-    # Assert that delete returned the deleted user
-    assert deleted_user == first_old_user
-
-    # Assert the deleted user is not available from the repo
-    new_users: List[User] = await aiopg_user_repo.where()
-    assert deleted_user not in new_users
-
-    # Assert we have one fewer user in the repo
-    new_user_count = len(new_users)
-    assert new_user_count == old_user_count - 1
+    # Create users concurrently, one of them a duplicate of a stub user
+    new_users = [
+        User(username="test", email="test@test.com"),
+        User(username="brian", email="brian@test.com"),
+        User(username="test2", email="test2@test.com"),
+    ]
+    results = await asyncio.gather(
+        *[user_repo.create(user) for user in new_users], return_exceptions=True
+    )
 
+    # Assert each caller got its own entity or its own error
+    assert results[0].id == new_users[0].id
+    assert isinstance(results[1], DuplicateResourceError)
+    assert results[2].id == new_users[2].id
 
-async def test_delete_not_found(aiopg_db, aiopg_user_repo):
-    # Attempt to delete user by nonexistent ID
-    with pytest.raises(ResourceNotFoundError):
-        _ = await aiopg_user_repo.delete(id="xxx")
+    # Assert a closed repo refuses further batched creates
+    await user_repo.close()
+    with pytest.raises(RuntimeError):
+        await user_repo.create(User(username="test3", email="test3@test.com"))
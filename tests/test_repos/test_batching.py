@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from aiokea.repos.batching import MicroBatcher
+
+
+async def test_submit_coalesces_into_batches():
+    batches = []
+
+    async def flush(items):
+        batches.append(items)
+        return [ValueError(item) if item < 0 else item * 2 for item in items]
+
+    batcher = MicroBatcher(flush, window=0.01, max_size=3)
+
+    # Submit more items at once than fit in one batch
+    results = await asyncio.gather(
+        *[batcher.submit(item) for item in [1, -2, 3, 4]], return_exceptions=True
+    )
+
+    # Assert full batches flush right away and the remainder after the window
+    assert batches == [[1, -2, 3], [4]]
+
+    # Assert each caller got its own result or its own error
+    assert results[0] == 2
+    assert isinstance(results[1], ValueError)
+    assert results[2:] == [6, 8]
+
+
+async def test_submit_cancelled_before_flush():
+    batches = []
+
+    async def flush(items):
+        batches.append(items)
+        return items
+
+    batcher = MicroBatcher(flush, window=0.01, max_size=10)
+
+    # Cancel one of two callers before their batch flushes
+    cancelled = asyncio.ensure_future(batcher.submit(1))
+    kept = asyncio.ensure_future(batcher.submit(2))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+
+    # Assert the cancelled item is left out of the batch
+    assert await kept == 2
+    assert batches == [[2]]
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+
+
+async def test_flush_cancelled():
+    flushing = asyncio.Event()
+
+    async def flush(items):
+        flushing.set()
+        await asyncio.sleep(10)
+
+    batcher = MicroBatcher(flush, window=0, max_size=10)
+    submitted = asyncio.ensure_future(batcher.submit(1))
+    await flushing.wait()
+
+    # Assert cancelling the flush in flight cancels its callers, not strands them
+    for flush_task in batcher._flushes:
+        flush_task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await asyncio.wait_for(submitted, 1)
+
+
+async def test_close():
+    batches = []
+
+    async def flush(items):
+        batches.append(items)
+        return items
+
+    batcher = MicroBatcher(flush, window=10, max_size=10)
+    submitted = asyncio.ensure_future(batcher.submit(1))
+    await asyncio.sleep(0)
+
+    # Assert closing flushes pending items without waiting out the window
+    await asyncio.wait_for(batcher.close(), 1)
+    assert batches == [[1]]
+    assert await submitted == 1
+
+    # Assert nothing more is taken once closed
+    with pytest.raises(RuntimeError):
+        await batcher.submit(2)
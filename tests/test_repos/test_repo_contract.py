@@ -0,0 +1,296 @@
+from typing import Optional, List
+
+import pytest
+
+from aiokea.aggregates import COUNT, MAX, MIN, Metric
+from aiokea.abc import IService
+from aiokea.errors import DuplicateResourceError, ResourceNotFoundError
+from aiokea.filters import Filter, EQ, NE, IN, CONTAINS, PREFIX, Not, Or
+from tests.stubs.user.entity import User, stub_users
+from tests.stubs.user.repo_adapter import UserRepoAdapter
+
+
+async def test_get(user_repo):
+    # Insert a user
+    new_user = await user_repo.create(User(username="test", email="test@test.com"))
+
+    # Assert we can retrieve user by its id
+    retrieved_user = await user_repo.get(id=new_user.id)
+    assert retrieved_user == new_user
+
+
+async def test_get_not_found(user_repo):
+    # Attempt to retrieve user by nonexistent ID
+    with pytest.raises(ResourceNotFoundError):
+        _ = await user_repo.get(id="xxx")
+
+
+async def test_where(user_repo):
+    # Get baseline
+    stub_count = len(stub_users)
+
+    # Get all user by using no filters
+    results: List[User] = await user_repo.where()
+    assert len(results) == stub_count
+
+    # Get all user as disjoint sets by using equal to and not equal to
+    result_equal_to: List[User] = await user_repo.where(
+        [Filter("username", EQ, "brian")]
+    )
+    result_not_equal_to: List[User] = await user_repo.where(
+        [Filter("username", NE, "brian")]
+    )
+
+    # Assert the total equals the the sum of the two disjoint sets
+    assert len(result_equal_to) + len(result_not_equal_to) == stub_count
+
+
+async def test_where_compact(user_repo):
+    users: List[User] = await user_repo.where()
+    rows = await user_repo.where(compact=True)
+
+    # Assert compact rows carry the same fields without a per-row __dict__
+    assert [row.id for row in rows] == [user.id for user in users]
+    assert [row.created_at for row in rows] == [user.created_at for user in users]
+    assert not hasattr(rows[0], "__dict__")
+
+
+async def test_where_lazy(user_repo):
+    users: List[User] = await user_repo.where()
+    lazy_users = await user_repo.where(lazy=True)
+
+    # Assert lazy results hold the same entities
+    assert len(lazy_users) == len(users)
+    assert lazy_users[-1] == users[-1]
+    assert lazy_users == users
+
+
+async def test_where_lazy_custom_to_entity(user_repo):
+    class RenamingAdapter(UserRepoAdapter):
+        async def to_entity(self, data):
+            return User(**{**data, "username": data["username"].upper()})
+
+    # Assert an adapter overriding to_entity is not bypassed by lazy results
+    user_repo.adapter = RenamingAdapter()
+    lazy_users = await user_repo.where(lazy=True)
+    assert lazy_users == await user_repo.where()
+    assert "BRIAN" in [user.username for user in lazy_users]
+
+
+async def test_where_composite(user_repo):
+    # Get users matching either of two conditions in one query
+    results: List[User] = await user_repo.where(
+        [
+            Or(
+                Filter("username", EQ, "brian"),
+                Filter("is_enabled", EQ, False),
+                Filter("username", IN, ["brian", "roman"]),
+            ),
+            Not(Filter("username", EQ, "roman")),
+        ]
+    )
+
+    # Assert the result is the union of the OR, minus the negated user
+    assert sorted(user.username for user in results) == ["brian", "han"]
+
+
+async def test_where_prefix(user_repo):
+    # Get users whose username starts with a prefix
+    results: List[User] = await user_repo.where([Filter("username", PREFIX, "dom")])
+    assert [user.username for user in results] == ["domtoretto"]
+
+    # Assert the prefix is case-sensitive and its wildcards are literal
+    assert await user_repo.where([Filter("username", PREFIX, "Dom")]) == []
+    assert await user_repo.where([Filter("username", PREFIX, "_")]) == []
+    assert await user_repo.where([Filter("username", PREFIX, "%")]) == []
+
+
+async def test_where_contains(user_repo):
+    # Get users whose username contains a substring, in any case
+    results: List[User] = await user_repo.where([Filter("username", CONTAINS, "RIA")])
+    assert [user.username for user in results] == ["brian"]
+
+    # Assert wildcards in the substring are literal
+    assert await user_repo.where([Filter("email", CONTAINS, "_")]) == []
+
+
+async def test_aggregate(user_repo):
+    # Count users and find the first and last usernames per enabled status
+    groups = await user_repo.aggregate(
+        group_by=["is_enabled"],
+        metrics=[Metric(COUNT), Metric(MIN, "username"), Metric(MAX, "username")],
+    )
+    assert groups == [
+        {"is_enabled": False, "count": 1, "min_username": "han", "max_username": "han"},
+        {
+            "is_enabled": True,
+            "count": 3,
+            "min_username": "brian",
+            "max_username": "roman",
+        },
+    ]
+
+    # Assert filters are applied before grouping, and no group_by is one group
+    groups = await user_repo.aggregate(
+        filters=[Filter("username", NE, "brian")], metrics=[Metric(COUNT)]
+    )
+    assert groups == [{"count": 3}]
+
+    # Assert the repo agrees with the in-memory default of IService
+    metrics = [Metric(COUNT), Metric(MAX, "created_at")]
+    assert await user_repo.aggregate(
+        group_by=["is_enabled"], metrics=metrics
+    ) == await IService.aggregate(user_repo, group_by=["is_enabled"], metrics=metrics)
+
+
+async def test_first(user_repo):
+    # Get baseline of all user
+    users: List[User] = await user_repo.where()
+
+    # Use convenience method to get first user
+    first_user: User = await user_repo.first()
+
+    # Compare first_where user with first where user
+    assert first_user == users[0]
+
+
+async def test_where_order_by(user_repo):
+    # Get users sorted by enabled status, then by username descending
+    results: List[User] = await user_repo.where(order_by=["is_enabled", "-username"])
+
+    # Assert the database sorted them
+    assert [user.username for user in results] == [
+        "han",
+        "roman",
+        "domtoretto",
+        "brian",
+    ]
+
+
+async def test_first_order_by(user_repo):
+    # Get the first enabled user by username, both ways
+    enabled = [Filter("is_enabled", EQ, True)]
+    first_user = await user_repo.first(filters=enabled, order_by=["username"])
+    last_user = await user_repo.first(filters=enabled, order_by=["-username"])
+
+    # Assert the order picked the user
+    assert first_user.username == "brian"
+    assert last_user.username == "roman"
+
+
+async def test_first_no_results(user_repo):
+    # Attempt to retrieve user by nonexistent ID
+    user: Optional[User] = await user_repo.first(filters=[Filter("id", EQ, "xxx")])
+
+    # Assert None was returned
+    assert user is None
+
+
+async def test_insert(user_repo):
+    # Get baseline
+    old_user_count = len(stub_users)
+
+    # Insert a user
+    new_user = User(username="test", email="test@test.com")
+    inserted_user = await user_repo.create(new_user)
+
+    # Assert that the user took the id we generated within the app
+    assert inserted_user.id == new_user.id
+
+    # Assert we have one more user in the repo
+    new_user_count = len(await user_repo.where())
+    assert new_user_count == old_user_count + 1
+
+
+async def test_create_duplicate_error(user_repo):
+    # Get baseline
+    old_user_count = len(await user_repo.where())
+
+    # Create a user
+    new_user = User(username="test", email="test@test.com")
+    await user_repo.create(new_user)
+
+    # Attempt to re-create the same user
+    with pytest.raises(DuplicateResourceError):
+        await user_repo.create(new_user)
+
+    # Check that only one user was created
+    new_user_count = len(await user_repo.where())
+    assert new_user_count == old_user_count + 1
+
+
+async def test_update(user_repo):
+    # Get an existing user
+    roman: User = await user_repo.first([Filter("username", EQ, "roman")])
+    roman.username = "bigassforehead"
+    # Update the user
+    await user_repo.update(roman)
+
+    # Check that the user has been updated
+    updated_roman: User = await user_repo.first([Filter("id", EQ, roman.id)])
+    assert updated_roman.username == "bigassforehead"
+
+
+async def test_delete(user_repo):
+    # Get baseline
+    old_users: List[User] = await user_repo.where()
+    old_user_count = len(await user_repo.where())
+
+    # Delete a user
+    first_old_user = old_users[0]
+    deleted_user = await user_repo.delete(id=first_old_user.id)
+
+    # Assert that delete returned the deleted user
+    assert deleted_user == first_old_user
+
+    # Assert the deleted user is not available from the repo
+    new_users: List[User] = await user_repo.where()
+    assert deleted_user not in new_users
+
+    # Assert we have one fewer user in the repo
+    new_user_count = len(new_users)
+    assert new_user_count == old_user_count - 1
+
+
+async def test_delete_not_found(user_repo):
+    # Attempt to delete user by nonexistent ID
+    with pytest.raises(ResourceNotFoundError):
+        _ = await user_repo.delete(id="xxx")
+
+
+async def test_create_many(user_repo):
+    # Get baseline
+    old_user_count = len(stub_users)
+
+    # Create a batch containing one duplicate of a stub user
+    new_users = [
+        User(username="test", email="test@test.com"),
+        User(username="brian", email="brian@test.com"),
+        User(username="test2", email="test2@test.com"),
+    ]
+    results = await user_repo.create_many(new_users)
+
+    # Assert the duplicate failed on its own without affecting the others
+    assert results[0].id == new_users[0].id
+    assert isinstance(results[1], DuplicateResourceError)
+    assert results[2].id == new_users[2].id
+
+    new_user_count = len(await user_repo.where())
+    assert new_user_count == old_user_count + 2
+
+
+async def test_create_many_atomic_duplicate_error(user_repo):
+    # Get baseline
+    old_user_count = len(stub_users)
+
+    # Attempt to create a batch containing one duplicate of a stub user
+    new_users = [
+        User(username="test", email="test@test.com"),
+        User(username="brian", email="brian@test.com"),
+    ]
+    with pytest.raises(DuplicateResourceError):
+        await user_repo.create_many(new_users, atomic=True)
+
+    # Check that none of the batch was created
+    new_user_count = len(await user_repo.where())
+    assert new_user_count == old_user_count
@@ -0,0 +1,24 @@
+from aiokea.repos.results import LazyEntities
+
+
+def test_lazy_entities():
+    built = []
+
+    def to_entity(row):
+        built.append(row)
+        return {"id": row}
+
+    entities = LazyEntities([1, 2, 3, 4], to_entity)
+
+    # Assert len() builds nothing and indexing builds only that entity, once
+    assert len(entities) == 4
+    assert entities[1] == {"id": 2}
+    assert entities[1] is entities[1]
+    assert built == [2]
+
+    # Assert slices share what was already built
+    assert list(entities[1:3]) == [{"id": 2}, {"id": 3}]
+    assert built == [2, 3]
+
+    assert entities == [{"id": 1}, {"id": 2}, {"id": 3}, {"id": 4}]
+    assert built == [2, 3, 1, 4]
@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+
+from aiopg.sa.engine import get_dialect
+
+from aiokea.filters import EQ, Filter
+from aiokea.repos.aiopg import AIOPGRepo
+from aiokea.repos.slow_queries import SlowQueryLog
+from tests.stubs.user.repo import USER
+from tests.stubs.user.repo_adapter import UserRepoAdapter
+
+
+def test_record():
+    slow_query_log = SlowQueryLog(threshold=0.5, max_queries=2)
+    engine = SimpleNamespace(dialect=get_dialect())
+    select = USER.select().where(USER.c.email == "brian@example.com")
+
+    # Assert fast statements are ignored
+    slow_query_log.record(engine, "where", "users", select, 0.1, 1)
+    assert not slow_query_log.queries
+
+    # Assert slow ones are kept with the shape of their parameters, not values
+    for duration in [0.5, 0.6, 0.7]:
+        slow_query_log.record(engine, "where", "users", select, duration, 1)
+    assert [query.duration for query in slow_query_log.queries] == [0.6, 0.7]
+    slow_query = slow_query_log.queries[0]
+    assert slow_query.operation == "where"
+    assert slow_query.parameters == {"email_1": "str"}
+    assert "brian@example.com" not in repr(slow_query)
+
+
+async def test_explain(aiopg_db, aiopg_engine):
+    # Record every statement and explain all of them
+    slow_query_log = SlowQueryLog(threshold=0, explain_rate=1)
+    user_repo = AIOPGRepo(
+        UserRepoAdapter(), aiopg_engine, USER, slow_query_log=slow_query_log
+    )
+    await user_repo.where([Filter("username", EQ, "brian")])
+    await slow_query_log.wait_explained()
+
+    # Assert the plan was captured without the filter value
+    [slow_query] = slow_query_log.plans
+    assert slow_query.operation == "where"
+    assert slow_query.rows == 1
+    assert slow_query.plan[0]["Plan"]["Actual Rows"] == 1
+    assert "brian" not in repr(slow_query.plan)
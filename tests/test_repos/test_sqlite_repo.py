@@ -0,0 +1,10 @@
+import pytest
+
+from aiokea.errors import UnsupportedFilterError
+from aiokea.filters import Filter, SEARCH
+
+
+async def test_where_search_sqlite(sqlite_db, sqlite_user_repo):
+    # Assert full-text search is refused on SQLite
+    with pytest.raises(UnsupportedFilterError):
+        await sqlite_user_repo.where([Filter("username", SEARCH, "han")])